@@ -0,0 +1,96 @@
+"""
+Benchmark for invoice generation.
+
+Times generate_payments_invoice at several subscription counts so the cost of
+invoice, line item and payment generation can be compared between changes.
+
+Usage:
+    python -m benchmarks.bench_invoices
+    python -m benchmarks.bench_invoices --sizes 1000 10000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from extract.config import START_DATE, END_DATE, SEED
+from extract.data_generation import generate_plans, generate_discounts, generate_payments_invoice
+
+SIZES = [1_000, 10_000, 100_000]
+
+def make_subscriptions(n, plans, discounts, seed = SEED):
+    """
+    Build n synthetic subscriptions and their subscription discounts directly
+    with NumPy, so benchmark setup stays cheap at large sizes.
+    """
+    rng = np.random.default_rng(seed)
+    window = (END_DATE - START_DATE).days
+
+    start = np.datetime64(START_DATE, "D") + rng.integers(0, window + 1, n).astype("timedelta64[D]")
+    end = start + rng.integers(60, 721, n).astype("timedelta64[D]")
+    end = np.minimum(end, np.datetime64(END_DATE, "D"))
+    active = rng.random(n) < 0.5
+    end[active] = np.datetime64("NaT")
+
+    subscriptions = pd.DataFrame({
+        "subscription_id": np.arange(1, n + 1),
+        "customer_id": np.arange(1, n + 1),
+        "plan_id": rng.choice(plans.plan_id.to_numpy(), n),
+        "start_date": start.astype(object),
+        "end_date": end.astype(object),
+        "status": np.where(active, "active", "cancelled"),
+        "cancel_date": end.astype(object),
+    })
+
+    paid = subscriptions.plan_id.isin(plans.loc[plans.plan_price > 0, "plan_id"])
+    picked = subscriptions[paid & (rng.random(n) < 0.5)]
+    subscription_discounts = pd.DataFrame({
+        "sub_discount_id": np.arange(1, len(picked) + 1),
+        "subscription_id": picked.subscription_id.to_numpy(),
+        "discount_id": rng.choice(discounts.discount_id.to_numpy(), len(picked)),
+        "applied_date": picked.start_date.to_numpy(),
+        "expiry_date": picked.end_date.to_numpy(),
+    })
+    return subscriptions, subscription_discounts
+
+def bench_invoices(n, repeat = 1):
+    """
+    Time generate_payments_invoice for n subscriptions.
+
+    Returns:
+        dict: size, rows produced and best wall time in seconds.
+    """
+    plans = generate_plans()
+    discounts = generate_discounts()
+    subscriptions, subscription_discounts = make_subscriptions(n, plans, discounts)
+
+    best = float("inf")
+    for _ in range(repeat):
+        rng = np.random.default_rng(SEED)
+        start_time = time.perf_counter()
+        invoices, line_items, payments = generate_payments_invoice(subscriptions, plans, discounts, subscription_discounts, rng = rng)
+        best = min(best, time.perf_counter() - start_time)
+
+    return {
+        "subscriptions": n,
+        "invoices": len(invoices),
+        "line_items": len(line_items),
+        "payments": len(payments),
+        "seconds": best,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark invoice generation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Subscription counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per size (best time is reported)")
+    args = parser.parse_args()
+
+    print(f"{'subscriptions':>14} {'invoices':>10} {'line_items':>11} {'payments':>10} {'seconds':>9} {'invoices/s':>11}")
+    for n in args.sizes:
+        r = bench_invoices(n, args.repeat)
+        print(
+            f"{r['subscriptions']:>14,} {r['invoices']:>10,} {r['line_items']:>11,} {r['payments']:>10,} "
+            f"{r['seconds']:>9.2f} {r['invoices'] / r['seconds']:>11,.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Benchmark suite for every generation stage and the load step.
+
+Runs the pipeline (and the Committed MRR engine) at several customer counts and records, per stage, the
+best wall time, the rows produced and the peak memory allocated (measured
+with tracemalloc in a separate run, so tracing does not skew the timings).
+The load step stages the generated tables as Parquet and loads them into
+load.fake_bigquery.FakeClient, so no credentials or network are needed.
+
+Results are written as JSON. Given a baseline results file, the run fails
+(exit status 1) when a stage is slower or uses more memory than the baseline
+by more than the threshold.
+
+Usage:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --sizes 1000 10000 100000 1000000 --output results.json
+    python -m benchmarks.bench_pipeline --baseline benchmarks/results/baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+from extract.config import SEED, N_LOAD_WORKERS
+from extract.validation import validate_tables
+from extract.data_generation import (
+    generate_customers,
+    generate_plans,
+    generate_discounts,
+    generate_subscriptions,
+    generate_subscription_discounts,
+    generate_payments_invoice,
+)
+from load.fake_bigquery import FakeClient
+from load.load_to_bq import load_staged_to_biquery
+from load.orchestrator import load_tables
+from load.staging import write_staged
+from transform.mrr import compute_mrr
+
+SIZES = [1_000, 10_000]
+STAGES = ["customers", "subscriptions", "subscription_discounts", "payments_invoice", "mrr", "validate", "stage", "load"]
+RESULTS_DIR = os.path.join("benchmarks", "results")
+
+def measure(fn, trace_memory = False):
+    """
+    Run fn once, timing it and optionally tracing its peak memory allocation.
+
+    Returns:
+        (result, seconds, peak_mb): peak_mb is None unless trace_memory is set.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    try:
+        result = fn()
+        seconds = time.perf_counter() - start_time
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6 if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, seconds, peak_mb
+
+def run_pipeline(n, seed = SEED, trace_memory = False) -> dict:
+    """
+    Run every stage once for n customers.
+
+    Returns:
+        dict: Per stage, the rows produced, wall time in seconds and peak memory in MB.
+    """
+    rng = np.random.default_rng(seed)
+    plans = generate_plans()
+    discounts = generate_discounts()
+    stats = {}
+
+    def run(stage, fn, rows):
+        result, seconds, peak_mb = measure(fn, trace_memory)
+        stats[stage] = {"rows": rows(result), "seconds": seconds, "peak_mb": peak_mb}
+        return result
+
+    customers = run("customers", lambda: generate_customers(n, start_id = 1, rng = rng), len)
+    subscriptions = run("subscriptions", lambda: generate_subscriptions(customers, plans, start_id = 1, rng = rng), len)
+    subscription_discounts = run(
+        "subscription_discounts",
+        lambda: generate_subscription_discounts(subscriptions, plans, discounts, start_id = 1, rng = rng),
+        len,
+    )
+    invoices, line_items, payments = run(
+        "payments_invoice",
+        lambda: generate_payments_invoice(
+            subscriptions, plans, discounts, subscription_discounts,
+            start_invoice_id = 1, start_pay_id = 1, start_line_id = 1, rng = rng,
+        ),
+        lambda frames: sum(len(df) for df in frames),
+    )
+    run(
+        "mrr",
+        lambda: compute_mrr(subscriptions, plans, subscription_discounts, discounts, invoices),
+        lambda _: len(subscriptions),
+    )
+
+    frames = {
+        "customers": customers,
+        "subscriptions": subscriptions,
+        "subscription_discounts": subscription_discounts,
+        "invoices": invoices,
+        "line_items": line_items,
+        "payments": payments,
+    }
+    total_rows = sum(len(df) for df in frames.values())
+    run("validate", lambda: validate_tables(frames, reference = {"plans": plans, "discounts": discounts}), lambda _: total_rows)
+    with tempfile.TemporaryDirectory() as staging_dir:
+        staged = run(
+            "stage",
+            lambda: {name: [write_staged(df, name, "bench", staging_dir = staging_dir)] for name, df in frames.items()},
+            lambda _: total_rows,
+        )
+        run(
+            "load",
+            lambda: load_tables(staged, client = FakeClient(), max_workers = N_LOAD_WORKERS, load_fn = load_staged_to_biquery),
+            lambda results: sum(r["rows"] for r in results.values()),
+        )
+    return stats
+
+def bench(sizes, repeat = 1, trace_memory = True, seed = SEED) -> list:
+    """
+    Benchmark every stage at each customer count.
+
+    Returns:
+        list: One record per (customers, stage) with rows, seconds (best of
+              repeat), rows_per_sec and peak_mb.
+    """
+    records = []
+    for n in sizes:
+        runs = [run_pipeline(n, seed) for _ in range(repeat)]
+        memory = run_pipeline(n, seed, trace_memory = True) if trace_memory else None
+        for stage in STAGES:
+            seconds = min(r[stage]["seconds"] for r in runs)
+            rows = runs[0][stage]["rows"]
+            records.append({
+                "customers": n,
+                "stage": stage,
+                "rows": rows,
+                "seconds": round(seconds, 4),
+                "rows_per_sec": round(rows / seconds) if seconds > 0 else None,
+                "peak_mb": round(memory[stage]["peak_mb"], 2) if memory else None,
+            })
+    return records
+
+def find_regressions(records, baseline, threshold = 0.25, min_seconds = 0.05, min_mb = 1.0) -> list:
+    """
+    Compare records with a baseline run.
+
+    A stage regresses when its time or peak memory exceeds the baseline by more
+    than threshold (a fraction) and by more than min_seconds / min_mb, so
+    noise on very fast stages is not reported.
+
+    Returns:
+        list: A message per regression.
+    """
+    base = {(r["customers"], r["stage"]): r for r in baseline}
+    regressions = []
+    for r in records:
+        b = base.get((r["customers"], r["stage"]))
+        if b is None:
+            continue
+        checks = [("seconds", min_seconds, "s"), ("peak_mb", min_mb, " MB")]
+        for key, slack, unit in checks:
+            if r.get(key) is None or b.get(key) is None:
+                continue
+            if r[key] > b[key] * (1 + threshold) and r[key] - b[key] > slack:
+                regressions.append(
+                    f"{r['stage']} at {r['customers']:,} customers: {key} {b[key]:.3f}{unit} -> {r[key]:.3f}{unit} "
+                    f"(+{100 * (r[key] / b[key] - 1):.0f}%)"
+                )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Customer counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per size (best time is reported)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown / memory growth over the baseline, as a fraction")
+    args = parser.parse_args()
+
+    records = bench(args.sizes, args.repeat, not args.no_memory)
+
+    print(f"{'customers':>10} {'stage':>23} {'rows':>10} {'seconds':>9} {'rows/s':>11} {'peak MB':>9}")
+    for r in records:
+        peak = f"{r['peak_mb']:>9.1f}" if r["peak_mb"] is not None else f"{'-':>9}"
+        rate = f"{r['rows_per_sec']:>11,}" if r["rows_per_sec"] is not None else f"{'-':>11}"
+        print(f"{r['customers']:>10,} {r['stage']:>23} {r['rows']:>10,} {r['seconds']:>9.3f} {rate} {peak}")
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%dT%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "results": records,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(records, baseline, args.threshold)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.baseline} (threshold {args.threshold:.0%})")
+
+if __name__ == "__main__":
+    main()
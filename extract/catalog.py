@@ -0,0 +1,143 @@
+"""
+Plan and discount catalog compiled into dense NumPy lookup arrays.
+
+Every attribute array is indexed by id (plan_price[plan_id],
+discount_value[discount_id], ...), so the generators resolve plan and
+discount attributes for whole columns of ids with one array index instead
+of a pandas merge or a per-row filter. Ids up to the largest compiled id
+that are missing from the tables map to NaN / -1 / False; larger ids raise
+IndexError like any out-of-range index.
+"""
+import hashlib
+import weakref
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from extract.config import PLANS, DISCOUNTS, MONTHLY_CYCLE_DAYS, YEARLY_CYCLE_DAYS
+
+Catalog = namedtuple("Catalog", [
+    # Plans, in the row order of the plans table
+    "plan_ids",
+    # Indexed by plan_id
+    "plan_row", "plan_product", "plan_name", "plan_price", "plan_is_yearly", "plan_cycle_days", "plan_rank",
+    # Upgrade / downgrade ladder over plan rows (see build_plan_ladder)
+    "ladder", "ladder_size", "product_idx", "rank",
+    # Discounts, in the row order of the discounts table
+    "discount_ids",
+    # Indexed by discount_id
+    "discount_code", "discount_is_percent", "discount_value", "discount_is_recurring",
+])
+
+# Compiled catalogs keyed by the fingerprints of their tables (None for the
+# config defaults), so every generator and chunk shares one per table content
+_catalogs = {}
+# Catalogs of the table objects last seen, keyed by id, checked with weak references
+_catalogs_by_table = {}
+MAX_CACHED_CATALOGS = 32
+
+def build_plan_ladder(plans):
+    """
+    Precompute the price-ordered plan table used for upgrades and downgrades.
+
+    Plans of each product are sorted by price, so a plan's upgrade candidates
+    are every plan ranked above it and its downgrade candidates every plan
+    ranked below it within the same product.
+
+    Args:
+        plans (pd.DataFrame): Plans dataset
+
+    Returns:
+        (ladder, ladder_size, product_idx, rank):
+            ladder[p, r] is the plans row index of the r-th cheapest plan of product p,
+            ladder_size[p] is the number of plans of product p,
+            product_idx[i] and rank[i] locate plans row i in the ladder.
+    """
+    product_ids, product_idx = np.unique(plans.product_id.to_numpy(), return_inverse=True)
+    order = np.lexsort((plans.plan_price.to_numpy(), product_idx))
+
+    ladder_size = np.bincount(product_idx, minlength=len(product_ids))
+    first = np.cumsum(ladder_size) - ladder_size
+    rank = np.empty(len(plans), dtype=np.int64)
+    rank[order] = np.arange(len(plans)) - first[product_idx[order]]
+
+    ladder = np.full((len(product_ids), ladder_size.max(initial=0)), -1, dtype=np.int64)
+    ladder[product_idx, rank] = np.arange(len(plans))
+    return ladder, ladder_size, product_idx, rank
+
+def _dense(ids, values, fill, dtype = None) -> np.ndarray:
+    """
+    Array of length max(ids) + 1 holding values at the ids and fill elsewhere.
+    """
+    values = np.asarray(values, dtype=dtype)
+    out = np.full(int(ids.max(initial=0)) + 1, fill, dtype=values.dtype if dtype is None else dtype)
+    out[ids] = values
+    return out
+
+def compile_catalog(plans = None, discounts = None) -> Catalog:
+    """
+    Compile the plans and discounts tables (default: config.PLANS and
+    config.DISCOUNTS) into a Catalog.
+    """
+    plans = pd.DataFrame(PLANS) if plans is None else plans
+    discounts = pd.DataFrame(DISCOUNTS) if discounts is None else discounts.drop_duplicates("discount_id")
+
+    plan_ids = plans.plan_id.to_numpy(dtype=np.int64)
+    is_yearly = plans.recurring.astype(str).to_numpy() == "yearly"
+    ladder, ladder_size, product_idx, rank = build_plan_ladder(plans)
+
+    discount_ids = discounts.discount_id.to_numpy(dtype=np.int64)
+    return Catalog(
+        plan_ids = plan_ids,
+        plan_row = _dense(plan_ids, np.arange(len(plan_ids)), -1),
+        plan_product = _dense(plan_ids, plans.product_id.to_numpy(dtype=np.int64), -1),
+        plan_name = _dense(plan_ids, plans.plan_name.astype(str).to_numpy(), None, dtype=object),
+        plan_price = _dense(plan_ids, plans.plan_price.to_numpy(dtype=float), np.nan),
+        plan_is_yearly = _dense(plan_ids, is_yearly, False),
+        plan_cycle_days = _dense(plan_ids, np.where(is_yearly, YEARLY_CYCLE_DAYS, MONTHLY_CYCLE_DAYS), -1),
+        plan_rank = _dense(plan_ids, rank, -1),
+        ladder = ladder,
+        ladder_size = ladder_size,
+        product_idx = product_idx,
+        rank = rank,
+        discount_ids = discount_ids,
+        discount_code = _dense(discount_ids, discounts.discount_code.astype(str).to_numpy(), None, dtype=object),
+        discount_is_percent = _dense(discount_ids, discounts.discount_type.astype(str).to_numpy() == "percent", False),
+        discount_value = _dense(discount_ids, discounts.discount_value.to_numpy(dtype=float), np.nan),
+        discount_is_recurring = _dense(discount_ids, discounts.is_recurring.fillna(False).to_numpy(dtype=bool), False),
+    )
+
+def _fingerprint(df):
+    """
+    Content hash of a table, or None for the config default.
+    """
+    if df is None:
+        return None
+    digest = hashlib.sha1(",".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def get_catalog(plans = None, discounts = None) -> Catalog:
+    """
+    Catalog of the given tables (default: config), compiled once per table
+    content and shared by every later call.
+
+    The same table objects are found by identity; other objects (copies
+    unpickled in worker processes, tables generated again) by content hash.
+    Tables are treated as read-only once a catalog was compiled from them.
+    """
+    tables = (plans, discounts)
+    identity = tuple(id(df) for df in tables)
+    cached = _catalogs_by_table.get(identity)
+    if cached is not None and all(ref is None or ref() is df for ref, df in zip(cached[0], tables)):
+        return cached[1]
+
+    key = (_fingerprint(plans), _fingerprint(discounts))
+    catalog = _catalogs.get(key)
+    if catalog is None:
+        if len(_catalogs) >= MAX_CACHED_CATALOGS:
+            _catalogs.clear()
+        catalog = _catalogs[key] = compile_catalog(plans, discounts)
+    if len(_catalogs_by_table) >= MAX_CACHED_CATALOGS:
+        _catalogs_by_table.clear()
+    _catalogs_by_table[identity] = (tuple(None if df is None else weakref.ref(df) for df in tables), catalog)
+    return catalog
@@ -10,15 +10,77 @@ END_DATE = datetime.today().date()
 N_CUSTOMERS = 10
 N_PLANS = 9 
 
+# CUSTOMERS GENERATED PER CHUNK IN STREAMING MODE
+# Each chunk is also the unit of parallel work (a shard) with its own seed
+CHUNK_SIZE = 10_000
+
+# RUN METRICS (JSON summary per run) AND cProfile OUTPUT (see log/metrics.py)
+METRICS_DIR = "metrics"
+PROFILE_DIR = "profiles"
+
+# NEW CUSTOMERS PER DAY IN INCREMENTAL (DAILY) MODE
+DAILY_SIGNUPS = 5
+
+# WORKER PROCESSES FOR PARALLEL GENERATION
+N_WORKERS = 1
+
+# CONCURRENT BIGQUERY LOAD JOBS
+N_LOAD_WORKERS = 4
+
+# LARGEST LOAD JOB: bigger tables or staged files are split into several load jobs
+LOAD_BATCH_BYTES = 256 * 1024 ** 2
+
+# SCALE PROFILES (see extract/profiles.py), selected with --profile on the command line
+# customers: customers to generate, stream: generate and load in chunks of chunk_size
+# customers with `workers` processes, target: "bigquery" or "duckdb" to load the
+# tables, "parquet" to only stage them (load later with --load-staged RUN_ID).
+# The default profile generates N_CUSTOMERS customers.
+PROFILES = {
+    "small":  {"customers": N_CUSTOMERS, "chunk_size": CHUNK_SIZE, "workers": 1, "stream": False, "target": "bigquery"},
+    "medium": {"customers": 10_000,      "chunk_size": CHUNK_SIZE, "workers": 2, "stream": True,  "target": "bigquery"},
+    "100k":   {"customers": 100_000,     "chunk_size": 20_000,     "workers": 4, "stream": True,  "target": "bigquery"},
+    "1M":     {"customers": 1_000_000,   "chunk_size": 50_000,     "workers": 8, "stream": True,  "target": "bigquery"},
+}
+DEFAULT_PROFILE = "small"
+# Environment variables overriding profile settings, e.g. DATAFLOWIQ_CUSTOMERS=50000
+PROFILE_ENV_PREFIX = "DATAFLOWIQ_"
+
 # RANDOM SEED
 SEED = 44
 
 # EMAIL DOMAIN
 DOMAIN = "srcanalytics.com"  
 
+# LOCAL PIPELINE STATE (id watermarks, fingerprints, ...)
+STATE_DIR = "state"
+
+# COMMITTED MRR ENGINE (see transform/mrr.py): customers per subscription chunk
+# and invoice rows per chunk, bounding memory on large histories
+MRR_CHUNK_CUSTOMERS = 100_000
+MRR_CHUNK_ROWS = 5_000_000
+
+# LOCAL DUCKDB WAREHOUSE (the "duckdb" target, see load/duckdb_sink.py)
+DUCKDB_PATH = "warehouse/dataflowiq.duckdb"
+
+# PARQUET STAGING AREA FOR GENERATED TABLES
+STAGING_DIR = "staging"
+STAGE_COMPRESSION = "zstd"
+
+# FAKER NAME / ADDRESS POOL SIZE AND CACHE LOCATION
+NAME_POOL_SIZE = 10_000
+CACHE_DIR = ".cache"
+
 # UPGRADE PROBABILITY
 UPGRADE_PROBABILITY = 0.40 
 
+# PAYMENT SIMULATION (see simulate_payments in extract/data_generation.py)
+# Outcome probabilities of every payment attempt; failed and pending attempts are
+# retried up to MAX_PAYMENT_RETRIES times, each after RETRY_DELAY_DAYS (inclusive range)
+PAYMENT_STATUS_PROBABILITIES = {"success": 0.7, "failed": 0.2, "pending": 0.1}
+MAX_PAYMENT_RETRIES = 2
+RETRY_DELAY_DAYS = (2, 7)
+PAYMENT_METHODS = ["Debit", "Credit", "Paypal"]
+
 # SUBSCRIPTION DISCOUNT START ID
 SUB_DISCOUNT_ID = 401
 
@@ -26,6 +88,10 @@ SUB_DISCOUNT_ID = 401
 MONTHLY_CYCLE_DAYS = 30
 YEARLY_CYCLE_DAYS = 365
 
+# BILLING CALENDAR (see extract/schedule.py): "fixed" bills every MONTHLY_CYCLE_DAYS /
+# YEARLY_CYCLE_DAYS days, "calendar" on the start date's day of every month / year
+BILLING_CALENDAR = "fixed"
+
 # STATIC TABLE  
 STATIC_TABLES = {"plans", "products", "discounts"} 
 
@@ -78,3 +144,36 @@ UNIQUE_KEYS = {
     "discounts": "discount_id",
     "subscription_discounts": "sub_discount_id",
 }
+
+# FOREIGN KEYS (column -> referenced table)
+FOREIGN_KEYS = {
+    "plans": {"product_id": "products"},
+    "subscriptions": {"customer_id": "customers", "plan_id": "plans"},
+    "subscription_discounts": {"subscription_id": "subscriptions", "discount_id": "discounts"},
+    "invoices": {"subscription_id": "subscriptions"},
+    "line_items": {"invoice_id": "invoices", "plan_id": "plans"},
+    "payments": {"invoice_id": "invoices"},
+}
+
+# LARGEST DIFFERENCE ALLOWED BETWEEN AN INVOICE TOTAL AND THE SUM OF ITS LINE ITEMS
+# (see extract/validation.py); amounts are stored as float32
+TOTAL_TOLERANCE = 0.01
+
+# DTYPE POLICY (see extract/dtypes.py)
+# Low-cardinality STRING columns stored as pandas categoricals. Listed values fix
+# the category order so chunks stay compatible; description categories are inferred.
+CATEGORIES = {
+    "payment_method": ["Credit", "Debit", "Paypal", "N/A"],
+    "recurring": ["monthly", "yearly"],
+    "status": ["active", "cancelled", "upgraded", "downgraded"],
+    "invoice_status": ["paid", "past_due"],
+    "payment_status": ["success", "failed", "pending"],
+    "line_type": ["charge", "discount"],
+    "discount_type": ["percent", "fixed"],
+    "plan_name": ["Free", "Pro", "Premium"],
+    "description": [],
+}
+
+# FLOAT columns are money amounts: held as float32 and rounded back to cents when staged
+AMOUNT_DTYPE = "float32"
+AMOUNT_DECIMALS = 2
@@ -1,47 +1,95 @@
-import re 
+import os
 import numpy as np 
 import pandas as pd 
-import random
-from datetime import timedelta
-from faker import Faker 
-from extract.config import START_DATE, END_DATE, N_CUSTOMERS, N_PLANS, SEED, DOMAIN, PRODUCTS, PLANS, UPGRADE_PROBABILITY, DISCOUNTS, SUB_DISCOUNT_ID, MONTHLY_CYCLE_DAYS, YEARLY_CYCLE_DAYS
+from importlib.metadata import version
+from extract.dtypes import apply_dtype_policy
+from extract.catalog import get_catalog
+from extract.schedule import cycle_dates, count_cycles
+from extract.config import START_DATE, END_DATE, N_CUSTOMERS, N_PLANS, SEED, DOMAIN, PRODUCTS, PLANS, UPGRADE_PROBABILITY, DISCOUNTS, SUB_DISCOUNT_ID, NAME_POOL_SIZE, CACHE_DIR
+from extract.config import PAYMENT_STATUS_PROBABILITIES, MAX_PAYMENT_RETRIES, RETRY_DELAY_DAYS, PAYMENT_METHODS
 
-fake = Faker()
+# Faker name/address pools already loaded in this process
+_name_pools = {}
 
-def generate_email(name: str, domain: str, existing: set) -> str:
+def get_rng(rng = None) -> np.random.Generator:
+    """
+    Return rng, or a fresh unseeded generator when no rng is given.
+    """
+    return rng if rng is not None else np.random.default_rng()
+
+def load_name_pools(size: int = NAME_POOL_SIZE, seed: int = SEED, cache_dir: str = CACHE_DIR):
+    """
+    Return pools of Faker first names, last names and addresses, building them only once.
+
+    Pools are generated with a Faker instance seeded from seed and cached on
+    disk (keyed by seed, pool size and Faker version), and kept in memory for
+    the rest of the process, so Faker only runs the first time a pool is needed.
 
+    Returns:
+        (first_names, last_names, addresses): NumPy string arrays of length size.
     """
-    Generate a unique email address from a person's name.
-    Ensure uniqueness by appending a counter if needed.
-    """ 
-    base = re.sub(r'[^a-z]','', name.lower())
-    email = f"{base}@{domain}"
-    counter = 1
+    key = (size, seed, cache_dir)
+    if key in _name_pools:
+        return _name_pools[key]
+
+    path = os.path.join(cache_dir, f"faker_name_pools_{version('faker')}_{seed}_{size}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            pools = cached["first_names"], cached["last_names"], cached["addresses"]
+    else:
+        # Faker is slow to import and only needed to build the pools
+        from faker import Faker
+        fake = Faker()
+        fake.seed_instance(seed)
+        pools = (
+            np.array([fake.first_name() for _ in range(size)]),
+            np.array([fake.last_name() for _ in range(size)]),
+            np.array([fake.address().replace("\n", ",") for _ in range(size)]),
+        )
+        # Write to a temporary file first so concurrent workers never read a partial cache
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(tmp_path, first_names=pools[0], last_names=pools[1], addresses=pools[2])
+        os.replace(tmp_path, path)
 
-    while email in existing:
-        email = f"{base}{counter}@{domain}"
-        counter += 1
+    _name_pools[key] = pools
+    return pools
 
-    existing.add(email)
-    return email 
+def generate_emails(names, customer_ids, domain: str) -> np.ndarray:
+    """
+    Generate email addresses from people's names and customer ids
+    (johnsmith1042@...). The id makes every address unique across chunks,
+    workers and runs, however often a name repeats; a per-name counter
+    (johnsmith@, johnsmith1@, ...) would need the counts of every earlier
+    chunk and run.
+    """
+    base = pd.Series(np.asarray(names, dtype=object)).str.lower().str.replace(r'[^a-z]', '', regex=True)
+    return (base + pd.Series(np.asarray(customer_ids)).astype(str) + "@" + domain).to_numpy()
 
-def generate_customers(n: int = N_CUSTOMERS, start_id: int = 1, domain: str = DOMAIN) -> pd.DataFrame:
+def generate_customers(n: int = N_CUSTOMERS, start_id: int = 1, domain: str = DOMAIN, rng: np.random.Generator = None) -> pd.DataFrame:
     """
     Generate a synthetic dataset of customer name, email, address, and payment method
 
+    Names and addresses are sampled from cached Faker pools (see load_name_pools).
+    First and last names are drawn independently, so names combine the
+    distinct first and last names (about 650k combinations) instead of
+    repeating a fixed pool of full names.
+
     Args:
         n(int): Number of customers to generate.
         domain(str): domain name for email address.
+        rng(np.random.Generator, optional): random generator.
     
     Returns:
         pd.DataFrame: DataFrame with customer information.
     """
-    seen_emails = set()
+    rng = get_rng(rng)
+    first_names, last_names, address_pool = load_name_pools()
 
-    names = [fake.name() for _ in range(n)]
-    emails = [generate_email(name, domain, seen_emails) for name in names]
-    addresses = [fake.address().replace("\n", ",") for _ in range(n)]
-    payment_methods = np.random.choice(
+    names = np.strings.add(np.strings.add(first_names[rng.integers(0, len(first_names), n)], " "), last_names[rng.integers(0, len(last_names), n)])
+    emails = generate_emails(names, np.arange(start_id, start_id + n), domain)
+    addresses = address_pool[rng.integers(0, len(address_pool), n)]
+    payment_methods = rng.choice(
         ["Credit", "Debit", "Paypal"], size = n, p = [0.5, 0.3, 0.2]
         )
     customers = pd.DataFrame({
@@ -53,7 +101,7 @@ def generate_customers(n: int = N_CUSTOMERS, start_id: int = 1, domain: str = DO
     }
     )
 
-    return customers
+    return apply_dtype_policy(customers, "customers")
 
 def generate_products(products: list = None) -> pd.DataFrame:
     """
@@ -70,7 +118,7 @@ def generate_products(products: list = None) -> pd.DataFrame:
     if products is None:
         products = PRODUCTS
 
-    return pd.DataFrame(products)
+    return apply_dtype_policy(pd.DataFrame(products), "products")
 
 def generate_plans() -> pd.DataFrame:
 
@@ -84,130 +132,119 @@ def generate_plans() -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame with plan information.
     """
-    return pd.DataFrame(PLANS)
+    return apply_dtype_policy(pd.DataFrame(PLANS), "plans")
 
-def generate_subscription_row(sub_id, customer_id, plan, start_date, status=None):
+def choose_new_plans(plan_idx, ladder, ladder_size, product_idx, rank, rng):
     """
-    Generate a single subscription record.
-    """
-    if status is None:
-        status = random.choice(["active", "cancelled"])
-    
-    end_date = None if status == "active" else start_date + timedelta(days=random.randint(60, 720))
-    if end_date and end_date > END_DATE:
-        end_date = END_DATE
-    
-    cancel_date = end_date if status == "cancelled" else None
-    
-    return [
-        sub_id,
-        customer_id,
-        plan.plan_id,
-        start_date,
-        end_date,
-        status,
-        cancel_date,
-    ]
-
-def choose_new_plan(current_plan, plans):
-    """
-    Given a current plan, decide whether to cancel, downgrade, or upgrade.
+    Decide for each changing subscription whether to cancel, downgrade, or upgrade.
     - Includes Pro -> Free downgrade scenario.
     - Chooses new plan only within the same product_id.
-    - Returns (new_plan, status).
+    - Returns (new_plan_idx, status) arrays, with -1 where no new plan is chosen.
     """
-
-    action = random.choices(
+    n = len(plan_idx)
+    action = rng.choice(
         ["upgrade", "downgrade", "churn"],
-        weights=[0.4, 0.4, 0.2],  # tweak probabilities as needed
-        k=1
-    )[0]
-
-    product_id = current_plan.product_id
-    current_price = current_plan.plan_price
-
-    if action == "churn":
-        return None, "cancelled"
-
-    if action == "upgrade":
-        # Upgrade to any higher-priced plan (e.g., Free -> Pro or Pro -> Premium)
-        higher_plans = plans[
-            (plans["product_id"] == product_id) &
-            (plans["plan_price"] > current_price)
-        ]
-        if not higher_plans.empty:
-            return higher_plans.sample(1).iloc[0], "upgraded"
-
-    if action == "downgrade":
-        # Downgrade to any lower-priced plan (e.g., Premium -> Pro or Pro -> Free)
-        lower_plans = plans[
-            (plans["product_id"] == product_id) &
-            (plans["plan_price"] < current_price)
-        ]
-        if not lower_plans.empty:
-            return lower_plans.sample(1).iloc[0], "downgraded"
+        size = n,
+        p = [0.4, 0.4, 0.2],  # tweak probabilities as needed
+    )
 
-    # Fallback if no valid change found → treat as churn
-    return None, "cancelled"
+    product = product_idx[plan_idx]
+    current = rank[plan_idx]
+    n_higher = ladder_size[product] - current - 1
+    u = rng.random(n)
+
+    # Upgrade to any higher-priced plan (e.g., Free -> Pro or Pro -> Premium)
+    upgrade = (action == "upgrade") & (n_higher > 0)
+    # Downgrade to any lower-priced plan (e.g., Premium -> Pro or Pro -> Free)
+    downgrade = (action == "downgrade") & (current > 0)
+
+    new_rank = np.where(
+        upgrade,
+        current + 1 + (u * n_higher).astype(np.int64),
+        (u * current).astype(np.int64),
+    )
+    new_plan_idx = np.where(upgrade | downgrade, ladder[product, new_rank], -1)
 
+    # Fallback if no valid change found → treat as churn
+    status = np.where(upgrade, "upgraded", np.where(downgrade, "downgraded", "cancelled"))
+    return new_plan_idx, status
 
-def generate_subscriptions(customers, plans, start_id=100):
+def generate_subscriptions(customers, plans, start_id=100, rng=None, start_window=None, horizon=END_DATE):
     """
     Generate subscription records with realistic lifecycle events.
     Supports:
     - Upgrade (Free -> Pro, Pro -> Premium)
     - Downgrade (Premium -> Pro, Pro -> Free)
     - Cancellation (no new plan)
-    """
 
-    subscriptions = []
-    sub_id = start_id
-
-    for _, c in customers.iterrows():
-        # Initial plan assigned randomly
-        plan = plans.sample(1).iloc[0]
-        start_date = START_DATE + timedelta(days=random.randint(0, (END_DATE - START_DATE).days))
-        row = generate_subscription_row(sub_id, c.customer_id, plan, start_date)
-        subscriptions.append(row)
-        sub_id += 1
-
-        # Simulate plan change for some users
-        if random.random() < UPGRADE_PROBABILITY:
-            switch_date = start_date + timedelta(days=random.randint(60, 720))
-            if switch_date > END_DATE:
-                switch_date = END_DATE
-
-            new_plan, status = choose_new_plan(plan, plans)
-
-            # Update current subscription with the reason for change
-            subscriptions[-1][4] = switch_date   # end_date
-            subscriptions[-1][5] = status        # upgraded / downgraded / cancelled
-            subscriptions[-1][6] = switch_date   # cancel_date (end date)
-
-            # If customer switches plan (not churn), add new subscription
-            if new_plan is not None:
-                new_row = generate_subscription_row(
-                    sub_id,
-                    c.customer_id,
-                    new_plan,
-                    switch_date,
-                    status="active"
-                )
-                subscriptions.append(new_row)
-                sub_id += 1
-
-    return pd.DataFrame(
-        subscriptions,
-        columns=[
-            "subscription_id",
-            "customer_id",
-            "plan_id",
-            "start_date",
-            "end_date",
-            "status",
-            "cancel_date",
-        ],
-    )
+    The whole customer batch is simulated at once with NumPy arrays.
+
+    Start dates are drawn from start_window (default START_DATE..END_DATE) and
+    end / switch dates are capped at horizon; with horizon=None the scheduled
+    future of each subscription is kept as is.
+    """
+    rng = get_rng(rng)
+    n = len(customers)
+    catalog = get_catalog(plans)
+    ladder, ladder_size, product_idx, rank = catalog.ladder, catalog.ladder_size, catalog.product_idx, catalog.rank
+    first_start, last_start = start_window or (START_DATE, END_DATE)
+    end_of_window = np.datetime64(horizon if horizon is not None else "9999-12-31", "D")
+    window_days = (last_start - first_start).days
+
+    # Initial plan assigned randomly
+    plan_idx = rng.integers(0, len(plans), n)
+    start_date = np.datetime64(first_start, "D") + rng.integers(0, window_days + 1, n).astype("timedelta64[D]")
+    status = rng.choice(["active", "cancelled"], size = n).astype(object)
+    end_date = start_date + rng.integers(60, 721, n).astype("timedelta64[D]")
+    end_date = np.where(status == "active", np.datetime64("NaT"), np.minimum(end_date, end_of_window))
+
+    # Simulate plan change for some users
+    changed = rng.random(n) < UPGRADE_PROBABILITY
+    switch_date = np.minimum(start_date + rng.integers(60, 721, n).astype("timedelta64[D]"), end_of_window)
+    new_plan_idx = np.full(n, -1, dtype=np.int64)
+    new_plan_idx[changed], status[changed] = choose_new_plans(plan_idx[changed], ladder, ladder_size, product_idx, rank, rng)
+
+    # Update current subscription with the reason for change
+    end_date = np.where(changed, switch_date, end_date)
+    cancel_date = np.where(status == "active", np.datetime64("NaT"), end_date)
+
+    # If customer switches plan (not churn), the new subscription follows the old one
+    switched = new_plan_idx >= 0
+    n_rows = 1 + switched
+    first_row = np.cumsum(n_rows) - n_rows
+    total = int(n_rows.sum())
+
+    plan_ids = catalog.plan_ids
+    customer_ids = customers.customer_id.to_numpy()
+    nat = np.datetime64("NaT", "D")
+
+    out_customer = np.repeat(customer_ids, n_rows)
+    out_plan = np.empty(total, dtype=plan_ids.dtype)
+    out_start = np.empty(total, dtype="datetime64[D]")
+    out_end = np.full(total, nat)
+    out_status = np.full(total, "active", dtype=object)
+    out_cancel = np.full(total, nat)
+
+    out_plan[first_row] = plan_ids[plan_idx]
+    out_start[first_row] = start_date
+    out_end[first_row] = end_date
+    out_status[first_row] = status
+    out_cancel[first_row] = cancel_date
+
+    second_row = first_row[switched] + 1
+    out_plan[second_row] = plan_ids[new_plan_idx[switched]]
+    out_start[second_row] = switch_date[switched]
+
+    subscriptions = pd.DataFrame({
+        "subscription_id": start_id + np.arange(total),
+        "customer_id": out_customer,
+        "plan_id": out_plan,
+        "start_date": out_start,
+        "end_date": out_end,
+        "status": out_status,
+        "cancel_date": out_cancel,
+    })
+    return apply_dtype_policy(subscriptions, "subscriptions")
 
 
 def generate_discounts() -> pd.DataFrame:
@@ -225,9 +262,9 @@ def generate_discounts() -> pd.DataFrame:
     # Forcing data type
     discounts["valid_from"] = pd.to_datetime(discounts["valid_from"])
     discounts["valid_to"] = pd.to_datetime(discounts["valid_from"])
-    return discounts
+    return apply_dtype_policy(discounts, "discounts")
 
-def generate_subscription_discounts(subscriptions, plans, discounts, start_id = 3000):
+def generate_subscription_discounts(subscriptions, plans, discounts, start_id = 3000, rng = None):
     """
     Generate a mapping of subscriptions to applied discounts.
 
@@ -235,184 +272,314 @@ def generate_subscription_discounts(subscriptions, plans, discounts, start_id =
         subscriptions (pd.DataFrame): Subscriptions dataset
         plans (pd.DataFrame): Plans dataset
         discounts (pd.DataFrame): Discounts dataset
+        rng (np.random.Generator, optional): random generator
 
     Returns:
         pd.DataFrame: Subscription discounts dataset
     """
-    rows = []
-    sub_discount_id = start_id
-    
+    rng = get_rng(rng)
+    catalog = get_catalog(plans, discounts)
+
     # Randomly assign discounts to ~50% of subscriptions
-    for _, sub in subscriptions.sample(frac=0.5).iterrows():
-        # Fetch the plan
-        plan = plans[plans.plan_id == sub.plan_id].iloc[0]
-        
-        # Skip free plans (no discounts on already free tiers)
-        if plan.plan_price == 0:
-            continue
-        
-        # Otherwise assign a random discount
-        discount = discounts.sample(1).iloc[0]
-        
-        rows.append([
-            sub_discount_id,
-            sub.subscription_id,
-            discount.discount_id,
-            sub.start_date,
-            sub.end_date
-        ])
-        
-        sub_discount_id += 1
-    
-    return pd.DataFrame(
-        rows,
-        columns=[
-            "sub_discount_id",
-            "subscription_id",
-            "discount_id",
-            "applied_date",
-            "expiry_date",
-        ],
-    )
+    sampled = subscriptions.sample(frac=0.5, random_state=rng)
+
+    # Skip free plans (no discounts on already free tiers)
+    sampled = sampled[catalog.plan_price[sampled.plan_id.to_numpy(dtype=np.int64)] != 0]
+
+    # Otherwise assign a random discount
+    discount_ids = catalog.discount_ids[rng.integers(0, len(catalog.discount_ids), len(sampled))]
+
+    subscription_discounts = pd.DataFrame({
+        "sub_discount_id": start_id + np.arange(len(sampled)),
+        "subscription_id": sampled.subscription_id.to_numpy(),
+        "discount_id": discount_ids,
+        "applied_date": sampled.start_date.to_numpy(),
+        "expiry_date": sampled.end_date.to_numpy(),
+    })
+    return apply_dtype_policy(subscription_discounts, "subscription_discounts")
+
+def to_day_array(values) -> np.ndarray:
+    """
+    Convert a column of dates (date objects, timestamps or None) to a
+    NumPy datetime64[D] array, with None mapped to NaT.
+    """
+    return pd.to_datetime(pd.Series(values), errors="coerce").to_numpy(dtype="datetime64[D]")
+
+def expand_billing_cycles(subscriptions, plans) -> pd.DataFrame:
+    """
+    Expand every subscription into one row per billing cycle.
+
+    A subscription is billed on the cycle dates of the billing calendar (see
+    extract/schedule.py) from its start date until its end date (or END_DATE,
+    whichever comes first). Cycle dates are resolved for all invoices at once.
 
-def create_line_item(line_item_id, invoice_id, plan_id, description, amount, line_type):
+    Args:
+        subscriptions (pd.DataFrame): Subscriptions dataset
+        plans (pd.DataFrame): Plans dataset
+
+    Returns:
+        pd.DataFrame: One row per invoice with the subscription, plan and cycle number.
+    """
+    catalog = get_catalog(plans)
+    plan_id = subscriptions.plan_id.to_numpy(dtype=np.int64)
+
+    start = to_day_array(subscriptions.start_date)
+    end = to_day_array(subscriptions.end_date)
+    last = np.minimum(np.where(np.isnat(end), np.datetime64(END_DATE, "D"), end), np.datetime64(END_DATE, "D"))
+    yearly = catalog.plan_is_yearly[plan_id]
+
+    # Number of invoices per subscription (0 if it starts after the window)
+    n_cycles = count_cycles(start, last, yearly)
+
+    # Repeat each subscription once per cycle and number the cycles 0..n-1
+    rows = np.repeat(np.arange(len(subscriptions)), n_cycles)
+    first_row = np.cumsum(n_cycles) - n_cycles
+    cycle_number = np.arange(len(rows)) - np.repeat(first_row, n_cycles)
+
+    return pd.DataFrame({
+        "subscription_id": subscriptions.subscription_id.to_numpy()[rows],
+        "plan_id": plan_id[rows],
+        "plan_name": catalog.plan_name[plan_id[rows]],
+        "plan_price": catalog.plan_price[plan_id[rows]],
+        "cycle_number": cycle_number,
+        "invoice_date": cycle_dates(start[rows], cycle_number, yearly[rows]),
+    })
+
+def build_discount_index(subscription_discounts, discounts) -> pd.DataFrame:
+    """
+    Build the per-run discount lookup used when billing subscriptions.
+
+    Every subscription discount looks up its discount rule in the compiled
+    catalog (see extract/catalog.py), so the rule attributes (code, type,
+    value, recurrence) and the validity window
+    (applied_date to expiry_date, or END_DATE when open-ended) are resolved up
+    front. Rows are sorted by subscription_id so the discounts of any
+    subscription form one contiguous block that can be found with a binary search.
+
+    Args:
+        subscription_discounts (pd.DataFrame): Subscription discounts dataset
+        discounts (pd.DataFrame): Discounts dataset
+
+    Returns:
+        pd.DataFrame: One row per subscription discount, sorted by subscription_id.
+    """
+    catalog = get_catalog(discounts = discounts)
+    discount_id = subscription_discounts.discount_id.to_numpy(dtype=np.int64)
+    valid_to = to_day_array(subscription_discounts.expiry_date)
+
+    # Keep the subscription_discounts order so discount lines are emitted in the same order
+    index = pd.DataFrame({
+        "subscription_id": subscription_discounts.subscription_id.to_numpy(),
+        "sd_order": np.arange(len(subscription_discounts)),
+        "description": "Coupon " + catalog.discount_code[discount_id].astype(str),
+        "is_percent": catalog.discount_is_percent[discount_id],
+        "discount_value": catalog.discount_value[discount_id],
+        "is_recurring": catalog.discount_is_recurring[discount_id],
+        "valid_from": to_day_array(subscription_discounts.applied_date),
+        "valid_to": np.where(np.isnat(valid_to), np.datetime64(END_DATE, "D"), valid_to),
+    })
+
+    index = index.sort_values(["subscription_id", "sd_order"], kind="stable").reset_index(drop=True)
+    return index[["subscription_id", "sd_order", "description", "is_percent", "discount_value", "is_recurring", "valid_from", "valid_to"]]
+
+def apply_discounts(cycles, discount_index) -> pd.DataFrame:
+    """
+    Resolve the discount line items for every billing cycle at once.
+
+    A discount applies when the invoice date falls within the subscription
+    discount window, the plan is not free, and the discount is either
+    recurring or this is the first cycle.
+
+    Args:
+        cycles (pd.DataFrame): Output of expand_billing_cycles with an invoice_id column
+        discount_index (pd.DataFrame): Output of build_discount_index
+
+    Returns:
+        pd.DataFrame: invoice_id, sd_order, description and amount of each discount line.
     """
-    Helper to create a line item record.
+    paid = cycles[cycles.plan_price > 0]
+
+    # Locate each invoice's block of discount rules in the sorted index
+    keys = discount_index.subscription_id.to_numpy()
+    sub_ids = paid.subscription_id.to_numpy()
+    lo = np.searchsorted(keys, sub_ids, side="left")
+    hi = np.searchsorted(keys, sub_ids, side="right")
+    n_rules = hi - lo
+
+    # Pair every invoice with each of its subscription's rules
+    inv = np.repeat(np.arange(len(paid)), n_rules)
+    rule = np.arange(len(inv)) - np.repeat(np.cumsum(n_rules) - n_rules, n_rules) + np.repeat(lo, n_rules)
+
+    invoice_date = paid.invoice_date.to_numpy(dtype="datetime64[D]")[inv]
+    cycle_number = paid.cycle_number.to_numpy()[inv]
+    valid_from = discount_index.valid_from.to_numpy(dtype="datetime64[D]")[rule]
+    valid_to = discount_index.valid_to.to_numpy(dtype="datetime64[D]")[rule]
+    is_recurring = discount_index.is_recurring.to_numpy()[rule]
+
+    # Recurring or first cycle only
+    applies = (valid_from <= invoice_date) & (invoice_date <= valid_to) & (is_recurring | (cycle_number == 0))
+    inv, rule = inv[applies], rule[applies]
+
+    plan_price = paid.plan_price.to_numpy(dtype=float)[inv]
+    discount_value = discount_index.discount_value.to_numpy(dtype=float)[rule]
+    amount = np.where(
+        discount_index.is_percent.to_numpy()[rule],
+        -plan_price * (discount_value / 100),
+        -discount_value,
+    )
+    return pd.DataFrame({
+        "invoice_id": paid.invoice_id.to_numpy()[inv],
+        "sd_order": discount_index.sd_order.to_numpy()[rule],
+        "description": discount_index.description.to_numpy()[rule],
+        "amount": amount,
+    })
+
+def simulate_payments(invoice_ids, invoice_dates, totals, is_free, start_pay_id, rng) -> tuple:
     """
-    return [line_item_id, invoice_id, plan_id, description, amount, line_type]
+    Simulate the payment attempts (including up to MAX_PAYMENT_RETRIES retries) for each invoice.
+
+    The outcome, retry delay and payment method of every possible attempt are
+    drawn for all invoices in one batched pass; an invoice's attempts stop at
+    its first success. Free plan invoices are paid in one attempt.
+
+    Args:
+        invoice_ids (np.ndarray): Invoice ids in billing order
+        invoice_dates (np.ndarray): Invoice dates (datetime64[D])
+        totals (np.ndarray): Total due per invoice
+        is_free (np.ndarray): True where the invoice belongs to a free plan
+        start_pay_id (int): First payment id to assign
+        rng (np.random.Generator): random generator
 
-def apply_discounts(line_items, line_item_id, invoice_id, plan, invoice_date, sub, discounts, subscription_discounts, cycle_number):
+    Returns:
+        (payments_df, final_status): payment rows and the last payment status per invoice.
     """
-    Check and apply discounts for a given subscription cycle.
+    n, n_attempts = len(invoice_ids), 1 + MAX_PAYMENT_RETRIES
+    statuses = np.array(list(PAYMENT_STATUS_PROBABILITIES))
+    status = rng.choice(len(statuses), size=(n, n_attempts), p=list(PAYMENT_STATUS_PROBABILITIES.values()))
+    delay = rng.integers(RETRY_DELAY_DAYS[0], RETRY_DELAY_DAYS[1] + 1, size=(n, n_attempts))
+    method = rng.integers(0, len(PAYMENT_METHODS), size=(n, n_attempts))
+
+    # Free plan invoices succeed on the first attempt
+    success = int(np.flatnonzero(statuses == "success")[0])
+    status[is_free, 0] = success
+
+    # Attempts made: up to and including the first success
+    succeeded = status == success
+    attempts = np.where(succeeded.any(axis=1), succeeded.argmax(axis=1) + 1, n_attempts)
+    made = np.arange(n_attempts) < attempts[:, None]
+
+    # First attempt the day after the invoice, each retry a delay after the previous attempt
+    delay[:, 0] = 1
+    payment_date = np.asarray(invoice_dates, dtype="datetime64[D]")[:, None] + np.cumsum(delay, axis=1).astype("timedelta64[D]")
+
+    rows = np.repeat(np.arange(n), attempts)
+    attempt_status = statuses[status[made]]
+    methods = np.array(PAYMENT_METHODS + ["N/A"])
+    payments_df = pd.DataFrame({
+        "payment_id": start_pay_id + np.arange(len(rows)),
+        "invoice_id": np.asarray(invoice_ids)[rows],
+        "payment_date": payment_date[made],
+        "amount_paid": np.where(attempt_status == "success", np.asarray(totals, dtype=float)[rows], 0.0),
+        "payment_status": attempt_status,
+        "payment_method": methods[np.where(is_free[rows], len(PAYMENT_METHODS), method[made])],
+    })
+    final_status = statuses[status[np.arange(n), attempts - 1]]
+    return payments_df, final_status
+
+def bill_cycles(cycles, discount_index, start_invoice_id = 1000, start_pay_id = 5000, start_line_id = 2000, rng = None):
     """
-    active_discounts = subscription_discounts[subscription_discounts.subscription_id == sub.subscription_id]
-    for _, sd in active_discounts.iterrows():
-        if sd.applied_date <= invoice_date <= (sd.expiry_date or END_DATE):
-            disc = discounts[discounts.discount_id == sd.discount_id].iloc[0]
+    Build the invoices, line items and payments for a set of billing cycles.
 
-            # Recurring or first cycle only
-            if disc.is_recurring or (not disc.is_recurring and cycle_number == 0):
-                if disc.discount_type == "percent":
-                    discount = -plan.plan_price * (disc.discount_value / 100)
-                else:
-                    discount = -disc.discount_value
-                line_items.append(
-                    create_line_item(line_item_id, invoice_id, None, f"Coupon {disc.discount_code}", discount, "discount")
-                )
-                line_item_id += 1
-    return line_item_id
+    Args:
+        cycles (pd.DataFrame): subscription_id, plan_id, plan_name, plan_price,
+                               cycle_number and invoice_date of each cycle to bill
+                               (see expand_billing_cycles)
+        discount_index (pd.DataFrame): Output of build_discount_index
+        rng (np.random.Generator, optional): random generator
 
-def generate_payments_invoice(subscriptions, plans, discounts, subscription_discounts, start_invoice_id = 1000, start_pay_id = 5000, start_line_id = 2000):
+    Returns:
+        invoices_df, line_items_df, payments_df
+    """
+    rng = get_rng(rng)
+    line_item_id, payment_id = start_line_id, start_pay_id
+
+    # 1. One invoice per billing cycle, in the given order
+    cycles = cycles.reset_index(drop=True)
+    cycles["invoice_id"] = start_invoice_id + np.arange(len(cycles))
+
+    # 2. Line items: base plan charge followed by any discounts on the same invoice
+    charges = pd.DataFrame({
+        "invoice_id": cycles.invoice_id.to_numpy(),
+        "sd_order": -1,
+        "plan_id": cycles.plan_id.to_numpy(),
+        "description": cycles.plan_name.astype(str).to_numpy() + " Plan",
+        "amount": cycles.plan_price.to_numpy(dtype=float),
+        "line_type": "charge",
+    })
+    discount_lines = apply_discounts(cycles, discount_index)
+    discount_lines["plan_id"] = np.nan
+    discount_lines["line_type"] = "discount"
+
+    line_items_df = (
+        pd.concat([charges, discount_lines], ignore_index=True)
+        .sort_values(["invoice_id", "sd_order"], kind="stable")
+        .drop(columns="sd_order")
+        .reset_index(drop=True)
+    )
+    line_items_df.insert(0, "line_item_id", line_item_id + np.arange(len(line_items_df)))
+
+    # 3. Total for each invoice, summed in one pass over the finished line items
+    totals = np.bincount(
+        line_items_df.invoice_id.to_numpy() - start_invoice_id,
+        weights=line_items_df.amount.to_numpy(dtype=float),
+        minlength=len(cycles),
+    )
+
+    # 4. Payments (with retries) and final invoice status
+    is_free = (cycles.plan_price == 0).to_numpy()
+    invoice_dates = cycles.invoice_date.to_numpy(dtype="datetime64[D]")
+    payments_df, final_status = simulate_payments(cycles.invoice_id.to_numpy(), invoice_dates, totals, is_free, payment_id, rng)
+    invoice_status = np.where(final_status == "success", "paid", "past_due")
+
+    # One row per invoice; free plan invoices are always paid
+    invoices_df = pd.DataFrame({
+        "invoice_id": cycles.invoice_id.to_numpy(),
+        "subscription_id": cycles.subscription_id.to_numpy(),
+        "invoice_date": invoice_dates,
+        "total_due": totals,
+        "invoice_status": np.where(is_free, "paid", invoice_status),
+    })
+
+    return (
+        apply_dtype_policy(invoices_df, "invoices"),
+        apply_dtype_policy(line_items_df, "line_items"),
+        apply_dtype_policy(payments_df, "payments"),
+    )
+
+def generate_payments_invoice(subscriptions, plans, discounts, subscription_discounts, start_invoice_id = 1000, start_pay_id = 5000, start_line_id = 2000, discount_index = None, rng = None):
     """
     Generate invoices, line items, and payments for subscriptions.
 
+    Billing cycles, plan prices and discounts are resolved column-wise for all
+    subscriptions at once, and the payment attempts of every invoice are
+    simulated in one batched pass (see simulate_payments).
+
     Args:
         subscriptions (pd.DataFrame)
         plans (pd.DataFrame)
         discounts (pd.DataFrame)
         subscription_discounts (pd.DataFrame)
+        discount_index (pd.DataFrame, optional): Prebuilt output of build_discount_index.
+                                                 Built from subscription_discounts if None.
+        rng (np.random.Generator, optional): random generator
 
     Returns:
         invoices_df, line_items_df, payments_df
     """
-    invoices, line_items, payments = [], [], []
-    invoice_id, line_item_id, payment_id = start_invoice_id, start_pay_id, start_line_id
-
-    for _, sub in subscriptions.iterrows():
-        plan = plans[plans.plan_id == sub.plan_id].iloc[0]
-
-        # Determine billing cycle
-        cycle_days = MONTHLY_CYCLE_DAYS if plan.recurring == "monthly" else YEARLY_CYCLE_DAYS
-
-        cycle_number = 0
-        while True:
-            invoice_date = sub.start_date + timedelta(days=cycle_days * cycle_number)
-            if invoice_date > END_DATE:
-                break
-            if sub.end_date and invoice_date > sub.end_date:
-                break
-
-            # Base plan line item
-            line_items.append(
-                create_line_item(line_item_id, invoice_id, plan.plan_id, f"{plan.plan_name} Plan", plan.plan_price, "charge")
-            )
-            line_item_id += 1
-
-            # Discounts
-            if plan.plan_price > 0:
-                line_item_id = apply_discounts(
-                    line_items, line_item_id, invoice_id, plan, invoice_date, sub, discounts, subscription_discounts, cycle_number
-                )
-
-            # Total for this invoice
-            total = sum(li[4] for li in line_items if li[1] == invoice_id)
-            status = None
-            # Payment + invoice
-            if plan.plan_price == 0.0:
-                # Free plan
-                invoices.append([invoice_id, sub.subscription_id, invoice_date, 0.0, "paid"])
-                payments.append([payment_id, invoice_id, invoice_date + timedelta(days=1), 0.0, "success", "N/A"])
-                status = "success"
-            else:
-                status = np.random.choice(["success", "failed", "pending"], p=[0.7, 0.2, 0.1])
-                amount_paid = total if status == "success" else 0
-                payments.append([
-                    payment_id,
-                    invoice_id,
-                    invoice_date + timedelta(days=1),
-                    amount_paid,
-                    status,
-                    np.random.choice(["Debit", "Credit", "Paypal"]),
-                ])
-            payment_id += 1
-
-            # Retry if payment failed or pending  
-            retries = 0
-            last_status = status
-            last_date = invoice_date + timedelta(days=1)
-            while last_status in ["failed", "pending"] and retries < 2:
-                delay = np.random.randint(2,8) #retry after 2-7 days
-                retry_date = last_date + timedelta(days=delay)
-                retry_status = np.random.choice(["success", "failed", "pending"], p=[0.7, 0.2, 0.1])
-                amount_paid = total if retry_status == 'success' else 0
-
-                payments.append([
-                    payment_id,
-                    invoice_id,
-                    retry_date,
-                    amount_paid,
-                    retry_status,
-                    np.random.choice(["Debit", "Credit", "Paypal"])
-                ])
-                payment_id += 1 
-
-                last_status = retry_status
-                last_date = retry_date
-                retries += 1
-
-                if last_status == 'success':
-                    break
-            
-            # Final invoice status after retries
-            if last_status == 'success':
-                invoice_status = "paid"
-            else:
-                invoice_status = "past_due"
-            
-            invoices.append([
-                invoice_id,
-                sub.subscription_id,
-                invoice_date,
-                total,
-                invoice_status
-            ])
-
-            # Increment counters
-            invoice_id += 1
-            cycle_number += 1
-
-    invoices_df = pd.DataFrame(invoices, columns=["invoice_id", "subscription_id", "invoice_date", "total_due", "invoice_status"])
-    line_items_df = pd.DataFrame(line_items, columns=["line_item_id", "invoice_id", "plan_id", "description", "amount", "line_type"])
-    payments_df = pd.DataFrame(payments, columns=["payment_id", "invoice_id", "payment_date", "amount_paid", "payment_status", "payment_method"])
-
-    return invoices_df, line_items_df, payments_df
\ No newline at end of file
+    # One row per billing cycle, in subscription order
+    cycles = expand_billing_cycles(subscriptions, plans)
+
+    if discount_index is None:
+        discount_index = build_discount_index(subscription_discounts, discounts)
+
+    return bill_cycles(cycles, discount_index, start_invoice_id, start_pay_id, start_line_id, rng)
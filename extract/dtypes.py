@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from extract.config import CATEGORIES, AMOUNT_DTYPE
+from extract.schema import fields
+
+INT32_MAX = np.iinfo(np.int32).max
+
+def compact_int(values, nullable = False) -> pd.Series:
+    """
+    Smallest of int32/int64 (or Int32/Int64 when nullable) that holds every value.
+
+    Ids never go below 32 bits, so adding an id offset can only need a wider type.
+    """
+    values = pd.Series(values).astype("Int64" if nullable else np.int64)
+    largest = values.abs().max()
+    if pd.isna(largest) or largest <= INT32_MAX:
+        return values.astype("Int32" if nullable else np.int32)
+    return values
+
+def to_category(values, categories) -> pd.Categorical:
+    """
+    Categorical with the configured categories first, followed by any values not listed.
+    """
+    values = pd.Series(values).astype(object)
+    extra = sorted(set(values.dropna()) - set(categories))
+    return pd.Categorical(values, categories = list(categories) + extra)
+
+def apply_dtype_policy(df, table_name) -> pd.DataFrame:
+    """
+    Cast a generated table to compact dtypes derived from its schema in
+    extract/schema.py, in place:
+
+    - STRING columns listed in config.CATEGORIES -> category
+    - DATE -> datetime64[s] (pandas' coarsest datetime unit)
+    - INTEGER -> int32 when the values fit, int64 otherwise (Int32/Int64 when NULLABLE)
+    - FLOAT -> config.AMOUNT_DTYPE
+
+    Columns not in the schema are left as they are.
+
+    Returns:
+        pd.DataFrame: The same DataFrame, for chaining.
+    """
+    for field in fields[table_name]:
+        if field.name not in df.columns:
+            continue
+        column = df[field.name]
+        if field.field_type == "STRING" and field.name in CATEGORIES:
+            if not isinstance(column.dtype, pd.CategoricalDtype):
+                df[field.name] = to_category(column, CATEGORIES[field.name])
+        elif field.field_type == "DATE":
+            df[field.name] = pd.to_datetime(column, errors="coerce").astype("datetime64[s]")
+        elif field.field_type == "INTEGER":
+            df[field.name] = compact_int(column, nullable = field.mode != "REQUIRED")
+        elif field.field_type == "FLOAT":
+            df[field.name] = column.astype(AMOUNT_DTYPE)
+    return df
+
+def legacy_dtypes(df, table_name) -> pd.DataFrame:
+    """
+    Copy of a table with the dtypes the generators produced before the dtype
+    policy: Python strings and dates in object columns, int64 and float64.
+    """
+    df = df.copy()
+    for field in fields[table_name]:
+        if field.name not in df.columns:
+            continue
+        column = df[field.name]
+        if field.field_type == "STRING":
+            df[field.name] = column.astype(object)
+        elif field.field_type == "DATE":
+            days = pd.to_datetime(column, errors="coerce").to_numpy(dtype="datetime64[D]")
+            df[field.name] = pd.Series(days.astype(object), index=df.index, dtype=object).where(~np.isnat(days), None)
+        elif field.field_type == "INTEGER":
+            df[field.name] = column.astype("float64" if column.isna().any() else "int64")
+        elif field.field_type == "FLOAT":
+            df[field.name] = column.astype("float64")
+    return df
+
+def memory_report(frames: dict) -> pd.DataFrame:
+    """
+    Deep memory use of each generated table under the dtype policy, against
+    the same rows with the legacy dtypes.
+
+    Returns:
+        pd.DataFrame: table, rows, legacy_mb, compact_mb and saved_pct per table, plus a total row.
+    """
+    rows = []
+    for table_name, df in frames.items():
+        compact = apply_dtype_policy(df.copy(), table_name)
+        rows.append({
+            "table": table_name,
+            "rows": len(df),
+            "legacy_mb": legacy_dtypes(df, table_name).memory_usage(deep=True).sum() / 1e6,
+            "compact_mb": compact.memory_usage(deep=True).sum() / 1e6,
+        })
+    report = pd.DataFrame(rows, columns=["table", "rows", "legacy_mb", "compact_mb"])
+    total = pd.DataFrame([{"table": "total", "rows": report.rows.sum(), "legacy_mb": report.legacy_mb.sum(), "compact_mb": report.compact_mb.sum()}])
+    report = pd.concat([report, total], ignore_index=True)
+    report["saved_pct"] = (100 * (1 - report.compact_mb / report.legacy_mb)).round(1)
+    return report.round({"legacy_mb": 2, "compact_mb": 2})
@@ -0,0 +1,281 @@
+import json
+import os
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from extract.config import STATE_DIR, SEED, DAILY_SIGNUPS
+from extract.catalog import get_catalog
+from extract.schedule import cycle_dates
+from extract.data_generation import (
+    generate_customers,
+    generate_subscriptions,
+    generate_subscription_discounts,
+    build_discount_index,
+    bill_cycles,
+    to_day_array,
+)
+from extract.streaming import assign_ids
+from extract.dtypes import apply_dtype_policy
+
+DAILY_STATE_DIR = os.path.join(STATE_DIR, "daily")
+
+# Columns of the persisted subscription state. end_date, status and cancel_date
+# hold the *scheduled* outcome of the subscription, which is only published on end_date.
+STATE_COLUMNS = [
+    "subscription_id", "customer_id", "plan_id", "start_date", "end_date", "status", "cancel_date",
+    "cycle_number", "next_invoice_date", "emitted",
+]
+
+SUBSCRIPTION_COLUMNS = ["subscription_id", "customer_id", "plan_id", "start_date", "end_date", "status", "cancel_date"]
+SUBSCRIPTION_DISCOUNT_COLUMNS = ["sub_discount_id", "subscription_id", "discount_id", "applied_date", "expiry_date"]
+PAYMENT_COLUMNS = ["payment_id", "invoice_id", "payment_date", "amount_paid", "payment_status", "payment_method"]
+
+def empty_state() -> dict:
+    """
+    State of a daily pipeline that has not run yet.
+    """
+    subscriptions = pd.DataFrame({column: pd.Series(dtype=object) for column in STATE_COLUMNS})
+    subscriptions = subscriptions.astype({
+        "subscription_id": "int64", "customer_id": "int64", "plan_id": "int64",
+        "start_date": "datetime64[s]", "end_date": "datetime64[s]", "cancel_date": "datetime64[s]",
+        "next_invoice_date": "datetime64[s]", "cycle_number": "int64", "emitted": bool,
+    })
+    subscription_discounts = pd.DataFrame({
+        "sub_discount_id": pd.Series(dtype="int64"),
+        "subscription_id": pd.Series(dtype="int64"),
+        "discount_id": pd.Series(dtype="int64"),
+        "applied_date": pd.Series(dtype="datetime64[s]"),
+        "expiry_date": pd.Series(dtype="datetime64[s]"),
+    })
+    payments = pd.DataFrame({
+        "payment_id": pd.Series(dtype="int64"),
+        "invoice_id": pd.Series(dtype="int64"),
+        "payment_date": pd.Series(dtype="datetime64[s]"),
+        "amount_paid": pd.Series(dtype="float64"),
+        "payment_status": pd.Series(dtype=object),
+        "payment_method": pd.Series(dtype=object),
+    })
+    return {
+        "last_run_date": None,
+        "subscriptions": subscriptions,
+        "subscription_discounts": subscription_discounts,
+        "payments": payments,
+    }
+
+def load_state(state_dir = DAILY_STATE_DIR) -> dict:
+    """
+    Load the persisted daily state, or an empty state on the first run.
+    """
+    meta_path = os.path.join(state_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return empty_state()
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    state = {"last_run_date": date.fromisoformat(meta["last_run_date"]) if meta["last_run_date"] else None}
+    for name in ["subscriptions", "subscription_discounts", "payments"]:
+        state[name] = pd.read_parquet(os.path.join(state_dir, f"{name}.parquet"))
+    return state
+
+def save_state(state: dict, state_dir = DAILY_STATE_DIR):
+    """
+    Persist the daily state. meta.json is written last, so an interrupted save
+    leaves the previous run's state in effect.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    for name in ["subscriptions", "subscription_discounts", "payments"]:
+        df = state[name].copy()
+        for column in df.columns:
+            if df[column].dtype == object and column.endswith("_date"):
+                df[column] = to_day_array(df[column])
+        df.to_parquet(os.path.join(state_dir, f"{name}.parquet"), index=False)
+
+    meta = {"last_run_date": state["last_run_date"].isoformat() if state["last_run_date"] else None}
+    tmp_path = os.path.join(state_dir, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(state_dir, "meta.json"))
+
+def _concat(frames) -> pd.DataFrame:
+    """
+    Concatenate frames, skipping empty ones so they do not decide the column dtypes.
+    """
+    non_empty = [df for df in frames if len(df)]
+    return pd.concat(non_empty or frames[:1], ignore_index=True)
+
+def _is_yearly(plan_ids, plans) -> np.ndarray:
+    return get_catalog(plans).plan_is_yearly[np.asarray(plan_ids, dtype=np.int64)]
+
+def _subscription_rows(state_rows, as_of) -> pd.DataFrame:
+    """
+    Publishable view of state rows: the scheduled outcome is only shown once it has happened.
+    """
+    ended = (state_rows.end_date.to_numpy(dtype="datetime64[D]") <= as_of)
+    end_date = np.where(ended, state_rows.end_date.to_numpy(dtype="datetime64[D]"), np.datetime64("NaT"))
+    cancel_date = np.where(ended, state_rows.cancel_date.to_numpy(dtype="datetime64[D]"), np.datetime64("NaT"))
+    return pd.DataFrame({
+        "subscription_id": state_rows.subscription_id.to_numpy(),
+        "customer_id": state_rows.customer_id.to_numpy(),
+        "plan_id": state_rows.plan_id.to_numpy(),
+        "start_date": state_rows.start_date.to_numpy(dtype="datetime64[D]").astype(object),
+        "end_date": end_date.astype("datetime64[D]").astype(object),
+        "status": np.where(ended, state_rows.status.to_numpy(), "active"),
+        "cancel_date": cancel_date.astype("datetime64[D]").astype(object),
+    })
+
+def seed_state(subscriptions, subscription_discounts, invoices, plans, as_of, state = None) -> dict:
+    """
+    Add the open subscriptions of a full-history run to the daily state, so
+    daily runs keep billing them.
+
+    A subscription is open when it has no end_date. Its next cycle follows the
+    invoices already generated for it; it stays open until a later run ends it.
+    Subscriptions already in the state are skipped, so seeding twice from the
+    same run changes nothing.
+    """
+    state = state or empty_state()
+    open_subs = subscriptions[subscriptions.end_date.isna() & ~subscriptions.subscription_id.isin(state["subscriptions"].subscription_id)]
+    billed = invoices.groupby("subscription_id").size()
+    cycle_number = billed.reindex(open_subs.subscription_id).fillna(0).astype(np.int64).to_numpy()
+    start = to_day_array(open_subs.start_date)
+
+    seeded = pd.DataFrame({
+        "subscription_id": open_subs.subscription_id.to_numpy(),
+        "customer_id": open_subs.customer_id.to_numpy(),
+        "plan_id": open_subs.plan_id.to_numpy(),
+        "start_date": start,
+        "end_date": np.full(len(open_subs), np.datetime64("NaT", "D")),
+        "status": "active",
+        "cancel_date": np.full(len(open_subs), np.datetime64("NaT", "D")),
+        "cycle_number": cycle_number,
+        "next_invoice_date": cycle_dates(start, cycle_number, _is_yearly(open_subs.plan_id, plans)),
+        "emitted": True,
+    })
+    open_discounts = subscription_discounts[subscription_discounts.subscription_id.isin(open_subs.subscription_id)]
+
+    state["subscriptions"] = pd.concat([state["subscriptions"], seeded], ignore_index=True)
+    state["subscription_discounts"] = pd.concat([state["subscription_discounts"], open_discounts], ignore_index=True)
+    state["last_run_date"] = max(filter(None, [state["last_run_date"], as_of]))
+    return state
+
+def simulate_day(state, day, plans, discounts, id_allocator, signups, rng) -> dict:
+    """
+    Advance the daily state by one day, in place, and return that day's new rows.
+
+    In order: new customers sign up, subscriptions starting today (signups and
+    plan switches) are published, due billing cycles are invoiced, payment
+    attempts falling due are published, and subscriptions ending today are
+    re-published with their final status.
+    """
+    today = np.datetime64(day, "D")
+    out = {}
+
+    # 1. Signups: customers with subscriptions starting today. Plan switches and
+    #    churn are scheduled into the future and published when they happen.
+    customers = generate_customers(signups, start_id = 1, rng = rng)
+    subscriptions = generate_subscriptions(customers, plans, start_id = 1, rng = rng, start_window = (day, day), horizon = None)
+    subscription_discounts = generate_subscription_discounts(subscriptions, plans, discounts, start_id = 1, rng = rng)
+    assign_ids({"customers": customers, "subscriptions": subscriptions, "subscription_discounts": subscription_discounts}, id_allocator)
+    out["customers"] = customers
+
+    new_state = subscriptions.assign(
+        start_date = to_day_array(subscriptions.start_date),
+        end_date = to_day_array(subscriptions.end_date),
+        cancel_date = to_day_array(subscriptions.cancel_date),
+        cycle_number = 0,
+        next_invoice_date = to_day_array(subscriptions.start_date),
+        emitted = False,
+    )
+    subs = _concat([state["subscriptions"], new_state[STATE_COLUMNS]])
+    sub_discounts = _concat([
+        state["subscription_discounts"],
+        subscription_discounts.assign(
+            applied_date = to_day_array(subscription_discounts.applied_date),
+            expiry_date = to_day_array(subscription_discounts.expiry_date),
+        ),
+    ])
+
+    # 2. Publish subscriptions (and their discounts) starting today
+    starting = ~subs.emitted.to_numpy(dtype=bool) & (subs.start_date.to_numpy(dtype="datetime64[D]") <= today)
+    out["subscriptions"] = _subscription_rows(subs[starting], today)
+    started_discounts = sub_discounts[sub_discounts.subscription_id.isin(subs.subscription_id[starting])].copy()
+    expiry = to_day_array(started_discounts.expiry_date)
+    started_discounts["expiry_date"] = np.where(expiry <= today, expiry, np.datetime64("NaT")).astype("datetime64[D]").astype(object)
+    started_discounts["applied_date"] = to_day_array(started_discounts.applied_date).astype(object)
+    out["subscription_discounts"] = started_discounts[SUBSCRIPTION_DISCOUNT_COLUMNS]
+    subs.loc[starting, "emitted"] = True
+
+    # 3. Bill every published subscription whose next cycle falls today
+    next_invoice = subs.next_invoice_date.to_numpy(dtype="datetime64[D]")
+    end_date = subs.end_date.to_numpy(dtype="datetime64[D]")
+    due = subs.emitted.to_numpy(dtype=bool) & (next_invoice <= today) & (np.isnat(end_date) | (next_invoice <= end_date))
+    catalog = get_catalog(plans)
+    cycles = subs.loc[due, ["subscription_id", "plan_id", "cycle_number", "next_invoice_date"]].rename(columns={"next_invoice_date": "invoice_date"})
+    cycles["plan_name"] = catalog.plan_name[cycles.plan_id.to_numpy(dtype=np.int64)]
+    cycles["plan_price"] = catalog.plan_price[cycles.plan_id.to_numpy(dtype=np.int64)]
+
+    # Open-ended discount windows run until the subscription ends
+    due_discounts = sub_discounts[sub_discounts.subscription_id.isin(cycles.subscription_id)].copy()
+    due_discounts["expiry_date"] = to_day_array(due_discounts.expiry_date)
+    due_discounts["expiry_date"] = due_discounts.expiry_date.fillna(pd.Timestamp(day))
+    invoices, line_items, payments = bill_cycles(
+        cycles, build_discount_index(due_discounts, discounts), start_invoice_id = 1, start_pay_id = 1, start_line_id = 1, rng = rng
+    )
+    assign_ids({"invoices": invoices, "line_items": line_items, "payments": payments}, id_allocator)
+    out["invoices"] = invoices
+    out["line_items"] = line_items
+
+    subs.loc[due, "cycle_number"] += 1
+    subs.loc[due, "next_invoice_date"] = cycle_dates(
+        to_day_array(subs.start_date[due]), subs.cycle_number[due].to_numpy(), _is_yearly(subs.plan_id[due], plans)
+    )
+
+    # 4. Payment attempts are published on their payment date
+    payments["payment_date"] = to_day_array(payments.payment_date)
+    payments["amount_paid"] = payments.amount_paid.astype(float)
+    queue = _concat([state["payments"], payments])
+    payment_date = queue.payment_date.to_numpy(dtype="datetime64[D]")
+    out["payments"] = queue[payment_date <= today].assign(payment_date = payment_date[payment_date <= today].astype(object)).reset_index(drop=True)
+    state["payments"] = queue[payment_date > today].reset_index(drop=True)
+
+    # 5. Subscriptions ending today are re-published with their final status and leave the state
+    ending = subs.end_date.to_numpy(dtype="datetime64[D]") <= today
+    out["subscriptions"] = _concat([out["subscriptions"], _subscription_rows(subs[ending], today)])
+    state["subscriptions"] = subs[~ending].reset_index(drop=True)
+    state["subscription_discounts"] = sub_discounts[
+        sub_discounts.subscription_id.isin(state["subscriptions"].subscription_id)
+    ].reset_index(drop=True)
+    state["last_run_date"] = day
+    return out
+
+def run_daily(state, run_date, plans, discounts, id_allocator, signups = DAILY_SIGNUPS, seed = SEED) -> dict:
+    """
+    Generate only the new billing events since the last daily run.
+
+    Every day after state["last_run_date"] up to run_date is simulated (just
+    run_date on the first run), each with a generator seeded from seed and the
+    day, so re-running a day from the same state gives the same data. The
+    state is updated in place; persist it with save_state once the returned
+    rows have been loaded.
+
+    Subscriptions are published when they start and again, with their final
+    status, end_date and cancel_date, on the day they end; downstream models
+    should keep the latest row per subscription_id.
+
+    Returns:
+        dict: New rows per dynamic table.
+    """
+    first_day = state["last_run_date"] + timedelta(days=1) if state["last_run_date"] else run_date
+    days = [first_day + timedelta(days=offset) for offset in range((run_date - first_day).days + 1)]
+
+    batches = {}
+    for day in days:
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(day.toordinal(),)))
+        for table_name, df in simulate_day(state, day, plans, discounts, id_allocator, signups, rng).items():
+            batches.setdefault(table_name, []).append(df)
+
+    frames = {table_name: apply_dtype_policy(_concat(dfs), table_name) for table_name, dfs in batches.items()}
+    if "subscriptions" in frames:
+        # Over a multi-day catch-up only the latest version of each subscription is kept
+        frames["subscriptions"] = frames["subscriptions"].drop_duplicates("subscription_id", keep="last").reset_index(drop=True)
+    return frames
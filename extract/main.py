@@ -1,9 +1,24 @@
+import argparse
+import logging
+import os
+from datetime import datetime, date
+import numpy as np
 import pandas as pd
-from google.cloud import bigquery
 from log.logging_config import setup_logging
-from load.load_to_bq import load_to_biquery
-from load.load_to_bq import get_max_id
-from extract import schema
+from log.metrics import RunMetrics
+from load.sinks import get_sink, SINKS
+from load.staging import write_staged, staged_tables
+from load.manifest import RunManifest
+from load.orchestrator import load_tables
+from load.id_allocator import IdAllocator
+from extract.config import N_CUSTOMERS, CHUNK_SIZE, N_WORKERS, N_LOAD_WORKERS, SEED, DAILY_SIGNUPS, METRICS_DIR, PROFILE_DIR, PROFILES, DEFAULT_PROFILE, STAGING_DIR
+from extract.incremental import load_state, save_state, run_daily, seed_state
+from extract.profiles import resolve_profile, TARGETS
+from extract.streaming import iter_chunks, assign_ids
+from extract.dtypes import memory_report
+from extract.validation import assert_valid
+from transform.mrr import last_closed_month
+from transform.mrr_store import load_store, save_store, fold_batch
 import warnings
 warnings.filterwarnings("ignore", category=FutureWarning, module="google.cloud.bigquery")
 from extract.data_generation import (
@@ -13,43 +28,145 @@ from extract.data_generation import (
     generate_subscriptions,
     generate_discounts,
     generate_subscription_discounts,
+    build_discount_index,
     generate_payments_invoice,
 )
 
-client = bigquery.Client()
-def main():
+def get_id_allocator(reconcile = False, target = "bigquery"):
+    """
+    Open the local id watermark store, syncing it with the target warehouse
+    only when asked to or when the store has just been created (and the run
+    loads to a warehouse at all).
+    """
+    id_allocator = IdAllocator()
+    if target in SINKS and (reconcile or id_allocator.is_new):
+        sink = get_sink(target)
+        id_allocator.reconcile(sink.get_client(), max_id_fn = sink.get_max_id)
+    return id_allocator
+
+def new_run_id():
+    """
+    Identifier of a pipeline run, used to name its staging directory.
+    """
+    return datetime.now().strftime("%Y%m%dT%H%M%S_%f")
+
+def table_rows(frames: dict) -> int:
+    """
+    Total rows over a dict of DataFrames.
+    """
+    return sum(len(df) for df in frames.values())
+
+def metrics_path(run_id):
+    """
+    Path of the JSON metrics summary of a run.
+    """
+    return os.path.join(METRICS_DIR, f"{run_id}.json")
+
+def load_run(staged, metrics, target, manifest = None):
+    """
+    Load staged tables to the target, as the "load" stage of a run. Runs
+    with the parquet target stop at the staged files.
+
+    With a manifest, parts it already records as loaded are skipped and every
+    part is recorded as soon as it has loaded, so a failed load can be resumed
+    without loading any part twice.
+    """
+    if target not in SINKS:
+        return
+    sink = get_sink(target)
+    load_fn = sink.load_staged
+    if manifest is not None:
+        staged = manifest.pending(staged)
+        if not staged:
+            return
+
+        def load_fn(paths, table_name, project_id, dataset, client = None):
+            rows = 0
+            for path in paths:
+                rows += sink.load_staged([path], table_name, project_id, dataset, client = client)
+                manifest.mark_loaded(table_name, [path])
+            return rows
+
+    with metrics.stage("load") as m:
+        results = load_tables(staged, client = sink.get_client(), max_workers = N_LOAD_WORKERS, load_fn = load_fn)
+        m["rows"] = sum(r["rows"] for r in results.values())
+
+def fold_mrr(store, frames, plans, discounts, metrics, through = None):
+    """
+    Fold the subscriptions, discounts and invoices of a batch into the MRR
+    snapshot store (see transform/mrr_store.py), as the "mrr_fold" stage of a run.
+    """
+    with metrics.stage("mrr_fold") as m:
+        touched = fold_batch(store, plans, discounts, frames.get("subscriptions"), frames.get("subscription_discounts"), frames.get("invoices"), through)
+        m["rows"] = len(touched)
+
+def fold_staged(store, staged, plans, discounts, metrics, through = None):
+    """
+    Fold the staged parts of a run into the MRR snapshot store, part by part,
+    for runs resumed after their generated frames are gone.
+    """
+    parts = {}
+    for table_name in ["subscriptions", "subscription_discounts", "invoices"]:
+        for path in staged.get(table_name, []):
+            parts.setdefault(os.path.basename(path), {})[table_name] = pd.read_parquet(path)
+    for part in sorted(parts):
+        fold_mrr(store, parts[part], plans, discounts, metrics, through)
+
+def main(n_customers = N_CUSTOMERS, reconcile_ids = False, seed = SEED, target = "bigquery", profile_stages = None, report_memory = False):
     # Setup logging
     setup_logging()
+    run_id = new_run_id()
+    manifest = RunManifest.create(run_id, "batch", {"n_customers": n_customers, "seed": seed, "target": target})
+    metrics = RunMetrics(run_id, profile = profile_stages, profile_dir = PROFILE_DIR)
+    rng = np.random.default_rng(seed)
+
+    with metrics.stage("id_allocator"):
+        id_allocator = get_id_allocator(reconcile_ids, target)
 
-    # 1. Generate base data
-    max_customer_id = get_max_id(client, "customers")
-    customers = generate_customers(5, start_id = max_customer_id + 1)
+    # 1. Generate base data (ids are local until step 5)
+    with metrics.stage("customers") as m:
+        customers = generate_customers(n_customers, start_id = 1, rng = rng)
+        m["rows"] = len(customers)
     products = generate_products()
     plans = generate_plans()
 
     # 2. Generate subscriptions
-    max_sub_id = get_max_id(client, "subscriptions")
-    subscriptions = generate_subscriptions(customers, plans, start_id = max_sub_id + 1)
+    with metrics.stage("subscriptions") as m:
+        subscriptions = generate_subscriptions(customers, plans, start_id = 1, rng = rng)
+        m["rows"] = len(subscriptions)
 
     # 3. Discounts and applied subscription discounts
-    
-    discounts = generate_discounts()
-    max_sub_discount_id = get_max_id(client, "subscription_discounts")
-    subscription_discounts = generate_subscription_discounts(subscriptions, plans, discounts, start_id = max_sub_discount_id + 1)
+    with metrics.stage("subscription_discounts") as m:
+        discounts = generate_discounts()
+        subscription_discounts = generate_subscription_discounts(subscriptions, plans, discounts, start_id = 1, rng = rng)
+        discount_index = build_discount_index(subscription_discounts, discounts)
+        m["rows"] = len(subscription_discounts)
 
     # 4. Invoices, line items, and payments
-    max_invoice_id = get_max_id(client, "invoices")
-    max_pay_id = get_max_id(client, "payments")
-    max_line_id = get_max_id(client, "line_items")
-    invoices, line_items, payments = generate_payments_invoice(subscriptions, 
-                                                               plans, 
-                                                               discounts, 
-                                                               subscription_discounts,
-                                                               start_invoice_id = max_invoice_id + 1,
-                                                               start_pay_id = max_pay_id,
-                                                               start_line_id = max_line_id)
-
-    # 5. Store results (CSVs)
+    with metrics.stage("payments_invoice") as m:
+        invoices, line_items, payments = generate_payments_invoice(subscriptions, 
+                                                                   plans, 
+                                                                   discounts, 
+                                                                   subscription_discounts,
+                                                                   start_invoice_id = 1,
+                                                                   start_pay_id = 1,
+                                                                   start_line_id = 1,
+                                                                   discount_index = discount_index,
+                                                                   rng = rng)
+        m["rows"] = len(invoices) + len(line_items) + len(payments)
+
+    # 5. Move every table into id ranges reserved from the local watermark store
+    with metrics.stage("assign_ids"):
+        assign_ids({
+            "customers": customers,
+            "subscriptions": subscriptions,
+            "subscription_discounts": subscription_discounts,
+            "invoices": invoices,
+            "line_items": line_items,
+            "payments": payments,
+        }, id_allocator)
+
+    # 6. Store results (CSVs)
     """
     customers.to_csv("../data/customers.csv", index=False)
     products.to_csv("../data/products.csv", index=False)
@@ -65,18 +182,300 @@ def main():
     print("Data generation complete, CSVs saved in /data")
     """
 
-    # 6. Load to Bigquery (Appends data instead of overwriting)
-    load_to_biquery(customers, "customers")
-    load_to_biquery(products, "products")
-    load_to_biquery(plans, "plans")
-    load_to_biquery(discounts, "discounts")
-    load_to_biquery(subscriptions, "subscriptions")
-    load_to_biquery(subscription_discounts, "subscription_discounts")
-    load_to_biquery(invoices, "invoices")
-    load_to_biquery(line_items, "line_items")
-    load_to_biquery(payments, "payments")
+    # 7. Stage every table as Parquet, then load the staged files to Bigquery
+    #    (appends data instead of overwriting), all tables in parallel
+    tables = {
+        "customers": customers,
+        "products": products,
+        "plans": plans,
+        "discounts": discounts,
+        "subscriptions": subscriptions,
+        "subscription_discounts": subscription_discounts,
+        "invoices": invoices,
+        "line_items": line_items,
+        "payments": payments,
+    }
+    if report_memory:
+        # Opt-in: the report copies every table with the legacy dtypes
+        logging.info("Memory use per table:\n%s", memory_report(tables).to_string(index=False))
+    with metrics.stage("validate") as m:
+        assert_valid(tables)
+        m["rows"] = table_rows(tables)
+    with metrics.stage("stage") as m:
+        staged = {table_name: [write_staged(df, table_name, run_id)] for table_name, df in tables.items()}
+        m["rows"] = table_rows(tables)
+    manifest.mark_staged(staged)
+    manifest.mark_done("generate")
+    print(f"Staged run {run_id}")
+    load_run(staged, metrics, target, manifest)
+
+    # 8. Update the materialized MRR snapshots with this batch
+    mrr_store = load_store()
+    fold_mrr(mrr_store, tables, plans, discounts, metrics)
+    with metrics.stage("mrr_save"):
+        save_store(mrr_store)
+    manifest.mark_done("mrr")
+    manifest.complete()
+
+    metrics.log_summary(metrics_path(run_id))
+    print(f"Data generation complete (staged run {run_id}, target {target})")
+
+def main_streaming(n_customers = N_CUSTOMERS, chunk_size = CHUNK_SIZE, workers = N_WORKERS, reconcile_ids = False, seed = SEED, target = "bigquery", profile_stages = None, manifest = None):
+    """
+    Generate and load the dataset chunk by chunk.
+
+    Static tables are loaded once. Customers and their dependent tables are then
+    generated chunk_size customers at a time, and every chunk is loaded before
+    the next one is generated, so peak memory depends on the chunk size rather
+    than on the total number of customers. With workers > 1 the chunks are
+    generated in parallel processes; the data is the same for any worker count.
+
+    Given the manifest of a failed streaming run, that run is resumed: parts
+    staged but not loaded are loaded, and generation continues with the first
+    chunk that was not staged.
+    """
+    setup_logging()
+    resumed = manifest is not None
+    if not resumed:
+        manifest = RunManifest.create(run_id = new_run_id(), mode = "stream", settings = {
+            "n_customers": n_customers, "chunk_size": chunk_size, "workers": workers, "seed": seed, "target": target,
+        })
+    run_id = manifest.run_id
+    metrics = RunMetrics(run_id, profile = profile_stages, profile_dir = PROFILE_DIR)
+
+    # 1. Static tables
+    with metrics.stage("static_tables") as m:
+        plans = generate_plans()
+        discounts = generate_discounts()
+        static = {"products": generate_products(), "plans": plans, "discounts": discounts}
+        if not manifest.done("static"):
+            manifest.mark_staged({table_name: [write_staged(df, table_name, run_id)] for table_name, df in static.items()})
+            manifest.mark_done("static")
+        m["rows"] = table_rows(static)
+    # Everything staged so far: the static tables, and the chunks of a resumed run
+    load_run(manifest.staged, metrics, target, manifest)
+
+    # 2. Dynamic tables, with ids reserved from the local watermark store
+    with metrics.stage("id_allocator"):
+        id_allocator = get_id_allocator(reconcile_ids, target)
+
+    mrr_store = load_store()
+    first_chunk = sum(1 for stage in manifest.data["stages"] if stage.startswith("chunk-"))
+    if resumed and not manifest.done("mrr"):
+        # The snapshot store is only saved at the end, so none of the staged chunks is in it yet
+        fold_staged(mrr_store, {table_name: paths for table_name, paths in manifest.staged.items() if table_name not in static}, plans, discounts, metrics)
+    chunks = iter_chunks(n_customers, id_allocator, plans, discounts, chunk_size, workers, seed, first_chunk)
+    for chunk_number, frames in enumerate(metrics.iterate("generate_chunk", chunks, rows = table_rows), start = first_chunk + 1):
+        with metrics.stage("validate") as m:
+            assert_valid(frames, reference = static)
+            m["rows"] = table_rows(frames)
+        with metrics.stage("stage") as m:
+            staged = {table_name: [write_staged(df, table_name, run_id, part = chunk_number)] for table_name, df in frames.items()}
+            m["rows"] = table_rows(frames)
+        manifest.mark_staged(staged)
+        manifest.mark_done(f"chunk-{chunk_number}")
+        load_run(staged, metrics, target, manifest)
+        fold_mrr(mrr_store, frames, plans, discounts, metrics)
+        print(f"Finished chunk {chunk_number} ({len(frames['customers'])} customers)")
+
+    # 3. Materialized MRR snapshots, saved once every chunk is folded in
+    with metrics.stage("mrr_save"):
+        save_store(mrr_store)
+    manifest.mark_done("mrr")
+    manifest.complete()
+
+    metrics.log_summary(metrics_path(run_id))
+    print(f"Streaming data generation complete (staged run {run_id}, target {target})")
+
+def main_daily(run_date = None, signups = DAILY_SIGNUPS, reconcile_ids = False, target = "bigquery", profile_stages = None):
+    """
+    Simulate the days since the last daily run up to run_date (default today)
+    and load only the rows those days produced.
+
+    The daily state (open subscriptions, pending payment attempts) is saved
+    only after every table has loaded. Until then it is checkpointed with the
+    run's staged files, so a failed run is resumed (resume_run) rather than
+    simulated again.
+    """
+    setup_logging()
+    run_date = run_date or date.today()
+    run_id = new_run_id()
+    manifest = RunManifest.create(run_id, "daily", {"run_date": run_date.isoformat(), "signups": signups, "target": target})
+    metrics = RunMetrics(run_id, profile = profile_stages, profile_dir = PROFILE_DIR)
+
+    plans = generate_plans()
+    discounts = generate_discounts()
+    with metrics.stage("id_allocator"):
+        id_allocator = get_id_allocator(reconcile_ids, target)
+    with metrics.stage("load_state"):
+        state = load_state()
+    # Rows of earlier daily runs may be referenced (e.g. payments of older invoices)
+    loaded_ids = id_allocator.watermarks()
+
+    with metrics.stage("simulate_days") as m:
+        frames = run_daily(state, run_date, plans, discounts, id_allocator, signups)
+        m["rows"] = table_rows(frames)
+    if not frames:
+        print(f"Daily state is already at {state['last_run_date']}, nothing to generate")
+        return
+    with metrics.stage("validate") as m:
+        assert_valid(frames, reference = {"plans": plans, "discounts": discounts}, loaded_ids = loaded_ids)
+        m["rows"] = table_rows(frames)
+
+    with metrics.stage("stage") as m:
+        staged = {table_name: [write_staged(df, table_name, run_id)] for table_name, df in frames.items()}
+        m["rows"] = table_rows(frames)
+        save_state(state, pending_state_dir(run_id))
+    manifest.mark_staged(staged)
+    manifest.mark_done("generate")
+    load_run(staged, metrics, target, manifest)
+    with metrics.stage("save_state"):
+        save_state(state)
+    manifest.mark_done("state")
+    mrr_store = load_store()
+    fold_mrr(mrr_store, frames, plans, discounts, metrics, through = last_closed_month(run_date))
+    with metrics.stage("mrr_save"):
+        save_store(mrr_store)
+    manifest.mark_done("mrr")
+    manifest.complete()
+
+    metrics.log_summary(metrics_path(run_id))
+
+    print(f"Daily run up to {run_date} complete (staged run {run_id}): " + ", ".join(f"{name}={len(df)}" for name, df in frames.items()))
 
-    print("Data generation and bigquery load complete")
+def pending_state_dir(run_id):
+    """
+    Where a daily run checkpoints its new state until its tables have loaded.
+    """
+    return os.path.join(STAGING_DIR, run_id, "daily_state")
+
+def resume_run(run_id, reconcile_ids = False, profile_stages = None):
+    """
+    Resume a failed run from its manifest (see load/manifest.py).
+
+    Staged parts are never generated again and parts already loaded are not
+    loaded again; the remaining stages (loads, MRR snapshots, daily state,
+    and the remaining chunks of a streaming run) are finished. A batch or
+    daily run that failed before staging anything is started over.
+    """
+    setup_logging()
+    manifest = RunManifest.load(run_id)
+    settings = manifest.settings
+    if manifest.data["status"] == "complete":
+        print(f"Run {run_id} is already complete")
+        return
+
+    mode = manifest.data["mode"]
+    print(f"Resuming {mode} run {run_id}: " + ", ".join(f"{key}={value}" for key, value in settings.items()))
+    if mode == "stream":
+        main_streaming(settings["n_customers"], settings["chunk_size"], settings["workers"], reconcile_ids, settings["seed"], settings["target"], profile_stages, manifest)
+        return
+    if not manifest.done("generate"):
+        print(f"Run {run_id} failed before its tables were staged; starting it over")
+        if mode == "daily":
+            main_daily(date.fromisoformat(settings["run_date"]), settings["signups"], reconcile_ids, settings["target"], profile_stages)
+        else:
+            main(settings["n_customers"], reconcile_ids, settings["seed"], settings["target"], profile_stages)
+        return
+
+    metrics = RunMetrics(run_id, profile = profile_stages, profile_dir = PROFILE_DIR)
+    plans = generate_plans()
+    discounts = generate_discounts()
+    load_run(manifest.staged, metrics, settings["target"], manifest)
+    through = None
+    if mode == "daily":
+        through = last_closed_month(date.fromisoformat(settings["run_date"]))
+        if not manifest.done("state"):
+            with metrics.stage("save_state"):
+                save_state(load_state(pending_state_dir(run_id)))
+            manifest.mark_done("state")
+    if not manifest.done("mrr"):
+        mrr_store = load_store()
+        fold_staged(mrr_store, manifest.staged, plans, discounts, metrics, through)
+        with metrics.stage("mrr_save"):
+            save_store(mrr_store)
+        manifest.mark_done("mrr")
+    manifest.complete()
+
+    metrics.log_summary(metrics_path(run_id))
+    print(f"Resumed run {run_id} complete (target {settings['target']})")
+
+def run_profile(profile, reconcile_ids = False, profile_stages = None, report_memory = False):
+    """
+    Run the pipeline with the settings of a scale profile (see extract/profiles.py).
+    report_memory only applies to batch (non-streaming) runs.
+    """
+    print(f"Scale profile {profile['name']}: " + ", ".join(f"{key}={value}" for key, value in profile.items() if key != "name"))
+    if profile["stream"]:
+        main_streaming(profile["customers"], profile["chunk_size"], profile["workers"], reconcile_ids, profile["seed"], profile["target"], profile_stages)
+    else:
+        main(profile["customers"], reconcile_ids, profile["seed"], profile["target"], profile_stages, report_memory)
+
+def seed_daily_state(run_id):
+    """
+    Start the daily state from a staged full-history run (batch or streaming),
+    so later daily runs keep billing its open subscriptions from the day after
+    the run instead of starting from an empty customer base.
+    """
+    setup_logging()
+    staged = staged_tables(run_id)
+    frames = {
+        table_name: pd.concat([pd.read_parquet(path) for path in staged[table_name]], ignore_index = True)
+        for table_name in ["subscriptions", "subscription_discounts", "invoices"]
+    }
+    # The run billed its history up to the day it was generated on (END_DATE at the time)
+    as_of = datetime.strptime(run_id.split("T")[0], "%Y%m%d").date()
+    state = load_state()
+    n_before = len(state["subscriptions"])
+    state = seed_state(frames["subscriptions"], frames["subscription_discounts"], frames["invoices"], generate_plans(), as_of, state)
+    save_state(state)
+    print(f"Seeded the daily state with {len(state['subscriptions']) - n_before} open subscriptions of run {run_id} (daily runs continue after {as_of})")
+
+def load_staged_run(run_id, target = "bigquery"):
+    """
+    Load every table of an already staged run, without regenerating any data.
+    """
+    setup_logging()
+    sink = get_sink(target)
+    load_tables(staged_tables(run_id), client = sink.get_client(), max_workers = N_LOAD_WORKERS, load_fn = sink.load_staged)
+    print(f"Loaded staged run {run_id} to {target}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate the synthetic SaaS dataset and load it to BigQuery")
+    parser.add_argument("--profile", help=f"Scale profile: {', '.join(PROFILES)} (default {DEFAULT_PROFILE}, or $DATAFLOWIQ_PROFILE)")
+    parser.add_argument("--config", metavar="FILE", help="JSON file selecting, defining or overriding scale profiles")
+    parser.add_argument("--stream", action="store_const", const=True, help="Generate and load customers in chunks")
+    parser.add_argument("--customers", type=int, help="Customers to generate")
+    parser.add_argument("--chunk-size", type=int, help="Customers per chunk in streaming mode")
+    parser.add_argument("--workers", type=int, help="Worker processes for streaming mode")
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument("--target", choices=sorted(TARGETS), help="Load to BigQuery or the local DuckDB warehouse, or only stage Parquet files")
+    parser.add_argument("--reconcile-ids", action="store_true", help="Sync local id watermarks with BigQuery before generating")
+    parser.add_argument("--load-staged", metavar="RUN_ID", help="Load an already staged run instead of generating data")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume a failed run from its manifest, loading only what is missing")
+    parser.add_argument("--seed-daily", metavar="RUN_ID", help="Start the daily state from the open subscriptions of a staged full-history run")
+    parser.add_argument("--daily", action="store_true", help="Generate only the new events since the last daily run")
+    parser.add_argument("--date", type=date.fromisoformat, help="Last day to simulate in daily mode (YYYY-MM-DD, default today)")
+    parser.add_argument("--signups", type=int, default=DAILY_SIGNUPS, help="New customers per day in daily mode")
+    parser.add_argument("--memory-report", action="store_true", help="Log each table's memory use against the legacy dtypes (batch mode; copies every table)")
+    parser.add_argument("--cprofile", metavar="STAGE", action="append", help="Run a stage under cProfile (repeatable, or 'all')")
+    args = parser.parse_args()
+
+    profile = resolve_profile(args.profile, args.config, {
+        "customers": args.customers,
+        "chunk_size": args.chunk_size,
+        "workers": args.workers,
+        "seed": args.seed,
+        "stream": args.stream,
+        "target": args.target,
+    })
+    if args.resume:
+        resume_run(args.resume, args.reconcile_ids, args.cprofile)
+    elif args.load_staged:
+        load_staged_run(args.load_staged, "bigquery" if profile["target"] == "parquet" else profile["target"])
+    elif args.seed_daily:
+        seed_daily_state(args.seed_daily)
+    elif args.daily:
+        main_daily(args.date, args.signups, args.reconcile_ids, profile["target"], args.cprofile)
+    else:
+        run_profile(profile, args.reconcile_ids, args.cprofile, args.memory_report)
@@ -0,0 +1,89 @@
+import json
+import os
+from extract.config import PROFILES, DEFAULT_PROFILE, PROFILE_ENV_PREFIX, SEED
+
+TARGETS = {"bigquery", "duckdb", "parquet"}
+
+def parse_bool(value) -> bool:
+    """
+    Parse a boolean setting from an environment variable or a config file.
+    """
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in {"1", "true", "yes", "on"}:
+        return True
+    if str(value).strip().lower() in {"0", "false", "no", "off"}:
+        return False
+    raise ValueError(f"Not a boolean: {value!r}")
+
+# Settings of a profile and how to parse them from strings
+SETTINGS = {
+    "customers": int,
+    "chunk_size": int,
+    "workers": int,
+    "seed": int,
+    "stream": parse_bool,
+    "target": str,
+}
+
+def parse_settings(values: dict, source: str) -> dict:
+    """
+    Parse and check profile settings read from source (a file or the environment).
+    """
+    unknown = set(values) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown profile settings in {source}: {sorted(unknown)}")
+    return {key: SETTINGS[key](value) for key, value in values.items()}
+
+def load_profile_file(path) -> dict:
+    """
+    Read a JSON profile file.
+
+    The file may select a profile ("profile"), define or extend profiles
+    ("profiles": {name: settings}) and override settings at the top level:
+
+        {"profile": "100k", "workers": 2, "profiles": {"nightly": {"customers": 250000, ...}}}
+    """
+    with open(path) as f:
+        return json.load(f)
+
+def resolve_profile(name = None, path = None, overrides = None, env = None) -> dict:
+    """
+    Settings of a scale profile, with overrides applied.
+
+    Later sources win: the named profile from config.PROFILES (or from the file),
+    settings at the top level of the profile file, DATAFLOWIQ_* environment
+    variables, then overrides (command line flags; None values are ignored).
+    The profile name and file can also come from DATAFLOWIQ_PROFILE and
+    DATAFLOWIQ_CONFIG.
+
+    Returns:
+        dict: name, customers, chunk_size, workers, seed, stream and target.
+    """
+    env = os.environ if env is None else env
+    path = path or env.get(f"{PROFILE_ENV_PREFIX}CONFIG")
+    file_config = load_profile_file(path) if path else {}
+
+    profiles = {profile_name: dict(settings) for profile_name, settings in PROFILES.items()}
+    for profile_name, settings in file_config.get("profiles", {}).items():
+        profiles.setdefault(profile_name, {}).update(parse_settings(settings, path))
+
+    name = name or env.get(f"{PROFILE_ENV_PREFIX}PROFILE") or file_config.get("profile") or DEFAULT_PROFILE
+    if name not in profiles:
+        raise ValueError(f"Unknown scale profile {name!r}, expected one of {sorted(profiles)}")
+
+    profile = {"seed": SEED, **profiles[name]}
+    profile.update(parse_settings({key: value for key, value in file_config.items() if key not in {"profile", "profiles"}}, path))
+    profile.update(parse_settings({
+        key: env[f"{PROFILE_ENV_PREFIX}{key.upper()}"] for key in SETTINGS if f"{PROFILE_ENV_PREFIX}{key.upper()}" in env
+    }, "the environment"))
+    profile.update({key: value for key, value in (overrides or {}).items() if value is not None})
+
+    missing = set(SETTINGS) - set(profile)
+    if missing:
+        raise ValueError(f"Scale profile {name!r} does not set {sorted(missing)}")
+    if profile["target"] not in TARGETS:
+        raise ValueError(f"Unknown target {profile['target']!r}, expected one of {sorted(TARGETS)}")
+    if profile["customers"] < 1 or profile["chunk_size"] < 1 or profile["workers"] < 1:
+        raise ValueError("customers, chunk_size and workers must be positive")
+    return {"name": name, **profile}
@@ -0,0 +1,156 @@
+"""
+Billing cycle schedule precomputed as a calendar table.
+
+The date of a billing cycle only depends on the subscription's start date,
+the plan's billing period (monthly or yearly) and the cycle number, so the
+dates are computed once for every start day in START_DATE..END_DATE and then
+looked up with one array gather per column:
+
+    date of cycle n = first_day + offsets[yearly, start_date - first_day, n]
+
+Start days or cycle numbers outside the table fall back to computing the
+dates directly, and so do fixed-length cycles (see cycle_dates).
+
+Two billing calendars are supported (config.BILLING_CALENDAR):
+- "fixed": a cycle every MONTHLY_CYCLE_DAYS or YEARLY_CYCLE_DAYS days,
+- "calendar": the start date's day of every month (or year), moved to the last
+  day of shorter months: a subscription started on Jan 31 is billed on
+  Feb 28/29, Mar 31, Apr 30, ...
+"""
+from collections import namedtuple
+import numpy as np
+from extract.config import START_DATE, END_DATE, BILLING_CALENDAR, MONTHLY_CYCLE_DAYS, YEARLY_CYCLE_DAYS
+
+CALENDARS = {"fixed", "calendar"}
+
+Schedule = namedtuple("Schedule", [
+    "calendar",
+    # First start day in the table and number of start days
+    "first_day", "n_days",
+    # offsets[yearly, start day, cycle number]: days from first_day to the cycle date
+    "offsets",
+])
+
+# Schedules of the default window, per calendar, built on first use
+_default_schedules = {}
+
+def compute_cycle_dates(start, cycle_number, yearly, calendar = BILLING_CALENDAR) -> np.ndarray:
+    """
+    Date of cycle cycle_number (0 = the start date) of subscriptions starting
+    on start, computed directly. Arguments broadcast like NumPy arrays.
+
+    Args:
+        start (np.ndarray): Start dates (datetime64[D])
+        cycle_number (np.ndarray): Cycle numbers
+        yearly (np.ndarray): Whether the plan is billed yearly
+        calendar (str): "fixed" or "calendar" (see module docstring)
+
+    Returns:
+        np.ndarray: Cycle dates (datetime64[D])
+    """
+    start = np.asarray(start, dtype="datetime64[D]")
+    cycle_number = np.asarray(cycle_number, dtype=np.int64)
+    yearly = np.asarray(yearly, dtype=bool)
+    if calendar == "fixed":
+        cycle_days = np.where(yearly, YEARLY_CYCLE_DAYS, MONTHLY_CYCLE_DAYS)
+        return start + (cycle_number * cycle_days).astype("timedelta64[D]")
+    if calendar != "calendar":
+        raise ValueError(f"Unknown billing calendar {calendar!r}, expected one of {sorted(CALENDARS)}")
+
+    start_month = start.astype("datetime64[M]")
+    day_of_month = (start - start_month.astype("datetime64[D]")).astype(np.int64)
+    month = start_month + (cycle_number * np.where(yearly, 12, 1)).astype("timedelta64[M]")
+    month_days = ((month + 1).astype("datetime64[D]") - month.astype("datetime64[D]")).astype(np.int64)
+    dates = month.astype("datetime64[D]") + np.minimum(day_of_month, month_days - 1).astype("timedelta64[D]")
+    return np.where(np.isnat(start), np.datetime64("NaT", "D"), dates)
+
+def build_schedule(first_day = START_DATE, last_day = END_DATE, calendar = BILLING_CALENDAR) -> Schedule:
+    """
+    Precompute the cycle dates of subscriptions starting on each day of
+    first_day..last_day, for enough cycles to reach last_day.
+    """
+    if calendar not in CALENDARS:
+        raise ValueError(f"Unknown billing calendar {calendar!r}, expected one of {sorted(CALENDARS)}")
+    first = np.datetime64(first_day, "D")
+    n_days = int((np.datetime64(last_day, "D") - first).astype(np.int64)) + 1
+    # Cycles are at least 28 days apart, so this many reach last_day from any start day
+    n_cycles = n_days // 28 + 2
+
+    starts = first + np.arange(n_days).astype("timedelta64[D]")
+    cycle_number = np.arange(n_cycles)
+    offsets = np.stack([
+        (compute_cycle_dates(starts[:, None], cycle_number[None, :], yearly, calendar) - first).astype(np.int32)
+        for yearly in (False, True)
+    ])
+    return Schedule(calendar = calendar, first_day = first, n_days = n_days, offsets = offsets)
+
+def get_schedule(calendar = BILLING_CALENDAR) -> Schedule:
+    """
+    Schedule of START_DATE..END_DATE for a calendar, built once per calendar.
+    """
+    if calendar not in _default_schedules:
+        _default_schedules[calendar] = build_schedule(calendar = calendar)
+    return _default_schedules[calendar]
+
+def cycle_dates(start, cycle_number, yearly, calendar = BILLING_CALENDAR) -> np.ndarray:
+    """
+    Date of cycle cycle_number of subscriptions starting on start.
+
+    Calendar-month dates are gathered from the precomputed schedule (about ten
+    times faster than computing them). Fixed-length cycles are a single
+    multiply-add, which is cheaper than the lookup, so they are computed.
+
+    Args:
+        start (np.ndarray): Start dates (datetime64[D])
+        cycle_number (np.ndarray): Cycle numbers, one per start date
+        yearly (np.ndarray): Whether the plan is billed yearly, one per start date
+        calendar (str): "fixed" or "calendar" (see module docstring)
+
+    Returns:
+        np.ndarray: Cycle dates (datetime64[D])
+    """
+    if calendar == "fixed":
+        return compute_cycle_dates(start, cycle_number, yearly, calendar)
+    schedule = get_schedule(calendar)
+    start = np.asarray(start, dtype="datetime64[D]")
+    cycle_number = np.asarray(cycle_number, dtype=np.int64)
+    yearly = np.asarray(yearly, dtype=bool)
+
+    n_cycles = schedule.offsets.shape[2]
+    day = (start - schedule.first_day).astype(np.int64)
+    covered = ~np.isnat(start) & (day >= 0) & (day < schedule.n_days) & (cycle_number >= 0) & (cycle_number < n_cycles)
+    # Position in the flattened table: one 1-D gather is much cheaper than a 3-D fancy index
+    index = (yearly * schedule.n_days + day) * n_cycles + cycle_number
+    offsets = schedule.offsets.reshape(-1)
+    if covered.all():
+        return schedule.first_day + offsets[index].astype("timedelta64[D]")
+
+    dates = np.empty(len(start), dtype="datetime64[D]")
+    dates[covered] = schedule.first_day + offsets[index[covered]].astype("timedelta64[D]")
+    dates[~covered] = compute_cycle_dates(start[~covered], cycle_number[~covered], yearly[~covered], schedule.calendar)
+    return dates
+
+def count_cycles(start, last, yearly, calendar = BILLING_CALENDAR) -> np.ndarray:
+    """
+    Number of cycles dated start..last of each subscription (0 when last is
+    before start or either is NaT).
+
+    This is computed per subscription rather than per cycle, so it uses the
+    period arithmetic directly instead of the schedule table.
+    """
+    start = np.asarray(start, dtype="datetime64[D]")
+    last = np.asarray(last, dtype="datetime64[D]")
+    yearly = np.asarray(yearly, dtype=bool)
+    valid = ~np.isnat(start) & ~np.isnat(last) & (last >= start)
+    start = np.where(valid, start, np.datetime64(0, "D"))
+    last = np.where(valid, last, np.datetime64(0, "D"))
+
+    if calendar == "fixed":
+        cycle_days = np.where(yearly, YEARLY_CYCLE_DAYS, MONTHLY_CYCLE_DAYS)
+        n_cycles = (last - start).astype(np.int64) // cycle_days
+    else:
+        # Whole periods between the months, less one if that cycle falls after last
+        months = (last.astype("datetime64[M]") - start.astype("datetime64[M]")).astype(np.int64)
+        n_cycles = months // np.where(yearly, 12, 1)
+        n_cycles -= compute_cycle_dates(start, n_cycles, yearly, calendar) > last
+    return np.where(valid, n_cycles + 1, 0)
@@ -1,74 +1,109 @@
 # schema.py
-from google.cloud import bigquery
+from collections import namedtuple
 
-schemas = {
+# Plain description of a BigQuery column. Generation and staging only need
+# these; bigquery.SchemaField objects are built on first use of `schemas`, so
+# google.cloud.bigquery is only imported when something is loaded to BigQuery.
+FieldSpec = namedtuple("FieldSpec", ["name", "field_type", "mode", "description"])
+
+fields = {
     "customers": [
-        bigquery.SchemaField("customer_id", "INTEGER", mode="REQUIRED", description="Unique ID for each customer"),
-        bigquery.SchemaField("customer_name", "STRING", mode="REQUIRED", description="Full name of the customer"),
-        bigquery.SchemaField("customer_email", "STRING", mode="REQUIRED", description="Unique email address for each customer"),
-        bigquery.SchemaField("customer_address", "STRING", mode="NULLABLE", description="Mailing address (synthetic from Faker)"),
-        bigquery.SchemaField("payment_method", "STRING", mode="REQUIRED", description="Preferred payment method"),
+        FieldSpec("customer_id", "INTEGER", mode="REQUIRED", description="Unique ID for each customer"),
+        FieldSpec("customer_name", "STRING", mode="REQUIRED", description="Full name of the customer"),
+        FieldSpec("customer_email", "STRING", mode="REQUIRED", description="Unique email address for each customer"),
+        FieldSpec("customer_address", "STRING", mode="NULLABLE", description="Mailing address (synthetic from Faker)"),
+        FieldSpec("payment_method", "STRING", mode="REQUIRED", description="Preferred payment method"),
     ],
     "products": [
-        bigquery.SchemaField("product_id", "INTEGER", mode="REQUIRED", description="Unique ID for each product"),
-        bigquery.SchemaField("product_name", "STRING", mode="REQUIRED", description="Name of the product"),
-        bigquery.SchemaField("product_description", "STRING", mode="REQUIRED", description="Short description of the product"),
+        FieldSpec("product_id", "INTEGER", mode="REQUIRED", description="Unique ID for each product"),
+        FieldSpec("product_name", "STRING", mode="REQUIRED", description="Name of the product"),
+        FieldSpec("product_description", "STRING", mode="REQUIRED", description="Short description of the product"),
     ],
     "plans": [
-        bigquery.SchemaField("plan_id", "INTEGER", mode="REQUIRED", description="Unique ID for each plan"),
-        bigquery.SchemaField("product_id", "INTEGER", mode="REQUIRED", description="ID of the product this plan belongs to"),
-        bigquery.SchemaField("plan_name", "STRING", mode="REQUIRED", description="Name of the plan (e.g., Free, Pro, Premium)"),
-        bigquery.SchemaField("plan_price", "FLOAT", mode="REQUIRED", description="Price of the plan"),
-        bigquery.SchemaField("recurring", "STRING", mode="REQUIRED", description="Billing frequency of the plan"),
+        FieldSpec("plan_id", "INTEGER", mode="REQUIRED", description="Unique ID for each plan"),
+        FieldSpec("product_id", "INTEGER", mode="REQUIRED", description="ID of the product this plan belongs to"),
+        FieldSpec("plan_name", "STRING", mode="REQUIRED", description="Name of the plan (e.g., Free, Pro, Premium)"),
+        FieldSpec("plan_price", "FLOAT", mode="REQUIRED", description="Price of the plan"),
+        FieldSpec("recurring", "STRING", mode="REQUIRED", description="Billing frequency of the plan"),
     ],
     "subscriptions": [
-        bigquery.SchemaField("subscription_id", "INTEGER", mode="REQUIRED", description="Unique ID for each subscription record"),
-        bigquery.SchemaField("customer_id", "INTEGER", mode="REQUIRED", description="The customer associated with this subscription"),
-        bigquery.SchemaField("plan_id", "INTEGER", mode="REQUIRED", description="The plan this subscription belongs to"),
-        bigquery.SchemaField("start_date", "DATE", mode="REQUIRED", description="Date when the subscription started"),
-        bigquery.SchemaField("end_date", "DATE", mode="NULLABLE", description="Date when the subscription ended"),
-        bigquery.SchemaField("status", "STRING", mode="REQUIRED", description="Current status of the subscription"),
-        bigquery.SchemaField("cancel_date", "DATE", mode="NULLABLE", description="Date when the subscription was cancelled"),
+        FieldSpec("subscription_id", "INTEGER", mode="REQUIRED", description="Unique ID for each subscription record"),
+        FieldSpec("customer_id", "INTEGER", mode="REQUIRED", description="The customer associated with this subscription"),
+        FieldSpec("plan_id", "INTEGER", mode="REQUIRED", description="The plan this subscription belongs to"),
+        FieldSpec("start_date", "DATE", mode="REQUIRED", description="Date when the subscription started"),
+        FieldSpec("end_date", "DATE", mode="NULLABLE", description="Date when the subscription ended"),
+        FieldSpec("status", "STRING", mode="REQUIRED", description="Current status of the subscription"),
+        FieldSpec("cancel_date", "DATE", mode="NULLABLE", description="Date when the subscription was cancelled"),
     ],
     "discounts": [
-        bigquery.SchemaField("discount_id", "INTEGER", mode="REQUIRED", description="Unique ID for each discount or coupon"),
-        bigquery.SchemaField("discount_code", "STRING", mode="REQUIRED", description="Code entered by customer to apply discount"),
-        bigquery.SchemaField("discount_type", "STRING", mode="REQUIRED", description="Type of discount: percentage or fixed amount"),
-        bigquery.SchemaField("discount_value", "FLOAT", mode="REQUIRED", description="Value of the discount (percent or fixed amount)"),
-        bigquery.SchemaField("valid_from", "DATE", mode="REQUIRED", description="Start date when discount is valid"),
-        bigquery.SchemaField("valid_to", "DATE", mode="REQUIRED", description="End date when discount expires"),
-        bigquery.SchemaField("product_id", "INTEGER", mode="NULLABLE", description="Product the discount applies to"),
-        bigquery.SchemaField("plan_id", "INTEGER", mode="NULLABLE", description="Plan the discount applies to"),
-        bigquery.SchemaField("is_recurring", "BOOLEAN", mode="REQUIRED", description="Whether the discount applies on every billing cycle"),
+        FieldSpec("discount_id", "INTEGER", mode="REQUIRED", description="Unique ID for each discount or coupon"),
+        FieldSpec("discount_code", "STRING", mode="REQUIRED", description="Code entered by customer to apply discount"),
+        FieldSpec("discount_type", "STRING", mode="REQUIRED", description="Type of discount: percentage or fixed amount"),
+        FieldSpec("discount_value", "FLOAT", mode="REQUIRED", description="Value of the discount (percent or fixed amount)"),
+        FieldSpec("valid_from", "DATE", mode="REQUIRED", description="Start date when discount is valid"),
+        FieldSpec("valid_to", "DATE", mode="REQUIRED", description="End date when discount expires"),
+        FieldSpec("product_id", "INTEGER", mode="NULLABLE", description="Product the discount applies to"),
+        FieldSpec("plan_id", "INTEGER", mode="NULLABLE", description="Plan the discount applies to"),
+        FieldSpec("is_recurring", "BOOLEAN", mode="REQUIRED", description="Whether the discount applies on every billing cycle"),
     ],
     "subscription_discounts": [
-        bigquery.SchemaField("sub_discount_id", "INTEGER", mode="REQUIRED", description="Unique ID for each subscription-discount relationship"),
-        bigquery.SchemaField("subscription_id", "INTEGER", mode="REQUIRED", description="The subscription this discount is applied to"),
-        bigquery.SchemaField("discount_id", "INTEGER", mode="REQUIRED", description="The discount applied to the subscription"),
-        bigquery.SchemaField("applied_date", "DATE", mode="REQUIRED", description="Date when discount was applied"),
-        bigquery.SchemaField("expiry_date", "DATE", mode="NULLABLE", description="Date when discount expired"),
+        FieldSpec("sub_discount_id", "INTEGER", mode="REQUIRED", description="Unique ID for each subscription-discount relationship"),
+        FieldSpec("subscription_id", "INTEGER", mode="REQUIRED", description="The subscription this discount is applied to"),
+        FieldSpec("discount_id", "INTEGER", mode="REQUIRED", description="The discount applied to the subscription"),
+        FieldSpec("applied_date", "DATE", mode="REQUIRED", description="Date when discount was applied"),
+        FieldSpec("expiry_date", "DATE", mode="NULLABLE", description="Date when discount expired"),
     ],
     "invoices": [
-        bigquery.SchemaField("invoice_id", "INTEGER", mode="REQUIRED", description="Unique invoice ID"),
-        bigquery.SchemaField("subscription_id", "INTEGER", mode="REQUIRED", description="The subscription associated with this invoice"),
-        bigquery.SchemaField("invoice_date", "DATE", mode="REQUIRED", description="Date of the invoice"),
-        bigquery.SchemaField("total_due", "FLOAT", mode="REQUIRED", description="Total amount due for the invoice"),
-        bigquery.SchemaField("invoice_status", "STRING", mode="REQUIRED", description="Invoice payment status"),
+        FieldSpec("invoice_id", "INTEGER", mode="REQUIRED", description="Unique invoice ID"),
+        FieldSpec("subscription_id", "INTEGER", mode="REQUIRED", description="The subscription associated with this invoice"),
+        FieldSpec("invoice_date", "DATE", mode="REQUIRED", description="Date of the invoice"),
+        FieldSpec("total_due", "FLOAT", mode="REQUIRED", description="Total amount due for the invoice"),
+        FieldSpec("invoice_status", "STRING", mode="REQUIRED", description="Invoice payment status"),
     ],
     "line_items": [
-        bigquery.SchemaField("line_item_id", "INTEGER", mode="REQUIRED", description="Unique line item ID"),
-        bigquery.SchemaField("invoice_id", "INTEGER", mode="REQUIRED", description="Invoice associated with this line item"),
-        bigquery.SchemaField("plan_id", "INTEGER", mode="NULLABLE", description="Plan ID (NULL for discounts)"),
-        bigquery.SchemaField("description", "STRING", mode="REQUIRED", description="Description of the line item"),
-        bigquery.SchemaField("amount", "FLOAT", mode="REQUIRED", description="Amount for this line item"),
-        bigquery.SchemaField("line_type", "STRING", mode="REQUIRED", description="Type of line item"),
+        FieldSpec("line_item_id", "INTEGER", mode="REQUIRED", description="Unique line item ID"),
+        FieldSpec("invoice_id", "INTEGER", mode="REQUIRED", description="Invoice associated with this line item"),
+        FieldSpec("plan_id", "INTEGER", mode="NULLABLE", description="Plan ID (NULL for discounts)"),
+        FieldSpec("description", "STRING", mode="REQUIRED", description="Description of the line item"),
+        FieldSpec("amount", "FLOAT", mode="REQUIRED", description="Amount for this line item"),
+        FieldSpec("line_type", "STRING", mode="REQUIRED", description="Type of line item"),
     ],
     "payments": [
-        bigquery.SchemaField("payment_id", "INTEGER", mode="REQUIRED", description="Unique payment ID"),
-        bigquery.SchemaField("invoice_id", "INTEGER", mode="REQUIRED", description="Invoice associated with the payment"),
-        bigquery.SchemaField("payment_date", "DATE", mode="REQUIRED", description="Date of payment attempt"),
-        bigquery.SchemaField("amount_paid", "FLOAT", mode="REQUIRED", description="Amount actually paid"),
-        bigquery.SchemaField("payment_status", "STRING", mode="REQUIRED", description="payment status"),
-        bigquery.SchemaField("payment_method", "STRING", mode="REQUIRED", description="Payment method used"),
+        FieldSpec("payment_id", "INTEGER", mode="REQUIRED", description="Unique payment ID"),
+        FieldSpec("invoice_id", "INTEGER", mode="REQUIRED", description="Invoice associated with the payment"),
+        FieldSpec("payment_date", "DATE", mode="REQUIRED", description="Date of payment attempt"),
+        FieldSpec("amount_paid", "FLOAT", mode="REQUIRED", description="Amount actually paid"),
+        FieldSpec("payment_status", "STRING", mode="REQUIRED", description="payment status"),
+        FieldSpec("payment_method", "STRING", mode="REQUIRED", description="Payment method used"),
     ],
 }
+
+# Physical layout of the BigQuery tables: date partitioning (partition_type
+# DAY, MONTH or YEAR) and clustering. Queries filtering on the partition
+# column or the clustering columns only scan the matching blocks.
+TableLayout = namedtuple("TableLayout", ["partition_field", "partition_type", "clustering_fields"])
+
+layouts = {
+    "subscriptions": TableLayout(None, None, ["subscription_id", "customer_id"]),
+    "subscription_discounts": TableLayout(None, None, ["subscription_id"]),
+    "invoices": TableLayout("invoice_date", "MONTH", ["subscription_id", "invoice_id"]),
+    "line_items": TableLayout(None, None, ["invoice_id"]),
+    "payments": TableLayout("payment_date", "MONTH", ["invoice_id"]),
+}
+
+def __getattr__(name):
+    """
+    Build `schemas` (bigquery.SchemaField lists keyed by table name) on first access.
+    """
+    if name == "schemas":
+        from google.cloud import bigquery
+        global schemas
+        schemas = {
+            table_name: [
+                bigquery.SchemaField(field.name, field.field_type, mode=field.mode, description=field.description)
+                for field in table_fields
+            ]
+            for table_name, table_fields in fields.items()
+        }
+        return schemas
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
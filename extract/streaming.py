@@ -0,0 +1,157 @@
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from extract.config import CHUNK_SIZE, N_WORKERS, SEED, UNIQUE_KEYS, FOREIGN_KEYS, DYNAMIC_TABLES
+from extract.dtypes import compact_int
+from extract.data_generation import (
+    generate_customers,
+    generate_emails,
+    generate_subscriptions,
+    generate_subscription_discounts,
+    build_discount_index,
+    generate_payments_invoice,
+)
+
+def shift_ids(frames: dict, offsets: dict) -> dict:
+    """
+    Add a per-table offset to the primary keys and to every foreign key that
+    references an offset table (see config.FOREIGN_KEYS), in place. Keys are
+    widened to int64 before the offset is added, then compacted again.
+    Customer emails embed the customer_id (see generate_emails) and are
+    renumbered with it.
+    """
+    for table_name, df in frames.items():
+        if table_name in offsets:
+            df[UNIQUE_KEYS[table_name]] = compact_int(df[UNIQUE_KEYS[table_name]].astype(np.int64) + offsets[table_name])
+        if table_name == "customers" and table_name in offsets and len(df):
+            domain = df.customer_email.iloc[0].split("@", 1)[1]
+            df["customer_email"] = generate_emails(df.customer_name, df.customer_id, domain)
+        for column, ref_table in FOREIGN_KEYS.get(table_name, {}).items():
+            if ref_table in offsets:
+                df[column] = compact_int(df[column].astype(np.int64) + offsets[ref_table])
+    return frames
+
+def assign_ids(frames: dict, id_allocator) -> dict:
+    """
+    Move frames generated with local ids (starting at 1) into ranges reserved
+    from id_allocator, in place.
+    """
+    counts = {
+        table_name: int(df[UNIQUE_KEYS[table_name]].max()) if len(df) else 0
+        for table_name, df in frames.items()
+    }
+    starts = id_allocator.reserve_many(counts)
+    return shift_ids(frames, {table_name: start_id - 1 for table_name, start_id in starts.items()})
+
+def shard_rng(shard_index: int, seed: int = SEED) -> np.random.Generator:
+    """
+    Random generator for one shard, derived from the project seed and the shard
+    index only, so a shard's data does not depend on which worker builds it.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard_index,)))
+
+def generate_chunk(n: int, start_ids: dict, plans: pd.DataFrame, discounts: pd.DataFrame, rng: np.random.Generator = None) -> dict:
+    """
+    Generate n customers and all of their dependent records.
+
+    Args:
+        n (int): Number of customers in the chunk.
+        start_ids (dict): First id to use for each dynamic table, keyed by table name.
+        plans (pd.DataFrame): Plans dataset
+        discounts (pd.DataFrame): Discounts dataset
+        rng (np.random.Generator, optional): random generator shared by all generators
+
+    Returns:
+        dict: DataFrame per dynamic table, keyed by table name.
+    """
+    customers = generate_customers(n, start_id = start_ids["customers"], rng = rng)
+    subscriptions = generate_subscriptions(customers, plans, start_id = start_ids["subscriptions"], rng = rng)
+    subscription_discounts = generate_subscription_discounts(
+        subscriptions, plans, discounts, start_id = start_ids["subscription_discounts"], rng = rng
+    )
+    discount_index = build_discount_index(subscription_discounts, discounts)
+    invoices, line_items, payments = generate_payments_invoice(
+        subscriptions,
+        plans,
+        discounts,
+        subscription_discounts,
+        start_invoice_id = start_ids["invoices"],
+        start_pay_id = start_ids["payments"],
+        start_line_id = start_ids["line_items"],
+        discount_index = discount_index,
+        rng = rng,
+    )
+
+    return {
+        "customers": customers,
+        "subscriptions": subscriptions,
+        "subscription_discounts": subscription_discounts,
+        "invoices": invoices,
+        "line_items": line_items,
+        "payments": payments,
+    }
+
+def generate_shard(shard_index: int, n: int, plans: pd.DataFrame, discounts: pd.DataFrame, seed: int = SEED) -> dict:
+    """
+    Generate one shard of n customers with its own seeded generator.
+
+    Ids are local to the shard and start at 1 for every table; shift_ids moves
+    them into the shard's final id range once the shards before it are known.
+    """
+    local_ids = {table_name: 1 for table_name in DYNAMIC_TABLES}
+    return generate_chunk(n, local_ids, plans, discounts, rng = shard_rng(shard_index, seed))
+
+def _run_shards(shard_sizes, plans, discounts, workers, seed, first_shard = 0):
+    """
+    Generate shards in shard order, starting at first_shard. With several
+    workers, shards are built in a process pool with at most two shards per
+    worker in flight, so finished shards never pile up in memory faster than
+    they are consumed.
+    """
+    if workers <= 1:
+        for shard_index, n in itertools.islice(enumerate(shard_sizes), first_shard, None):
+            yield generate_shard(shard_index, n, plans, discounts, seed)
+        return
+
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        shards = itertools.islice(enumerate(shard_sizes), first_shard, None)
+        pending = deque(
+            pool.submit(generate_shard, shard_index, n, plans, discounts, seed)
+            for shard_index, n in itertools.islice(shards, 2 * workers)
+        )
+        while pending:
+            frames = pending.popleft().result()
+            for shard_index, n in itertools.islice(shards, 1):
+                pending.append(pool.submit(generate_shard, shard_index, n, plans, discounts, seed))
+            yield frames
+
+def iter_chunks(n_customers: int, id_allocator, plans: pd.DataFrame, discounts: pd.DataFrame, chunk_size: int = CHUNK_SIZE, workers: int = N_WORKERS, seed: int = SEED, first_chunk: int = 0):
+    """
+    Generate the dynamic tables in fixed-size customer chunks.
+
+    Each chunk is a shard seeded from seed and its position, and is generated
+    in a worker process when workers > 1. Chunks are yielded in order, and each
+    one then reserves its id ranges from id_allocator, so ids are contiguous
+    and the output is identical for any number of workers.
+
+    Args:
+        n_customers (int): Total number of customers to generate.
+        id_allocator (IdAllocator): Source of id ranges for the dynamic tables.
+        plans (pd.DataFrame): Plans dataset
+        discounts (pd.DataFrame): Discounts dataset
+        chunk_size (int): Customers per chunk.
+        workers (int): Worker processes used to generate chunks.
+        seed (int): Base seed for the per-chunk generators.
+        first_chunk (int): Number of leading chunks to skip (already generated by a resumed run).
+
+    Yields:
+        dict: DataFrame per dynamic table for one chunk.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+    shard_sizes = [min(chunk_size, n_customers - offset) for offset in range(0, n_customers, chunk_size)]
+    for frames in _run_shards(shard_sizes, plans, discounts, workers, seed, first_chunk):
+        yield assign_ids(frames, id_allocator)
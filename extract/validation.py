@@ -0,0 +1,186 @@
+"""
+Referential-integrity checks on generated tables, run before they are staged
+and loaded.
+
+Every check is column-wise: primary keys are checked on sorted NumPy arrays,
+foreign keys and per-invoice sums are resolved with pandas hash lookups
+(Index.get_indexer / isin), so tens of millions of rows take seconds.
+"""
+import logging
+import numpy as np
+import pandas as pd
+from extract.config import UNIQUE_KEYS, FOREIGN_KEYS, TOTAL_TOLERANCE
+from extract.data_generation import to_day_array
+
+# Examples of offending keys quoted per problem
+N_EXAMPLES = 5
+
+class IntegrityError(ValueError):
+    """
+    Raised by assert_valid; problems lists every failed check.
+    """
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__(f"{len(problems)} integrity check(s) failed:\n" + "\n".join(f"- {p}" for p in problems))
+
+def _examples(values) -> str:
+    return ", ".join(str(v) for v in np.asarray(values)[:N_EXAMPLES])
+
+def _lookup(keys, values) -> np.ndarray:
+    """
+    Position of every value in keys (a hash join on unique keys), -1 when missing.
+    """
+    return pd.Index(keys).get_indexer(values)
+
+def check_primary_keys(frames: dict) -> list:
+    """
+    Every table's key (config.UNIQUE_KEYS) is present and unique.
+    """
+    problems = []
+    for table_name, df in frames.items():
+        key = UNIQUE_KEYS.get(table_name)
+        if key is None or not len(df):
+            continue
+        values = df[key]
+        if values.isna().any():
+            problems.append(f"{table_name}.{key}: {int(values.isna().sum())} null keys")
+        ids = np.sort(values.dropna().to_numpy(dtype=np.int64))
+        duplicated = np.unique(ids[1:][ids[1:] == ids[:-1]])
+        if len(duplicated):
+            problems.append(f"{table_name}.{key}: {len(duplicated)} duplicated keys (e.g. {_examples(duplicated)})")
+    return problems
+
+def check_foreign_keys(frames: dict, reference = None, loaded_ids = None) -> list:
+    """
+    Every foreign key (config.FOREIGN_KEYS) resolves.
+
+    A key resolves when it is in the referenced table of frames or reference,
+    or is at most loaded_ids[table], the highest id of that table loaded by
+    earlier runs (daily runs reference subscriptions and invoices loaded
+    before). References to a table found in none of them are not checked.
+
+    Args:
+        frames (dict): Tables to check, keyed by table name
+        reference (dict, optional): Further tables keys may point to, e.g. the static tables
+        loaded_ids (dict, optional): Highest id already loaded per table (see IdAllocator.watermarks)
+    """
+    tables = {**(reference or {}), **frames}
+    loaded_ids = loaded_ids or {}
+    problems = []
+    for table_name, df in frames.items():
+        for column, ref_table in FOREIGN_KEYS.get(table_name, {}).items():
+            if not len(df) or (ref_table not in tables and ref_table not in loaded_ids):
+                continue
+            values = df[column].dropna().to_numpy(dtype=np.int64)
+            found = np.zeros(len(values), dtype=bool)
+            if ref_table in tables:
+                found |= pd.Series(values).isin(tables[ref_table][UNIQUE_KEYS[ref_table]].to_numpy(dtype=np.int64)).to_numpy()
+            if ref_table in loaded_ids:
+                found |= values <= loaded_ids[ref_table]
+            if not found.all():
+                missing = np.unique(values[~found])
+                problems.append(
+                    f"{table_name}.{column}: {int((~found).sum())} rows reference missing {ref_table} "
+                    f"(e.g. {_examples(missing)})"
+                )
+    return problems
+
+def check_dates(frames: dict) -> list:
+    """
+    Dates are in order: subscriptions end after they start, discounts expire
+    after they are applied, invoices fall within their subscription and
+    payments do not precede their invoice.
+    """
+    problems = []
+
+    def check(name, earlier, later, ids):
+        bad = ~np.isnat(earlier) & ~np.isnat(later) & (later < earlier)
+        if bad.any():
+            problems.append(f"{name}: {int(bad.sum())} rows out of order (e.g. {_examples(ids[bad])})")
+
+    subscriptions = frames.get("subscriptions")
+    if subscriptions is not None and len(subscriptions):
+        ids = subscriptions.subscription_id.to_numpy()
+        start = to_day_array(subscriptions.start_date)
+        check("subscriptions.end_date before start_date", start, to_day_array(subscriptions.end_date), ids)
+        check("subscriptions.cancel_date before start_date", start, to_day_array(subscriptions.cancel_date), ids)
+
+    subscription_discounts = frames.get("subscription_discounts")
+    if subscription_discounts is not None and len(subscription_discounts):
+        check(
+            "subscription_discounts.expiry_date before applied_date",
+            to_day_array(subscription_discounts.applied_date),
+            to_day_array(subscription_discounts.expiry_date),
+            subscription_discounts.sub_discount_id.to_numpy(),
+        )
+
+    invoices = frames.get("invoices")
+    if invoices is not None and len(invoices) and subscriptions is not None and len(subscriptions):
+        invoice_date = to_day_array(invoices.invoice_date)
+        row = _lookup(subscriptions.subscription_id.drop_duplicates(), invoices.subscription_id.to_numpy())
+        matched = row >= 0
+        unique_subs = subscriptions.drop_duplicates("subscription_id")
+        start = np.full(len(invoices), np.datetime64("NaT"), dtype="datetime64[D]")
+        end = start.copy()
+        start[matched] = to_day_array(unique_subs.start_date)[row[matched]]
+        end[matched] = to_day_array(unique_subs.end_date)[row[matched]]
+        ids = invoices.invoice_id.to_numpy()
+        check("invoices.invoice_date before subscription start_date", start, invoice_date, ids)
+        check("invoices.invoice_date after subscription end_date", invoice_date, end, ids)
+
+    payments = frames.get("payments")
+    if payments is not None and len(payments) and invoices is not None and len(invoices):
+        row = _lookup(invoices.invoice_id.drop_duplicates(), payments.invoice_id.to_numpy())
+        invoice_date = np.full(len(payments), np.datetime64("NaT"), dtype="datetime64[D]")
+        unique_invoices = invoices.drop_duplicates("invoice_id")
+        invoice_date[row >= 0] = to_day_array(unique_invoices.invoice_date)[row[row >= 0]]
+        check("payments.payment_date before invoice_date", invoice_date, to_day_array(payments.payment_date), payments.payment_id.to_numpy())
+    return problems
+
+def check_invoice_totals(frames: dict, tolerance = TOTAL_TOLERANCE) -> list:
+    """
+    Every invoice's total_due equals the sum of its line item amounts (within tolerance).
+    """
+    invoices, line_items = frames.get("invoices"), frames.get("line_items")
+    if invoices is None or line_items is None or not len(invoices):
+        return []
+    if not invoices.invoice_id.is_unique:
+        # Reported by check_primary_keys; totals are ambiguous
+        return []
+
+    row = _lookup(invoices.invoice_id, line_items.invoice_id.to_numpy())
+    in_batch = row >= 0
+    sums = np.bincount(row[in_batch], weights=line_items.amount.to_numpy(dtype=float)[in_batch], minlength=len(invoices))
+    bad = np.abs(invoices.total_due.to_numpy(dtype=float) - sums) > tolerance
+    if bad.any():
+        return [f"invoices.total_due: {int(bad.sum())} invoices differ from the sum of their line items (e.g. {_examples(invoices.invoice_id.to_numpy()[bad])})"]
+    return []
+
+def validate_tables(frames: dict, reference = None, loaded_ids = None) -> list:
+    """
+    Run every integrity check on a batch of tables.
+
+    Args:
+        frames (dict): Tables to check, keyed by table name
+        reference (dict, optional): Further tables foreign keys may point to (see check_foreign_keys)
+        loaded_ids (dict, optional): Highest id already loaded per table
+
+    Returns:
+        list: A message per failed check (empty when the batch is valid).
+    """
+    return (
+        check_primary_keys(frames)
+        + check_foreign_keys(frames, reference, loaded_ids)
+        + check_dates(frames)
+        + check_invoice_totals(frames)
+    )
+
+def assert_valid(frames: dict, reference = None, loaded_ids = None):
+    """
+    Run validate_tables and raise IntegrityError if any check fails.
+    """
+    problems = validate_tables(frames, reference, loaded_ids)
+    if problems:
+        raise IntegrityError(problems)
+    logging.info(f"Integrity checks passed for {sum(len(df) for df in frames.values())} rows in {len(frames)} tables")
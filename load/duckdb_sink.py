@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+import time
+import pyarrow.parquet as pq
+from extract import config
+from extract.schema import fields
+from load.staging import to_arrow
+
+# DuckDB column type for each BigQuery field type in extract/schema.py
+DUCKDB_TYPES = {
+    "INTEGER": "BIGINT",
+    "FLOAT": "DOUBLE",
+    "STRING": "VARCHAR",
+    "DATE": "DATE",
+    "BOOLEAN": "BOOLEAN",
+}
+
+# Shared connection, opened on first use
+_connection = None
+_lock = threading.Lock()
+
+def get_connection(path = config.DUCKDB_PATH):
+    """
+    Return the shared DuckDB connection to the local warehouse file, opening it on first use.
+
+    duckdb is an optional dependency, only imported when the duckdb target is used.
+    """
+    global _connection
+    with _lock:
+        if _connection is None:
+            try:
+                import duckdb
+            except ImportError as e:
+                raise ImportError("The duckdb target needs the duckdb package: pip install duckdb") from e
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok = True)
+            _connection = duckdb.connect(path)
+    return _connection
+
+def table_ddl(table_name, dataset = "raw_src") -> str:
+    """
+    CREATE TABLE statement for a table, derived from its fields in extract/schema.py.
+    """
+    columns = ",\n    ".join(
+        f"{field.name} {DUCKDB_TYPES[field.field_type]}{' NOT NULL' if field.mode == 'REQUIRED' else ''}"
+        for field in fields[table_name]
+    )
+    return f"CREATE TABLE IF NOT EXISTS {dataset}.{table_name} (\n    {columns}\n)"
+
+def create_tables(connection, tables = None, dataset = "raw_src"):
+    """
+    Create the dataset schema and every table in it that does not exist yet.
+    """
+    connection.execute(f"CREATE SCHEMA IF NOT EXISTS {dataset}")
+    for table_name in tables or fields:
+        connection.execute(table_ddl(table_name, dataset))
+
+def get_max_id(connection, table_name, project_id = "saas-pipeline", dataset = "raw_src"):
+    """
+    Fetch max unique id from the local table (0 when it is empty or missing).
+    """
+    create_tables(connection.cursor(), [table_name], dataset)
+    id_col = config.UNIQUE_KEYS[table_name]
+    return connection.cursor().execute(f"SELECT COALESCE(MAX({id_col}), 0) FROM {dataset}.{table_name}").fetchone()[0]
+
+def insert_arrow(connection, arrow_table, table_name, dataset = "raw_src") -> int:
+    """
+    Append an Arrow table to a DuckDB table.
+
+    The Arrow table is registered as a view and scanned in place by DuckDB, so
+    the data is not copied through Python. Static tables are replaced instead
+    of appended to, in the same transaction.
+
+    Returns:
+        int: Rows written.
+    """
+    cursor = connection.cursor()
+    create_tables(cursor, [table_name], dataset)
+    columns = ", ".join(field.name for field in fields[table_name])
+
+    cursor.register("incoming", arrow_table)
+    cursor.execute("BEGIN TRANSACTION")
+    try:
+        if table_name in config.STATIC_TABLES:
+            cursor.execute(f"DELETE FROM {dataset}.{table_name}")
+        cursor.execute(f"INSERT INTO {dataset}.{table_name} ({columns}) SELECT {columns} FROM incoming")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    finally:
+        cursor.unregister("incoming")
+    return arrow_table.num_rows
+
+def load_to_duckdb(df, table_name, project_id = "saas-pipeline", dataset = "raw_src", client = None):
+    """
+    Appends a pandas DataFrame to a table of the local DuckDB warehouse.
+    Same signature as load_to_biquery; client is a DuckDB connection.
+    """
+    connection = client or get_connection()
+    start_time = time.perf_counter()
+    rows = insert_arrow(connection, to_arrow(df, table_name), table_name, dataset)
+    logging.info(f"Loaded {rows} rows into duckdb {dataset}.{table_name} |Duration: {time.perf_counter() - start_time: .2f} sec")
+    return rows
+
+def load_staged_to_duckdb(paths, table_name, project_id = "saas-pipeline", dataset = "raw_src", client = None):
+    """
+    Loads staged Parquet parts (see load/staging.py) into a table of the local
+    DuckDB warehouse. Same signature as load_staged_to_biquery.
+    """
+    if not paths:
+        return 0
+    connection = client or get_connection()
+    start_time = time.perf_counter()
+    arrow_table = pq.ParquetDataset(paths).read()
+    rows = insert_arrow(connection, arrow_table, table_name, dataset)
+    logging.info(f"Loaded {rows} rows into duckdb {dataset}.{table_name} from {len(paths)} staged files |Duration: {time.perf_counter() - start_time: .2f} sec")
+    return rows
@@ -0,0 +1,111 @@
+import threading
+import time
+import pyarrow.parquet as pq
+from types import SimpleNamespace
+
+
+class FakeLoadJob:
+    """
+    Completed load job returned by FakeClient.
+    """
+
+    def __init__(self, output_rows):
+        self.output_rows = output_rows
+        self.errors = None
+
+    def result(self):
+        return self
+
+
+class FakeQueryJob:
+    """
+    Query job returned by FakeClient, yielding a single result row.
+    """
+
+    def __init__(self, row):
+        self._row = row
+
+    def result(self):
+        return [self._row]
+
+
+class FakeClient:
+    """
+    In-memory stand-in for bigquery.Client, for running loads without network
+    access or credentials.
+
+    Loaded DataFrames are kept per table id in self.tables, tables created
+    with create_table (schema, partitioning, clustering) in self.definitions,
+    and every load job as (table_id, rows, write_disposition) in self.loads
+    with its job config in self.job_configs. Only the MAX(id) query issued by
+    load/load_to_bq.py (get_max_id) is supported; any other query raises.
+
+    Args:
+        latency (float): Seconds each load job takes, to simulate warehouse round trips.
+    """
+
+    def __init__(self, latency = 0.0):
+        self.latency = latency
+        self.tables = {}
+        self.loads = []
+        self.job_configs = []
+        self.definitions = {}
+        self._lock = threading.Lock()
+
+    def _rows(self, table_id):
+        with self._lock:
+            return list(self.tables.get(table_id, []))
+
+    def query(self, query):
+        table_id = query.split("`")[1]
+        frames = self._rows(table_id)
+        if "MAX(" in query:
+            column = query.split("MAX(")[1].split(")")[0]
+            max_id = max((int(df[column].max()) for df in frames if len(df)), default = 0)
+            return FakeQueryJob(SimpleNamespace(max_id = max_id))
+        raise NotImplementedError(f"FakeClient does not support query: {query}")
+
+    def get_table(self, table_id):
+        with self._lock:
+            if table_id in self.definitions:
+                return self.definitions[table_id]
+        from google.api_core.exceptions import NotFound
+        raise NotFound(f"Table {table_id} not found")
+
+    def create_table(self, table, exists_ok = False):
+        table_id = f"{table.project}.{table.dataset_id}.{table.table_id}"
+        with self._lock:
+            if table_id in self.definitions and not exists_ok:
+                from google.api_core.exceptions import Conflict
+                raise Conflict(f"Table {table_id} already exists")
+            self.definitions.setdefault(table_id, table)
+            return self.definitions[table_id]
+
+    def _check_partitioning(self, table_id, job_config):
+        """
+        Reject a job whose partitioning differs from the existing table's, as BigQuery does.
+        """
+        partitioning = getattr(job_config, "time_partitioning", None)
+        table = self.definitions.get(table_id)
+        if partitioning is None or table is None:
+            return
+        existing = getattr(table, "time_partitioning", None)
+        if existing is None or existing.field != partitioning.field or existing.type_ != partitioning.type_:
+            from google.api_core.exceptions import BadRequest
+            raise BadRequest(f"Incompatible table partitioning specification for {table_id}")
+
+    def load_table_from_dataframe(self, df, table_id, job_config = None):
+        if self.latency:
+            time.sleep(self.latency)
+        write_disposition = getattr(job_config, "write_disposition", None)
+        with self._lock:
+            self._check_partitioning(table_id, job_config)
+            if write_disposition == "WRITE_TRUNCATE":
+                self.tables[table_id] = []
+            self.tables.setdefault(table_id, []).append(df)
+            self.loads.append((table_id, len(df), write_disposition))
+            self.job_configs.append((table_id, job_config))
+        return FakeLoadJob(len(df))
+
+    def load_table_from_file(self, file_obj, table_id, job_config = None):
+        return self.load_table_from_dataframe(pq.read_table(file_obj).to_pandas(), table_id, job_config)
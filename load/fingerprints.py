@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import threading
+import pyarrow.parquet as pq
+from extract import config
+from load.staging import to_arrow
+
+# Loads run in parallel threads; serialise writes to the fingerprint file
+_lock = threading.Lock()
+
+def fingerprint(table) -> str:
+    """
+    Content hash of an Arrow table: column names, types and every value.
+
+    Static tables are small, so the table is hashed through its CSV text,
+    which is stable across runs and pandas/pyarrow versions.
+    """
+    h = hashlib.sha256()
+    h.update(str(table.schema).encode())
+    h.update(table.to_pandas().to_csv(index = False).encode())
+    return h.hexdigest()
+
+def dataframe_fingerprint(df, table_name) -> str:
+    """
+    Fingerprint of a generated DataFrame, after conversion to the table's schema.
+    """
+    return fingerprint(to_arrow(df, table_name))
+
+def staged_fingerprint(paths) -> str:
+    """
+    Fingerprint of a table staged as Parquet parts.
+    """
+    return fingerprint(pq.read_table(paths[0]) if len(paths) == 1 else pq.ParquetDataset(paths).read())
+
+
+class FingerprintStore:
+    """
+    Last loaded content hash of each static table, kept in a local JSON file
+    and keyed by BigQuery table id.
+    """
+
+    def __init__(self, path = os.path.join(config.STATE_DIR, "static_fingerprints.json")):
+        self.path = path
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get(self, table_id):
+        return self._read().get(table_id)
+
+    def record(self, table_id, digest):
+        """
+        Store the fingerprint of a table that has just been loaded.
+        """
+        with _lock:
+            fingerprints = self._read()
+            fingerprints[table_id] = digest
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok = True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(fingerprints, f, indent = 2, sort_keys = True)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,119 @@
+import logging
+import os
+import sqlite3
+from extract import config
+
+
+class IdAllocator:
+    """
+    Per-table id high-water marks kept in a local SQLite file.
+
+    Each dynamic table (keyed as in config.UNIQUE_KEYS) has a watermark: the
+    highest id handed out so far. Ranges are reserved inside one SQLite
+    transaction, so concurrent runs never receive overlapping ids. The warehouse
+    is only queried when reconcile() is called.
+
+    Args:
+        path (str, optional): SQLite file holding the watermarks. None keeps them in memory.
+        start_ids (dict, optional): First id to hand out per table, for new stores.
+    """
+
+    def __init__(self, path = os.path.join(config.STATE_DIR, "id_watermarks.sqlite"), start_ids = None):
+        self.path = path
+        self.is_new = path is None or not os.path.exists(path)
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        self._conn = sqlite3.connect(path or ":memory:", isolation_level = None, timeout = 30)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS watermarks (table_name TEXT PRIMARY KEY, max_id INTEGER NOT NULL)")
+        for table_name, start_id in (start_ids or {}).items():
+            self._conn.execute(
+                "INSERT OR IGNORE INTO watermarks (table_name, max_id) VALUES (?, ?)", (table_name, start_id - 1)
+            )
+
+    def _check_table(self, table_name):
+        if table_name not in config.UNIQUE_KEYS:
+            raise KeyError(f"Unknown table {table_name!r}; expected one of {sorted(config.UNIQUE_KEYS)}")
+
+    def watermarks(self) -> dict:
+        """
+        Return the highest id handed out so far for every known table.
+        """
+        return dict(self._conn.execute("SELECT table_name, max_id FROM watermarks"))
+
+    def peek(self, table_name) -> int:
+        """
+        Return the next id for table_name without reserving it.
+        """
+        self._check_table(table_name)
+        return self.watermarks().get(table_name, 0) + 1
+
+    def reserve_many(self, counts: dict) -> dict:
+        """
+        Atomically reserve count ids for each table.
+
+        Args:
+            counts (dict): Number of ids to reserve, keyed by table name.
+
+        Returns:
+            dict: First id of each reserved range, keyed by table name.
+        """
+        for table_name in counts:
+            self._check_table(table_name)
+
+        starts = {}
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = self.watermarks()
+            for table_name, count in counts.items():
+                if count < 0:
+                    raise ValueError(f"Cannot reserve {count} ids for {table_name}")
+                max_id = current.get(table_name, 0)
+                starts[table_name] = max_id + 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO watermarks (table_name, max_id) VALUES (?, ?)", (table_name, max_id + count)
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return starts
+
+    def reserve(self, table_name, count) -> int:
+        """
+        Atomically reserve count ids for table_name and return the first one.
+        """
+        return self.reserve_many({table_name: count})[table_name]
+
+    def reconcile(self, client, tables = config.DYNAMIC_TABLES, project_id = "saas-pipeline", dataset = "raw_src", max_id_fn = None) -> dict:
+        """
+        Raise local watermarks to the maximum ids stored in the warehouse.
+
+        Watermarks never move backwards, so ids reserved locally but not yet
+        loaded stay reserved. max_id_fn reads a table's maximum id from the
+        warehouse (default: load_to_bq.get_max_id).
+
+        Returns:
+            dict: Updated watermarks.
+        """
+        if max_id_fn is None:
+            from load.load_to_bq import get_max_id as max_id_fn
+
+        warehouse = {table_name: max_id_fn(client, table_name, project_id, dataset) for table_name in tables}
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = self.watermarks()
+            for table_name, max_id in warehouse.items():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO watermarks (table_name, max_id) VALUES (?, ?)",
+                    (table_name, max(current.get(table_name, 0), int(max_id))),
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+        logging.info(f"Reconciled id watermarks with {project_id}.{dataset}: {self.watermarks()}")
+        return self.watermarks()
+
+    def close(self):
+        self._conn.close()
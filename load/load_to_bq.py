@@ -1,13 +1,38 @@
-import pandas as pd
+import io
 import logging 
+import math
+import os
+import threading
 import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from extract import config
-from extract.schema import schemas
-from google.cloud import bigquery
+from extract import schema as bq_schema
+from load.staging import staged_row_count
+from load.fingerprints import FingerprintStore, dataframe_fingerprint, staged_fingerprint
+
+# google.cloud.bigquery is imported inside the functions that need it, so
+# generating and staging data does not pay for importing it.
+
 
+# Shared client, created on first use
+_client = None
 
-# Init client
-client = bigquery.Client()
+# Tables already checked or created by ensure_table in this process, per client
+_provisioned = set()
+_provision_lock = threading.Lock()
+
+def get_client():
+    """
+    Return the shared BigQuery client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        from google.cloud import bigquery
+        _client = bigquery.Client()
+    return _client
 
 def get_max_id(client, table_name, project_id = "saas-pipeline", dataset = "raw_src"):
     """
@@ -20,52 +45,162 @@ def get_max_id(client, table_name, project_id = "saas-pipeline", dataset = "raw_
     result = list(client.query(query).result())[0]
     return result.max_id
 
-def load_to_biquery(df, table_name, project_id = "saas-pipeline", dataset = "raw_src"):
+def table_definition(table_name, project_id = "saas-pipeline", dataset = "raw_src"):
     """
-    Appends a pandas DataFrame to bigquery table.
+    bigquery.Table for a table: its schema, date partitioning and clustering
+    as declared in extract/schema.py.
     """
+    from google.cloud import bigquery
+    table = bigquery.Table(f"{project_id}.{dataset}.{table_name}", schema = bq_schema.schemas[table_name])
+    layout = bq_schema.layouts.get(table_name)
+    if layout is not None:
+        if layout.partition_field:
+            table.time_partitioning = bigquery.TimePartitioning(type_ = layout.partition_type, field = layout.partition_field)
+        if layout.clustering_fields:
+            table.clustering_fields = layout.clustering_fields
+    return table
+
+def ensure_table(client, table_name, project_id = "saas-pipeline", dataset = "raw_src"):
+    """
+    Create a table with its partitioning and clustering (see table_definition)
+    unless it exists. Each table is checked once per client and process.
+
+    Partitioning cannot be added to an existing table, so a table created
+    before it was declared is reported and keeps loading unpartitioned;
+    recreate it to partition it.
+    """
+    from google.api_core.exceptions import NotFound
     table_id = f"{project_id}.{dataset}.{table_name}"
-    schema = schemas[table_name]
+    with _provision_lock:
+        if (id(client), table_id) in _provisioned:
+            return
+
+    layout = bq_schema.layouts.get(table_name)
+    try:
+        table = client.get_table(table_id)
+        if layout is not None and layout.partition_field:
+            partitioning = getattr(table, "time_partitioning", None)
+            if partitioning is None or partitioning.field != layout.partition_field:
+                logging.warning(f"{table_id} exists without partitioning on {layout.partition_field}; loading into it as is, recreate it to partition it")
+    except NotFound:
+        client.create_table(table_definition(table_name, project_id, dataset), exists_ok = True)
+        logging.info(f"Created {table_id} (partitioning: {layout.partition_field if layout else None}, clustering: {layout.clustering_fields if layout else None})")
+
+    with _provision_lock:
+        _provisioned.add((id(client), table_id))
 
-    job_config = bigquery.LoadJobConfig(
-        schema = schema,
-        create_disposition = "CREATE_IF_NEEDED"
+def load_job_config(table_name, write_disposition, **kwargs):
+    """
+    LoadJobConfig for a table, carrying its schema.
+
+    Partitioning and clustering are set when ensure_table creates the table,
+    not on the load jobs: BigQuery rejects a job whose partitioning differs
+    from the destination's, which would fail every append to a table created
+    before its layout was declared.
+    """
+    from google.cloud import bigquery
+    return bigquery.LoadJobConfig(
+        schema = bq_schema.schemas[table_name],
+        create_disposition = "CREATE_IF_NEEDED",
+        write_disposition = write_disposition,
+        **kwargs,
     )
 
+def split_frame(df, max_bytes = None) -> list:
+    """
+    Split a DataFrame into consecutive row batches of at most about max_bytes
+    (default config.LOAD_BATCH_BYTES) in memory.
+    """
+    max_bytes = max_bytes or config.LOAD_BATCH_BYTES
+    n_batches = max(1, math.ceil(df.memory_usage(deep = True).sum() / max_bytes))
+    bounds = np.linspace(0, len(df), n_batches + 1).astype(int)
+    return [df.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+def staged_sources(paths, max_bytes = None):
+    """
+    Yield the source file of each load job for staged Parquet parts.
+
+    A part of at most max_bytes (default config.LOAD_BATCH_BYTES) is sent
+    straight from disk. A bigger part is split into row batches of about
+    max_bytes each, written to in-memory Parquet files.
+    """
+    max_bytes = max_bytes or config.LOAD_BATCH_BYTES
+    for path in paths:
+        size = os.path.getsize(path)
+        parquet_file = pq.ParquetFile(path)
+        if size <= max_bytes:
+            with open(path, "rb") as source_file:
+                yield source_file
+            continue
+
+        batch_rows = max(1, math.ceil(parquet_file.metadata.num_rows * max_bytes / size))
+        for batch in parquet_file.iter_batches(batch_size = batch_rows):
+            buffer = io.BytesIO()
+            pq.write_table(pa.Table.from_batches([batch]), buffer, compression = config.STAGE_COMPRESSION)
+            buffer.seek(0)
+            yield buffer
+
+def choose_write_disposition(table_name, table_id, digest = None, fingerprints = None):
+    """
+    Decide how to write a table: WRITE_APPEND for dynamic tables, WRITE_TRUNCATE
+    for a static table whose content changed since it was last loaded, or None
+    when a static table is unchanged.
+
+    Static tables are compared by content hash (digest) against the local
+    fingerprint store, so no warehouse query is needed.
+    """
     # deciding if to load static tables (products, plans, and discounts) or no 
     if table_name in config.STATIC_TABLES:
-        # compare row counts
-        query = f"SELECT COUNT(*) AS cnt FROM `{table_id}`"
-        result = list(client.query(query).result())[0]
-        bq_count = result.cnt
-        local_count = len(df)
-        
-        # Checking if a new product / plan / discount has been added, if yes append to existing table
-        if bq_count != local_count:
-            job_config.write_disposition = "WRITE_TRUNCATE"
-            print(f"Updating static table {table_name} from {bq_count} rows to {local_count} rows")
+        fingerprints = fingerprints or FingerprintStore()
 
         # If no change then do not load any data
-        else:
+        if fingerprints.get(table_id) == digest:
             print(f"No changes in {table_name}, skipping load")
-            return 0
-    else:
-        job_config.write_disposition = 'WRITE_APPEND'
-    
+            return None
+
+        # Any edit (new rows, changed prices or discounts) replaces the table
+        print(f"Content of static table {table_name} changed, replacing it")
+        return "WRITE_TRUNCATE"
+
+    return "WRITE_APPEND"
+
+def load_to_biquery(df, table_name, project_id = "saas-pipeline", dataset = "raw_src", client = None):
+    """
+    Appends a pandas DataFrame to bigquery table.
+    Uses the shared client unless one is given.
+
+    The table is created with its partitioning and clustering if needed; a
+    DataFrame bigger than config.LOAD_BATCH_BYTES is sent as several load jobs.
+    """
+    client = client or get_client()
+    table_id = f"{project_id}.{dataset}.{table_name}"
+
+    digest = dataframe_fingerprint(df, table_name) if table_name in config.STATIC_TABLES else None
+    write_disposition = choose_write_disposition(table_name, table_id, digest)
+    if write_disposition is None:
+        return 0
+
     start_time = time.perf_counter()
     try:
-        logging.info(f"Starting load for {table_id} | {len(df)} rows ")
-        job = client.load_table_from_dataframe(df, table_id, job_config = job_config)
-        result = job.result()
-        print("BigQuery inserted rows:", result.output_rows)
-        print(f"Loaded {result.output_rows} rows into {table_id}")
-        print("Errors:", job.errors)
+        ensure_table(client, table_name, project_id, dataset)
+        batches = split_frame(df)
+        logging.info(f"Starting load for {table_id} | {len(df)} rows in {len(batches)} load jobs")
+        for part, batch in enumerate(batches):
+            # Only the first job may truncate; the others add to it
+            job_config = load_job_config(table_name, write_disposition if part == 0 else "WRITE_APPEND")
+            job = client.load_table_from_dataframe(batch, table_id, job_config = job_config)
+            result = job.result()
+            print(f"Loaded {result.output_rows} rows into {table_id}")
+            if job.errors:
+                print("Errors:", job.errors)
 
         duration = time.perf_counter() - start_time
         logging.info(
             f"Loaded {len(df)} rows into {table_id} |"
             f"Duration: {duration: .2f} sec"
             )
+        if digest is not None:
+            FingerprintStore().record(table_id, digest)
         return len(df)
         
     except Exception as e:
@@ -73,3 +208,51 @@ def load_to_biquery(df, table_name, project_id = "saas-pipeline", dataset = "raw
         logging.error(f"Failed to load {table_name} after {duration: .2f} sec: {e}", exc_info = True)
         raise
 
+def load_staged_to_biquery(paths, table_name, project_id = "saas-pipeline", dataset = "raw_src", client = None):
+    """
+    Loads staged Parquet parts (see load/staging.py) into a bigquery table.
+
+    Each part is sent as its own Parquet load job straight from disk, so the
+    data is not re-serialized from pandas and the load can be retried from
+    the same files. Parts bigger than config.LOAD_BATCH_BYTES are split into
+    several load jobs (see staged_sources).
+    """
+    from google.cloud import bigquery
+    client = client or get_client()
+    table_id = f"{project_id}.{dataset}.{table_name}"
+    local_count = staged_row_count(paths)
+
+    digest = staged_fingerprint(paths) if table_name in config.STATIC_TABLES else None
+    write_disposition = choose_write_disposition(table_name, table_id, digest)
+    if write_disposition is None:
+        return 0
+
+    start_time = time.perf_counter()
+    try:
+        ensure_table(client, table_name, project_id, dataset)
+        logging.info(f"Starting load for {table_id} | {local_count} rows from {len(paths)} staged files")
+        for part, source_file in enumerate(staged_sources(paths)):
+            job_config = load_job_config(
+                table_name,
+                # Only the first job may truncate; the others add to it
+                write_disposition if part == 0 else "WRITE_APPEND",
+                source_format = bigquery.SourceFormat.PARQUET,
+            )
+            job = client.load_table_from_file(source_file, table_id, job_config = job_config)
+            job.result()
+            if job.errors:
+                print("Errors:", job.errors)
+
+        duration = time.perf_counter() - start_time
+        logging.info(
+            f"Loaded {local_count} rows into {table_id} |"
+            f"Duration: {duration: .2f} sec"
+            )
+        if digest is not None:
+            FingerprintStore().record(table_id, digest)
+        return local_count
+
+    except Exception as e:
+        duration = time.perf_counter() - start_time
+        logging.error(f"Failed to load {table_name} after {duration: .2f} sec: {e}", exc_info = True)
+        raise
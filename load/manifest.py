@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from datetime import datetime
+from extract import config
+
+class RunManifest:
+    """
+    Checkpoints of one pipeline run, kept next to its staged files in
+    <staging_dir>/<run_id>/manifest.json.
+
+    The manifest records the run's settings, every staged Parquet part, every
+    part loaded to the target and every finished stage, and is rewritten
+    atomically after each change. A failed run can then be resumed (see
+    extract/main.py --resume): generation is skipped for the staged parts and
+    only the parts that have not loaded yet are loaded.
+
+    Args:
+        run_id (str): Identifier of the run.
+        data (dict, optional): Manifest content read back by load().
+        staging_dir (str): Root of the staging area.
+    """
+
+    def __init__(self, run_id, data = None, staging_dir = config.STAGING_DIR):
+        self.run_id = run_id
+        self.path = os.path.join(staging_dir, run_id, "manifest.json")
+        self.data = data or {
+            "run_id": run_id,
+            "mode": None,
+            "settings": {},
+            "status": "running",
+            "staged": {},
+            "loaded": {},
+            "stages": [],
+        }
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, run_id, mode, settings, staging_dir = config.STAGING_DIR):
+        """
+        Start the manifest of a new run, e.g. mode="batch" with its main() arguments as settings.
+        """
+        manifest = cls(run_id, staging_dir = staging_dir)
+        manifest.data.update({"mode": mode, "settings": settings, "created": datetime.now().isoformat(timespec = "seconds")})
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, run_id, staging_dir = config.STAGING_DIR):
+        """
+        Read the manifest of an earlier run.
+        """
+        path = os.path.join(staging_dir, run_id, "manifest.json")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No manifest for run {run_id!r} in {staging_dir}")
+        with open(path) as f:
+            return cls(run_id, json.load(f), staging_dir)
+
+    def save(self):
+        """
+        Write the manifest next to its final path first, so a crash never leaves a partial file.
+        """
+        with self._lock:
+            self.data["updated"] = datetime.now().isoformat(timespec = "seconds")
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f, indent = 2)
+            os.replace(tmp_path, self.path)
+
+    def mark_staged(self, staged: dict):
+        """
+        Record staged Parquet parts, keyed by table name.
+        """
+        with self._lock:
+            for table_name, paths in staged.items():
+                known = self.data["staged"].setdefault(table_name, [])
+                known.extend(path for path in paths if path not in known)
+        self.save()
+
+    def mark_loaded(self, table_name, paths):
+        """
+        Record staged parts of a table that have loaded to the target.
+        """
+        with self._lock:
+            known = self.data["loaded"].setdefault(table_name, [])
+            known.extend(path for path in paths if path not in known)
+        self.save()
+
+    def mark_done(self, stage):
+        """
+        Record a finished stage, e.g. "generate", "mrr" or "chunk-3".
+        """
+        with self._lock:
+            if stage not in self.data["stages"]:
+                self.data["stages"].append(stage)
+        self.save()
+
+    def done(self, stage) -> bool:
+        return stage in self.data["stages"]
+
+    def complete(self):
+        """
+        Mark the whole run as finished.
+        """
+        self.data["status"] = "complete"
+        self.save()
+
+    @property
+    def settings(self) -> dict:
+        return self.data["settings"]
+
+    @property
+    def staged(self) -> dict:
+        return self.data["staged"]
+
+    def pending(self, staged = None) -> dict:
+        """
+        Staged parts (of staged, default every part of the run) that have not loaded yet.
+        """
+        staged = self.data["staged"] if staged is None else staged
+        loaded = self.data["loaded"]
+        pending = {
+            table_name: [path for path in paths if path not in loaded.get(table_name, [])]
+            for table_name, paths in staged.items()
+        }
+        return {table_name: paths for table_name, paths in pending.items() if paths}
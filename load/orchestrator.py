@@ -0,0 +1,78 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from load.load_to_bq import load_to_biquery
+
+def load_tables(frames: dict, client = None, max_workers: int = 4, depends_on: dict = None, project_id = "saas-pipeline", dataset = "raw_src", load_fn = load_to_biquery) -> dict:
+    """
+    Load several tables concurrently with a bounded thread pool.
+
+    All loads are submitted at once unless depends_on says otherwise: a table
+    listed there only starts after every table it depends on has loaded. If a
+    load fails, the tables depending on it are skipped, the remaining loads
+    still finish, and the first error is raised at the end.
+
+    Args:
+        frames (dict): Data per table, keyed by table name: a DataFrame, or a list of
+                       staged Parquet files with load_fn=load_staged_to_biquery.
+        client (optional): BigQuery client (or load.fake_bigquery.FakeClient).
+                           Defaults to the shared client.
+        max_workers (int): Maximum number of load jobs running at once.
+        depends_on (dict, optional): Table name -> tables that must load first.
+        load_fn (callable): Function loading one table, with load_to_biquery's signature.
+
+    Returns:
+        dict: Per table, the rows loaded and the load duration in seconds.
+    """
+    depends_on = {table_name: set(deps) & set(frames) for table_name, deps in (depends_on or {}).items()}
+    unknown = set(depends_on) - set(frames)
+    if unknown:
+        raise ValueError(f"Dependencies declared for tables that are not being loaded: {sorted(unknown)}")
+
+    results, errors = {}, {}
+    waiting = set(frames)
+    running = {}
+
+    def timed_load(table_name):
+        start_time = time.perf_counter()
+        rows = load_fn(frames[table_name], table_name, project_id, dataset, client = client)
+        return {"rows": rows, "seconds": time.perf_counter() - start_time}
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = max_workers) as pool:
+        while waiting or running:
+            # Submit every table whose dependencies have all loaded; skip those whose dependencies failed
+            for table_name in sorted(waiting):
+                deps = depends_on.get(table_name, set())
+                if deps & (set(errors) | {t for t, r in results.items() if r.get("skipped")}):
+                    results[table_name] = {"rows": 0, "seconds": 0.0, "skipped": True}
+                    waiting.discard(table_name)
+                    logging.warning(f"Skipping load of {table_name}: a dependency failed")
+                elif deps <= set(results):
+                    running[pool.submit(timed_load, table_name)] = table_name
+                    waiting.discard(table_name)
+
+            if not running:
+                if waiting:
+                    raise ValueError(f"Circular load dependencies between: {sorted(waiting)}")
+                break
+
+            done, _ = wait(running, return_when = FIRST_COMPLETED)
+            for future in done:
+                table_name = running.pop(future)
+                try:
+                    results[table_name] = future.result()
+                except Exception as e:
+                    errors[table_name] = e
+
+    total = time.perf_counter() - start_time
+    for table_name, r in results.items():
+        if not r.get("skipped"):
+            logging.info(f"Load summary | {table_name}: {r['rows']} rows in {r['seconds']: .2f} sec")
+    loaded = sum(1 for r in results.values() if not r.get("skipped"))
+    logging.info(f"Loaded {loaded} tables in {total: .2f} sec (max_workers={max_workers})")
+
+    if errors:
+        error = next(iter(errors.values()))
+        raise RuntimeError(f"Failed to load {sorted(errors)}") from error
+    return results
@@ -0,0 +1,21 @@
+from collections import namedtuple
+
+# A load target: the load functions (with load_to_biquery's and
+# load_staged_to_biquery's signatures), the shared client they use and the
+# MAX(id) lookup used to reconcile local id watermarks.
+Sink = namedtuple("Sink", ["load_frame", "load_staged", "get_client", "get_max_id"])
+
+def get_sink(target) -> Sink:
+    """
+    Sink for a target name. Backends are imported only when selected, so
+    neither google.cloud.bigquery nor duckdb is needed unless used.
+    """
+    if target == "bigquery":
+        from load import load_to_bq
+        return Sink(load_to_bq.load_to_biquery, load_to_bq.load_staged_to_biquery, load_to_bq.get_client, load_to_bq.get_max_id)
+    if target == "duckdb":
+        from load import duckdb_sink
+        return Sink(duckdb_sink.load_to_duckdb, duckdb_sink.load_staged_to_duckdb, duckdb_sink.get_connection, duckdb_sink.get_max_id)
+    raise ValueError(f"Unknown load target {target!r}, expected one of {sorted(SINKS)}")
+
+SINKS = {"bigquery", "duckdb"}
@@ -0,0 +1,99 @@
+import glob
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from extract import config
+from extract.schema import fields
+
+# BigQuery field type -> Arrow type
+ARROW_TYPES = {
+    "INTEGER": pa.int64(),
+    "FLOAT": pa.float64(),
+    "STRING": pa.string(),
+    "DATE": pa.date32(),
+    "BOOLEAN": pa.bool_(),
+}
+
+def arrow_schema(table_name) -> pa.Schema:
+    """
+    Arrow schema for a table, derived from its BigQuery schema in extract/schema.py.
+    """
+    return pa.schema([
+        pa.field(field.name, ARROW_TYPES[field.field_type], nullable = field.mode != "REQUIRED")
+        for field in fields[table_name]
+    ])
+
+def to_arrow(df, table_name) -> pa.Table:
+    """
+    Convert a generated DataFrame to an Arrow table with the table's schema.
+
+    Columns are converted one at a time and cast to the schema type, so
+    date objects, timestamps, categoricals, compact integers and integer
+    prices all end up as the types BigQuery expects (DATE, STRING, FLOAT, ...).
+    """
+    schema = arrow_schema(table_name)
+    columns = []
+    for field in schema:
+        values = df[field.name]
+        if values.dtype == np.float32:
+            # float32 amounts are widened back to the cents they were generated with
+            values = values.astype(np.float64).round(config.AMOUNT_DECIMALS)
+        column = pa.array(values, from_pandas = True)
+        if pa.types.is_dictionary(column.type):
+            column = column.dictionary_decode()
+        if not column.type.equals(field.type):
+            column = column.cast(field.type, safe = not pa.types.is_timestamp(column.type))
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema = schema)
+
+def stage_path(table_name, run_id, part = 0, staging_dir = config.STAGING_DIR) -> str:
+    """
+    Path of one staged Parquet part: <staging_dir>/<run_id>/<table_name>/part-00000.parquet
+    """
+    return os.path.join(staging_dir, run_id, table_name, f"part-{part:05d}.parquet")
+
+def write_staged(df, table_name, run_id, part = 0, staging_dir = config.STAGING_DIR, compression = config.STAGE_COMPRESSION) -> str:
+    """
+    Write a generated table (or one chunk of it) to a compressed Parquet part.
+
+    Each run stages its tables under its own run_id, and streaming runs write one
+    part per chunk, so a load can be retried from the files without
+    regenerating any data.
+
+    Returns:
+        str: Path of the written file.
+    """
+    path = stage_path(table_name, run_id, part, staging_dir)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    # Write next to the final path first so a crash never leaves a partial part behind
+    tmp_path = f"{path}.tmp"
+    pq.write_table(to_arrow(df, table_name), tmp_path, compression = compression)
+    os.replace(tmp_path, path)
+    return path
+
+def staged_files(table_name, run_id, staging_dir = config.STAGING_DIR) -> list:
+    """
+    All staged Parquet parts of a table for a run, in part order.
+    """
+    return sorted(glob.glob(os.path.join(staging_dir, run_id, table_name, "part-*.parquet")))
+
+def staged_tables(run_id, staging_dir = config.STAGING_DIR) -> dict:
+    """
+    Staged Parquet parts of every table of a run, keyed by table name.
+    """
+    run_dir = os.path.join(staging_dir, run_id)
+    if not os.path.isdir(run_dir):
+        raise FileNotFoundError(f"No staged run {run_id!r} in {staging_dir}")
+    return {
+        table_name: staged_files(table_name, run_id, staging_dir)
+        for table_name in sorted(os.listdir(run_dir))
+        if table_name in fields
+    }
+
+def staged_row_count(paths) -> int:
+    """
+    Total rows in staged Parquet parts, read from the file footers only.
+    """
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in paths)
@@ -0,0 +1,166 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+metrics_logger = logging.getLogger("dataflowiq.metrics")
+
+# Marks the end of an iterator in RunMetrics.iterate
+_DONE = object()
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MB (None where the
+    platform does not report it).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+class RunMetrics:
+    """
+    Collects wall time, CPU time, peak RSS and row counts for the stages of one run.
+
+    Every finished stage is logged as a JSON line on the "dataflowiq.metrics"
+    logger; summary() and log_summary() report the whole run.
+
+    CPU time and peak RSS are those of the current process, so work done in
+    worker processes (main_streaming with workers > 1) only shows up as wall time.
+
+    Args:
+        run_id (str): Identifier of the run, added to every record.
+        profile (iterable, optional): Stage names to run under cProfile, or "all".
+        profile_dir (str): Where .prof files of profiled stages are written.
+    """
+
+    def __init__(self, run_id, profile = None, profile_dir = "profiles"):
+        self.run_id = run_id
+        self.profile = set(profile or [])
+        self.profile_dir = profile_dir
+        self.records = []
+        self.start_time = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def _profiled(self, name):
+        return "all" in self.profile or name in self.profile
+
+    @contextmanager
+    def stage(self, name, rows = None):
+        """
+        Measure the code inside the with block as one stage.
+
+        Yields a dict; set its "rows" item to the rows the stage produced.
+
+        Example:
+            with metrics.stage("customers") as m:
+                customers = generate_customers(n)
+                m["rows"] = len(customers)
+        """
+        record = {"run_id": self.run_id, "stage": name, "rows": rows}
+        profiler = cProfile.Profile() if self._profiled(name) else None
+
+        start_time, start_cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - start_time
+            record.update({
+                "wall_s": round(wall, 4),
+                "cpu_s": round(time.process_time() - start_cpu, 4),
+                "peak_rss_mb": round(peak_rss_mb(), 1) if resource else None,
+                "rows_per_s": round(record["rows"] / wall) if record["rows"] and wall > 0 else None,
+            })
+            if profiler:
+                record["profile"] = self._save_profile(name, profiler)
+            if not record.pop("discard", False):
+                self.records.append(record)
+                metrics_logger.info(json.dumps(record))
+
+    def track(self, name, rows = len):
+        """
+        Decorator form of stage(): rows(result) gives the rows produced.
+        """
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as record:
+                    result = fn(*args, **kwargs)
+                    record["rows"] = rows(result) if rows else None
+                return result
+            return wrapper
+        return decorator
+
+    def iterate(self, name, iterable, rows = len):
+        """
+        Yield the items of iterable, measuring the production of each one as a
+        stage, e.g. every chunk of a streaming run.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as record:
+                item = next(iterator, _DONE)
+                if item is _DONE:
+                    record["discard"] = True
+                else:
+                    record["rows"] = rows(item) if rows else None
+            if item is _DONE:
+                return
+            yield item
+
+    def _save_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok = True)
+        path = os.path.join(self.profile_dir, f"{self.run_id}_{name}.prof")
+        profiler.dump_stats(path)
+
+        out = io.StringIO()
+        pstats.Stats(profiler, stream = out).sort_stats("cumulative").print_stats(15)
+        metrics_logger.info(f"Profile of stage {name} (saved to {path}):\n{out.getvalue()}")
+        return path
+
+    def summary(self) -> dict:
+        """
+        Totals of the run and every stage record.
+        """
+        return {
+            "run_id": self.run_id,
+            "wall_s": round(time.perf_counter() - self.start_time, 4),
+            "cpu_s": round(time.process_time() - self.start_cpu, 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1) if resource else None,
+            "stages": self.records,
+        }
+
+    def log_summary(self, path = None) -> dict:
+        """
+        Log the run summary as a table and a JSON line, and write it to path if given.
+        """
+        summary = self.summary()
+        lines = [f"{'stage':<24} {'rows':>10} {'wall s':>9} {'cpu s':>9} {'rows/s':>11} {'peak RSS MB':>12}"]
+        for r in self.records:
+            lines.append(
+                f"{r['stage']:<24} {r['rows'] if r['rows'] is not None else '-':>10} {r['wall_s']:>9.2f} {r['cpu_s']:>9.2f} "
+                f"{r['rows_per_s'] if r['rows_per_s'] is not None else '-':>11} {r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-':>12}"
+            )
+        lines.append(f"{'total':<24} {'':>10} {summary['wall_s']:>9.2f} {summary['cpu_s']:>9.2f}")
+        metrics_logger.info("Run summary %s:\n%s", self.run_id, "\n".join(lines))
+        metrics_logger.info(json.dumps({key: value for key, value in summary.items() if key != "stages"} | {"stage": "run"}))
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+            with open(path, "w") as f:
+                json.dump(summary, f, indent = 2)
+        return summary
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse = True)
+def workdir(tmp_path, monkeypatch):
+    # Keep the local state, staging and warehouse files written by the pipeline out of the repository
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,106 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+pytest.importorskip("google.cloud.bigquery")
+
+from extract import config
+from extract.data_generation import generate_plans
+from extract.schema import layouts
+from load import load_to_bq
+from load.fake_bigquery import FakeClient
+
+TABLE_PREFIX = "saas-pipeline.raw_src."
+
+
+@pytest.fixture(autouse = True)
+def fresh_provisioning(monkeypatch):
+    # ensure_table remembers tables per client id, which a new FakeClient may reuse
+    monkeypatch.setattr(load_to_bq, "_provisioned", set())
+
+
+def make_frame(n):
+    return pd.DataFrame({"customer_id": range(1, n + 1), "customer_name": [f"Customer {i}" for i in range(n)]})
+
+
+@pytest.mark.parametrize("table_name", ["invoices", "payments"])
+def test_ensure_table_creates_the_declared_layout(table_name):
+    client = FakeClient()
+    load_to_bq.ensure_table(client, table_name)
+
+    table = client.definitions[TABLE_PREFIX + table_name]
+    layout = layouts[table_name]
+    assert table.time_partitioning.type_ == "MONTH"
+    assert table.time_partitioning.field == layout.partition_field
+    assert table.clustering_fields == layout.clustering_fields
+
+
+def test_load_jobs_leave_the_layout_to_the_table():
+    job_config = load_to_bq.load_job_config("invoices", "WRITE_APPEND")
+    assert job_config.time_partitioning is None
+    assert job_config.clustering_fields is None
+
+
+def test_large_frame_is_split_into_several_load_jobs(monkeypatch):
+    df = make_frame(1000)
+    monkeypatch.setattr(config, "LOAD_BATCH_BYTES", int(df.memory_usage(deep = True).sum()) // 4 + 1)
+    client = FakeClient()
+
+    rows = load_to_bq.load_to_biquery(df, "customers", client = client)
+
+    jobs = [load for load in client.loads if load[0] == TABLE_PREFIX + "customers"]
+    assert rows == 1000
+    assert len(jobs) >= 4
+    assert sum(job_rows for _, job_rows, _ in jobs) == 1000
+    assert {disposition for _, _, disposition in jobs} == {"WRITE_APPEND"}
+
+
+def test_large_staged_file_is_split_into_several_load_jobs(monkeypatch, tmp_path):
+    path = str(tmp_path / "part-00001.parquet")
+    pq.write_table(pa.Table.from_pandas(make_frame(5000), preserve_index = False), path)
+    monkeypatch.setattr(config, "LOAD_BATCH_BYTES", (tmp_path / "part-00001.parquet").stat().st_size // 3)
+    client = FakeClient()
+
+    rows = load_to_bq.load_staged_to_biquery([path], "customers", client = client)
+
+    assert rows == 5000
+    assert len(client.loads) >= 3
+    assert sum(len(df) for df in client.tables[TABLE_PREFIX + "customers"]) == 5000
+
+
+def test_unchanged_static_table_is_skipped():
+    client = FakeClient()
+    plans = generate_plans()
+
+    assert load_to_bq.load_to_biquery(plans, "plans", client = client) == len(plans)
+    assert load_to_bq.load_to_biquery(generate_plans(), "plans", client = client) == 0
+    assert len(client.loads) == 1
+
+
+def test_changed_static_table_replaces_the_loaded_one():
+    client = FakeClient()
+    plans = generate_plans()
+    load_to_bq.load_to_biquery(plans, "plans", client = client)
+
+    changed = plans.copy()
+    changed["plan_price"] = changed.plan_price * 2
+    assert load_to_bq.load_to_biquery(changed, "plans", client = client) == len(plans)
+
+    assert client.loads[-1] == (TABLE_PREFIX + "plans", len(plans), "WRITE_TRUNCATE")
+    loaded = client.tables[TABLE_PREFIX + "plans"]
+    assert len(loaded) == 1
+    assert loaded[0].plan_price.tolist() == changed.plan_price.tolist()
+
+
+def test_dynamic_tables_are_appended():
+    assert load_to_bq.choose_write_disposition("invoices", TABLE_PREFIX + "invoices") == "WRITE_APPEND"
+
+
+def test_fake_client_only_answers_max_id_queries():
+    client = FakeClient()
+    client.load_table_from_dataframe(make_frame(3), TABLE_PREFIX + "customers")
+
+    assert load_to_bq.get_max_id(client, "customers") == 3
+    with pytest.raises(NotImplementedError):
+        client.query(f"SELECT COUNT(*) AS cnt FROM `{TABLE_PREFIX}customers`")
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+from extract.data_generation import (
+    generate_customers,
+    generate_discounts,
+    generate_payments_invoice,
+    generate_plans,
+    generate_subscription_discounts,
+    generate_subscriptions,
+)
+from extract.incremental import empty_state, run_daily
+from load.id_allocator import IdAllocator
+from transform.mrr import MOVEMENTS, compute_mrr, finalize
+from transform.mrr_store import KEYS, empty_store, fold_batch, load_store, save_store
+
+
+def full_recompute(batches, plans, discounts, through):
+    """
+    compute_mrr over every batch folded so far; later versions of a row replace earlier ones.
+    """
+    tables = {table_name: pd.concat([batch[table_name] for batch in batches], ignore_index = True) for table_name in batches[0]}
+    subscriptions = tables["subscriptions"].drop_duplicates("subscription_id", keep = "last")
+    subscription_discounts = tables["subscription_discounts"].drop_duplicates("sub_discount_id", keep = "last")
+    return compute_mrr(subscriptions, plans, subscription_discounts, discounts, tables["invoices"], through = through)
+
+
+def assert_same_mrr(store, expected):
+    got = finalize(store["snapshot"])
+    merged = got.merge(expected, on = KEYS, how = "outer", suffixes = ("_folded", "_full"), indicator = True)
+    assert (merged._merge == "both").all()
+    for column in MOVEMENTS + ["cmrr"]:
+        difference = (merged[f"{column}_folded"] - merged[f"{column}_full"]).abs().max()
+        assert difference < 1e-6, column
+
+
+def test_folded_chunks_match_full_recompute():
+    plans, discounts = generate_plans(), generate_discounts()
+    rng = np.random.default_rng(3)
+    store, batches = empty_store(), []
+    next_id = {"customers": 1, "subscriptions": 1, "subscription_discounts": 1, "invoices": 1, "payments": 1, "line_items": 1}
+    for _ in range(3):
+        customers = generate_customers(150, start_id = next_id["customers"], rng = rng)
+        subscriptions = generate_subscriptions(customers, plans, start_id = next_id["subscriptions"], rng = rng)
+        subscription_discounts = generate_subscription_discounts(subscriptions, plans, discounts, start_id = next_id["subscription_discounts"], rng = rng)
+        invoices, line_items, payments = generate_payments_invoice(
+            subscriptions, plans, discounts, subscription_discounts,
+            next_id["invoices"], next_id["payments"], next_id["line_items"], rng = rng,
+        )
+        batch = {"subscriptions": subscriptions, "subscription_discounts": subscription_discounts, "invoices": invoices}
+        for table_name, df in [("customers", customers), ("payments", payments), ("line_items", line_items), *batch.items()]:
+            next_id[table_name] += len(df)
+
+        fold_batch(store, plans, discounts, subscriptions, subscription_discounts, invoices)
+        batches.append(batch)
+        # The pipeline saves the store after every run and reads it back in the next one
+        save_store(store)
+        store = load_store()
+
+    assert_same_mrr(store, full_recompute(batches, plans, discounts, np.datetime64(store["through"], "M")))
+
+
+def test_folded_daily_runs_match_full_recompute():
+    plans, discounts = generate_plans(), generate_discounts()
+    id_allocator = IdAllocator(path = None)
+    state, store, batches = empty_state(), empty_store(), []
+    # Daily runs also change subscriptions of earlier runs (cancellations, plan changes), and close a month now and then
+    run_date = date(2025, 1, 1)
+    while run_date < date(2025, 5, 1):
+        frames = run_daily(state, run_date, plans, discounts, id_allocator, signups = 20)
+        batch = {table_name: frames[table_name] for table_name in ("subscriptions", "subscription_discounts", "invoices")}
+        fold_batch(store, plans, discounts, *batch.values(), through = np.datetime64(run_date, "M") - 1)
+        batches.append(batch)
+        run_date += timedelta(days = 30)
+
+    assert store["through"] is not None
+    assert_same_mrr(store, full_recompute(batches, plans, discounts, np.datetime64(store["through"], "M")))
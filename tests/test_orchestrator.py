@@ -0,0 +1,93 @@
+import threading
+import time
+import pandas as pd
+import pytest
+
+pytest.importorskip("google.cloud.bigquery")
+
+from load.fake_bigquery import FakeClient
+from load.load_to_bq import load_to_biquery
+from load.orchestrator import load_tables
+
+TABLE_PREFIX = "saas-pipeline.raw_src."
+
+
+class FailingClient(FakeClient):
+    """
+    FakeClient whose load jobs into one table fail.
+    """
+
+    def __init__(self, failing_table, **kwargs):
+        super().__init__(**kwargs)
+        self.failing_table = failing_table
+
+    def load_table_from_dataframe(self, df, table_id, job_config = None):
+        if table_id == TABLE_PREFIX + self.failing_table:
+            raise RuntimeError(f"load into {table_id} failed")
+        return super().load_table_from_dataframe(df, table_id, job_config)
+
+
+def make_frames():
+    return {
+        "customers": pd.DataFrame({"customer_id": [1, 2, 3]}),
+        "subscriptions": pd.DataFrame({"subscription_id": [10, 11], "customer_id": [1, 2]}),
+        "invoices": pd.DataFrame({"invoice_id": [100, 101, 102, 103], "subscription_id": [10, 10, 11, 11]}),
+    }
+
+
+def loaded_tables(client):
+    return [table_id[len(TABLE_PREFIX):] for table_id, _, _ in client.loads]
+
+
+def test_loads_every_table():
+    client = FakeClient()
+    results = load_tables(make_frames(), client = client)
+
+    assert {table_name: r["rows"] for table_name, r in results.items()} == {"customers": 3, "subscriptions": 2, "invoices": 4}
+    assert sorted(loaded_tables(client)) == ["customers", "invoices", "subscriptions"]
+
+
+def test_independent_tables_load_in_parallel():
+    frames = make_frames()
+    # Every load waits until all of them are running; serial loads would break the barrier
+    barrier = threading.Barrier(len(frames), timeout = 5)
+
+    def load_fn(df, table_name, project_id, dataset, client = None):
+        barrier.wait()
+        return load_to_biquery(df, table_name, project_id, dataset, client = client)
+
+    results = load_tables(frames, client = FakeClient(), max_workers = len(frames), load_fn = load_fn)
+    assert all(not r.get("skipped") for r in results.values())
+
+
+def test_dependent_table_loads_after_its_dependency():
+    started = {}
+
+    def load_fn(df, table_name, project_id, dataset, client = None):
+        started[table_name] = time.perf_counter()
+        if table_name == "subscriptions":
+            # Slow dependency: without the dependency edge invoices would load first
+            time.sleep(0.2)
+        return load_to_biquery(df, table_name, project_id, dataset, client = client)
+
+    client = FakeClient()
+    load_tables(make_frames(), client = client, max_workers = 3, depends_on = {"invoices": ["subscriptions"]}, load_fn = load_fn)
+
+    order = loaded_tables(client)
+    assert order.index("subscriptions") < order.index("invoices")
+    assert started["invoices"] >= started["subscriptions"] + 0.2
+
+
+def test_failed_load_raises_and_skips_dependents():
+    client = FailingClient("subscriptions")
+    with pytest.raises(RuntimeError, match = "subscriptions") as excinfo:
+        load_tables(make_frames(), client = client, depends_on = {"invoices": ["subscriptions"]})
+
+    # The original error is chained, the independent table still loaded and the dependent one never started
+    assert "load into" in str(excinfo.value.__cause__)
+    assert loaded_tables(client) == ["customers"]
+
+
+def test_circular_dependencies_are_rejected():
+    with pytest.raises(ValueError, match = "Circular"):
+        load_tables(make_frames(), client = FakeClient(), depends_on = {"invoices": ["subscriptions"], "subscriptions": ["invoices"]})
@@ -0,0 +1,100 @@
+import glob
+import os
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+
+from extract import config, main
+from load import duckdb_sink
+from load.id_allocator import IdAllocator
+from load.manifest import RunManifest
+
+
+@pytest.fixture
+def warehouse(monkeypatch):
+    # A fresh DuckDB file in the test directory instead of the shared connection
+    monkeypatch.setattr(duckdb_sink, "_connection", None)
+    yield duckdb_sink.get_connection
+    if duckdb_sink._connection is not None:
+        duckdb_sink._connection.close()
+
+
+def fail_loads(monkeypatch, table_name, part = None):
+    """
+    Make loads of table_name (only of its part number part, if given) fail.
+    """
+    load_staged = duckdb_sink.load_staged_to_duckdb
+
+    def failing(paths, name, *args, **kwargs):
+        if name == table_name and (part is None or any(f"part-{part:05d}" in path for path in paths)):
+            raise RuntimeError(f"load into {name} failed")
+        return load_staged(paths, name, *args, **kwargs)
+
+    monkeypatch.setattr(duckdb_sink, "load_staged_to_duckdb", failing)
+
+
+def failed_run_id():
+    (run_dir,) = glob.glob(os.path.join(config.STAGING_DIR, "*"))
+    return os.path.basename(run_dir)
+
+
+def watermarks():
+    id_allocator = IdAllocator()
+    try:
+        return id_allocator.watermarks()
+    finally:
+        id_allocator.close()
+
+
+def assert_loaded_once(connection, manifest):
+    """
+    Every staged row is in the warehouse exactly once.
+    """
+    assert manifest.data["status"] == "complete"
+    assert manifest.pending() == {}
+    for table_name, paths in manifest.staged.items():
+        staged = sum(len(pd.read_parquet(path)) for path in paths)
+        key = config.UNIQUE_KEYS[table_name]
+        rows, ids = connection.execute(f"SELECT COUNT(*), COUNT(DISTINCT {key}) FROM raw_src.{table_name}").fetchone()
+        assert rows == staged, table_name
+        assert ids == rows, table_name
+
+
+def test_resumed_batch_run_loads_every_row_once(warehouse, monkeypatch):
+    with monkeypatch.context() as patch:
+        fail_loads(patch, "payments")
+        with pytest.raises(RuntimeError, match = "payments"):
+            main.main(300, target = "duckdb")
+    run_id = failed_run_id()
+    manifest = RunManifest.load(run_id)
+    assert manifest.data["status"] != "complete"
+    assert list(manifest.pending()) == ["payments"]
+    before = watermarks()
+
+    main.resume_run(run_id)
+
+    assert_loaded_once(warehouse(), RunManifest.load(run_id))
+    # Resuming only loads the staged parts, so no ids are reserved again
+    assert watermarks() == before
+
+
+def test_resumed_streaming_run_loads_every_row_once(warehouse, monkeypatch):
+    # Chunk 2 of 3 fails halfway through its load: chunk 1 and some chunk 2 tables are already in
+    with monkeypatch.context() as patch:
+        fail_loads(patch, "payments", part = 2)
+        with pytest.raises(RuntimeError, match = "payments"):
+            main.main_streaming(300, chunk_size = 100, workers = 1, target = "duckdb")
+    run_id = failed_run_id()
+    before = watermarks()
+
+    main.resume_run(run_id)
+
+    connection = warehouse()
+    assert_loaded_once(connection, RunManifest.load(run_id))
+    # Chunk 2 keeps the ids it was given, and chunk 3 continues right after them
+    after = watermarks()
+    for table_name in config.DYNAMIC_TABLES:
+        key = config.UNIQUE_KEYS[table_name]
+        assert after[table_name] >= before[table_name]
+        assert connection.execute(f"SELECT MAX({key}) FROM raw_src.{table_name}").fetchone()[0] == after[table_name]
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from extract.data_generation import (
+    generate_customers,
+    generate_discounts,
+    generate_payments_invoice,
+    generate_plans,
+    generate_subscription_discounts,
+    generate_subscriptions,
+)
+from extract.validation import IntegrityError, assert_valid
+
+
+@pytest.fixture
+def dataset():
+    plans, discounts = generate_plans(), generate_discounts()
+    rng = np.random.default_rng(1)
+    customers = generate_customers(200, rng = rng)
+    subscriptions = generate_subscriptions(customers, plans, rng = rng)
+    subscription_discounts = generate_subscription_discounts(subscriptions, plans, discounts, rng = rng)
+    invoices, line_items, payments = generate_payments_invoice(subscriptions, plans, discounts, subscription_discounts, rng = rng)
+    frames = {
+        "customers": customers,
+        "subscriptions": subscriptions,
+        "subscription_discounts": subscription_discounts,
+        "invoices": invoices,
+        "line_items": line_items,
+        "payments": payments,
+    }
+    return frames, {"plans": plans, "discounts": discounts}
+
+
+def assert_rejected(frames, reference, problem):
+    with pytest.raises(IntegrityError) as excinfo:
+        assert_valid(frames, reference)
+    assert any(problem in p for p in excinfo.value.problems), excinfo.value.problems
+
+
+def test_generated_dataset_is_valid(dataset):
+    frames, reference = dataset
+    assert_valid(frames, reference)
+
+
+def test_duplicate_primary_key_is_rejected(dataset):
+    frames, reference = dataset
+    subscriptions = frames["subscriptions"]
+    frames["subscriptions"] = pd.concat([subscriptions, subscriptions.iloc[:1]], ignore_index = True)
+
+    assert_rejected(frames, reference, "subscriptions.subscription_id: 1 duplicated keys")
+
+
+def test_dangling_foreign_key_is_rejected(dataset):
+    frames, reference = dataset
+    invoices = frames["invoices"].copy()
+    invoices.loc[0, "subscription_id"] = frames["subscriptions"].subscription_id.max() + 1
+    frames["invoices"] = invoices
+
+    assert_rejected(frames, reference, "invoices.subscription_id: 1 rows reference missing subscriptions")
+
+
+def test_payment_before_its_invoice_is_rejected(dataset):
+    frames, reference = dataset
+    invoices, payments = frames["invoices"], frames["payments"].copy()
+    invoice_date = invoices.set_index("invoice_id").invoice_date
+    payments.loc[0, "payment_date"] = invoice_date[payments.invoice_id[0]] - pd.Timedelta(days = 1)
+    frames["payments"] = payments
+
+    assert_rejected(frames, reference, "payments.payment_date before invoice_date: 1 rows out of order")
+
+
+def test_invoice_total_mismatch_is_rejected(dataset):
+    frames, reference = dataset
+    invoices = frames["invoices"].copy()
+    invoices.loc[0, "total_due"] += 1
+    frames["invoices"] = invoices
+
+    assert_rejected(frames, reference, "invoices.total_due: 1 invoices differ")
@@ -0,0 +1,303 @@
+"""
+Committed MRR (CMRR) engine.
+
+Implements contracted_mrr/committed_mrr_description.md:
+
+    CMRR = Beginning of the month Net MRR + New MRR + Expansion MRR - Contraction MRR - Churn MRR
+
+with the definitions agreed in contracted_mrr/stakeholder_alignment.md:
+- a subscription counts from its first invoice (contracts that have not
+  started billing are excluded) until its end date,
+- MRR is the value at the month-end snapshot, without proration,
+- yearly plans are normalized to a monthly amount,
+- recurring discounts active at month end are applied; one-off discounts are not.
+
+Movements are classified per customer and product between consecutive month
+ends: New (no MRR last month), Churn (no MRR this month), Expansion or
+Contraction (MRR went up or down, e.g. an upgrade or a downgrade). Each
+movement is attributed to the customer's plan at month end (the plan they
+left, for churn), so per product, per month and overall the starting MRR
+equals the previous month's CMRR.
+
+Usage:
+    python -m transform.mrr RUN_ID
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from extract.config import END_DATE, MRR_CHUNK_CUSTOMERS, MRR_CHUNK_ROWS
+from extract.catalog import get_catalog
+from extract.data_generation import build_discount_index, to_day_array
+
+MOVEMENTS = ["starting_mrr", "new_mrr", "expansion_mrr", "contraction_mrr", "churn_mrr"]
+REPORT_COLUMNS = ["month", "product_id", "plan_id"] + MOVEMENTS + ["net_new_mrr", "cmrr"]
+
+def iter_frames(frames, chunk_rows = MRR_CHUNK_ROWS):
+    """
+    Yield a table in chunks of at most chunk_rows rows. frames is a DataFrame
+    or an iterable of DataFrames (e.g. staged Parquet parts read one at a time).
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    for df in frames:
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+
+def first_invoice_dates(invoices, chunk_rows = MRR_CHUNK_ROWS) -> pd.Series:
+    """
+    Date of the first invoice of every subscription, aggregated chunk by chunk
+    so only one chunk of invoices and one date per subscription are in memory.
+
+    Returns:
+        pd.Series: datetime64 first invoice date, indexed by subscription_id.
+    """
+    first = None
+    for chunk in iter_frames(invoices, chunk_rows):
+        partial = pd.Series(chunk.invoice_date.to_numpy(dtype="datetime64[D]"), index=chunk.subscription_id.to_numpy())
+        partial = partial.groupby(level=0).min()
+        first = partial if first is None else pd.concat([first, partial]).groupby(level=0).min()
+    return first if first is not None else pd.Series(dtype="datetime64[s]")
+
+def month_end(months) -> np.ndarray:
+    """
+    Last day of each datetime64[M] month.
+    """
+    return (months + 1).astype("datetime64[D]") - np.timedelta64(1, "D")
+
+def subscription_months(subscriptions, plans, billing_start, through) -> pd.DataFrame:
+    """
+    One row per subscription and month end at which it is active, with its
+    undiscounted monthly price.
+
+    A subscription is active at a month end when it has started billing by
+    then and has not ended yet.
+    """
+    catalog = get_catalog(plans)
+    plan_id = subscriptions.plan_id.to_numpy(dtype=np.int64)
+    start = billing_start.reindex(subscriptions.subscription_id).to_numpy(dtype="datetime64[D]")
+    end = to_day_array(subscriptions.end_date)
+
+    first_month = start.astype("datetime64[M]")
+    # Active at the end of month m while month_end(m) < end, i.e. up to the month before end
+    last_month = np.where(np.isnat(end), through, np.minimum(end.astype("datetime64[M]").astype(np.int64) - 1, through))
+    n_months = np.where(np.isnat(start), 0, np.maximum(last_month - first_month.astype(np.int64) + 1, 0))
+
+    rows = np.repeat(np.arange(len(subscriptions)), n_months)
+    offset = np.arange(len(rows)) - np.repeat(np.cumsum(n_months) - n_months, n_months)
+
+    # Yearly plans are normalized to a month
+    cycle_factor = np.where(catalog.plan_is_yearly[plan_id], 1 / 12, 1.0)
+    return pd.DataFrame({
+        "subscription_id": subscriptions.subscription_id.to_numpy()[rows],
+        "customer_id": subscriptions.customer_id.to_numpy()[rows],
+        "product_id": catalog.plan_product[plan_id][rows],
+        "plan_id": plan_id[rows],
+        # Months are kept as month numbers (months since 1970-01) until finalize()
+        "month": first_month.astype(np.int64)[rows] + offset,
+        "cycle_factor": cycle_factor[rows],
+        "mrr": (catalog.plan_price[plan_id] * cycle_factor)[rows],
+    })
+
+def apply_recurring_discounts(months, discount_index) -> np.ndarray:
+    """
+    MRR of each subscription month after the recurring discounts active at
+    month end: a percentage of the plan price, or a fixed amount per billing
+    cycle (normalized to a month like the price). MRR never goes below zero.
+    """
+    recurring = discount_index[discount_index.is_recurring.to_numpy(dtype=bool)]
+    keys = recurring.subscription_id.to_numpy()
+    sub_ids = months.subscription_id.to_numpy()
+    lo = np.searchsorted(keys, sub_ids, side="left")
+    n_rules = np.searchsorted(keys, sub_ids, side="right") - lo
+
+    # Pair every subscription month with each recurring discount of its subscription
+    row = np.repeat(np.arange(len(months)), n_rules)
+    rule = np.arange(len(row)) - np.repeat(np.cumsum(n_rules) - n_rules, n_rules) + np.repeat(lo, n_rules)
+
+    snapshot = month_end(months.month.to_numpy()[row].astype("datetime64[M]"))
+    applies = (recurring.valid_from.to_numpy(dtype="datetime64[D]")[rule] <= snapshot) & (snapshot <= recurring.valid_to.to_numpy(dtype="datetime64[D]")[rule])
+    row, rule = row[applies], rule[applies]
+
+    mrr = months.mrr.to_numpy(dtype=float)
+    value = recurring.discount_value.to_numpy(dtype=float)[rule]
+    discount = np.where(
+        recurring.is_percent.to_numpy()[rule],
+        mrr[row] * value / 100,
+        value * months.cycle_factor.to_numpy()[row],
+    )
+    return np.maximum(mrr - np.bincount(row, weights=discount, minlength=len(months)), 0)
+
+def classify_movements(months) -> pd.DataFrame:
+    """
+    MRR movements per customer and product between consecutive month ends.
+
+    Returns:
+        pd.DataFrame: month, product_id, plan_id and the MOVEMENTS columns plus
+                      cmrr, one row per customer, product and month with a movement or MRR.
+    """
+    # MRR per customer, product and month end (the plan is the one held at month end)
+    current = (
+        months.groupby(["customer_id", "product_id", "month"], sort=True)
+        .agg(plan_id=("plan_id", "last"), mrr=("mrr", "sum"))
+        .reset_index()
+    )
+    current = current[current.mrr > 0].reset_index(drop=True)
+
+    # Look up the previous month end of the same customer and product in the sorted keys
+    group = current.groupby(["customer_id", "product_id"], sort=False).ngroup().to_numpy(np.int64)
+    month = current.month.to_numpy()
+    key = group * (1 << 32) + month
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+
+    def lookup(target):
+        pos = np.minimum(np.searchsorted(sorted_key, target), len(sorted_key) - 1)
+        found = sorted_key[pos] == target if len(sorted_key) else np.zeros(len(target), dtype=bool)
+        return order[pos], found
+
+    mrr = current.mrr.to_numpy()
+    prev_row, has_prev = lookup(key - 1)
+    prev = np.where(has_prev, mrr[prev_row] if len(mrr) else 0.0, 0.0)
+    active = pd.DataFrame({
+        "month": current.month.to_numpy(),
+        "product_id": current.product_id.to_numpy(),
+        "plan_id": current.plan_id.to_numpy(),
+        "starting_mrr": prev,
+        "new_mrr": np.where(prev == 0, mrr, 0.0),
+        "expansion_mrr": np.where(prev > 0, np.maximum(mrr - prev, 0), 0.0),
+        "contraction_mrr": np.where(prev > 0, np.maximum(prev - mrr, 0), 0.0),
+        "churn_mrr": 0.0,
+        "cmrr": mrr,
+    })
+
+    # Churn: MRR at one month end and none at the next
+    _, has_next = lookup(key + 1)
+    churned = current[~has_next]
+    churn = pd.DataFrame({
+        "month": churned.month.to_numpy() + 1,
+        "product_id": churned.product_id.to_numpy(),
+        "plan_id": churned.plan_id.to_numpy(),
+        "starting_mrr": churned.mrr.to_numpy(),
+        "new_mrr": 0.0,
+        "expansion_mrr": 0.0,
+        "contraction_mrr": 0.0,
+        "churn_mrr": churned.mrr.to_numpy(),
+        "cmrr": 0.0,
+    })
+    return pd.concat([active, churn], ignore_index=True)
+
+def iter_customer_chunks(subscriptions, chunk_customers = MRR_CHUNK_CUSTOMERS):
+    """
+    Yield the subscriptions of chunk_customers customers at a time, so every
+    customer's subscriptions are in the same chunk.
+    """
+    subscriptions = subscriptions.sort_values("customer_id", kind="stable")
+    customer_ids = subscriptions.customer_id.to_numpy()
+    unique_ids = np.unique(customer_ids)
+    for start in range(0, len(unique_ids), chunk_customers):
+        lo = np.searchsorted(customer_ids, unique_ids[start], side="left")
+        hi = np.searchsorted(customer_ids, unique_ids[min(start + chunk_customers, len(unique_ids)) - 1], side="right")
+        yield subscriptions.iloc[lo:hi]
+
+def compute_mrr(subscriptions, plans, subscription_discounts, discounts, invoices = None, through = None,
+                chunk_customers = MRR_CHUNK_CUSTOMERS, chunk_rows = MRR_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Monthly Committed MRR and its movements per product and plan.
+
+    Subscriptions are processed chunk_customers customers at a time and
+    invoices chunk_rows rows at a time; only the small monthly aggregates of
+    each chunk are kept, so memory stays bounded however much history there is.
+
+    Args:
+        subscriptions (pd.DataFrame): Subscriptions dataset
+        plans (pd.DataFrame): Plans dataset
+        subscription_discounts (pd.DataFrame): Subscription discounts dataset
+        discounts (pd.DataFrame): Discounts dataset
+        invoices (pd.DataFrame or iterable of pd.DataFrame, optional): Invoices, used to
+            find when each subscription started billing. Without them billing is
+            taken to start on the subscription start date.
+        through (date, optional): Last month to report (default: the last month
+            that has ended by END_DATE).
+        chunk_customers (int): Customers whose subscriptions are processed together.
+        chunk_rows (int): Invoice rows read at a time.
+
+    Returns:
+        pd.DataFrame: One row per month, product_id and plan_id with starting_mrr,
+                      new_mrr, expansion_mrr, contraction_mrr, churn_mrr, net_new_mrr and cmrr.
+    """
+    if invoices is not None:
+        billing_start = first_invoice_dates(invoices, chunk_rows)
+    else:
+        billing_start = pd.Series(to_day_array(subscriptions.start_date), index=subscriptions.subscription_id.to_numpy())
+    discount_index = build_discount_index(subscription_discounts, discounts)
+    return finalize(movement_totals(subscriptions, plans, discount_index, billing_start, report_month(through), chunk_customers = chunk_customers))
+
+def last_closed_month(as_of = END_DATE) -> np.datetime64:
+    """
+    Latest month whose month-end snapshot is on or before as_of.
+    """
+    return (np.datetime64(as_of, "D") + 1).astype("datetime64[M]") - 1
+
+def report_month(through = None) -> int:
+    """
+    Month number (months since 1970-01) of the last month to report: the month
+    of through, by default last_closed_month().
+    """
+    return int(np.datetime64(through if through is not None else last_closed_month(), "M").astype(np.int64))
+
+def movement_totals(subscriptions, plans, discount_index, billing_start, through, since = None,
+                    chunk_customers = MRR_CHUNK_CUSTOMERS) -> pd.DataFrame:
+    """
+    Sum of the MRR movements of subscriptions per month, product_id and plan_id,
+    for the months after since and up to through (month numbers, see report_month).
+
+    Returns:
+        pd.DataFrame: month (month number), product_id, plan_id, the MOVEMENTS columns and cmrr, unrounded.
+    """
+    partials = []
+    for chunk in iter_customer_chunks(subscriptions, chunk_customers):
+        months = subscription_months(chunk, plans, billing_start, through)
+        months["mrr"] = apply_recurring_discounts(months, discount_index)
+        movements = classify_movements(months)
+        in_window = (movements.month <= through) & (movements.month > (since if since is not None else -1 << 40))
+        partials.append(movements[in_window].groupby(["month", "product_id", "plan_id"]).sum().reset_index())
+
+    if not partials:
+        return pd.DataFrame({column: pd.Series(dtype=float) for column in ["month", "product_id", "plan_id"] + MOVEMENTS + ["cmrr"]})
+    return pd.concat(partials, ignore_index=True).groupby(["month", "product_id", "plan_id"]).sum().reset_index()
+
+def finalize(report) -> pd.DataFrame:
+    """
+    Add net_new_mrr, turn months into month-start dates and order the columns.
+    """
+    report = report.copy()
+    report["net_new_mrr"] = report.new_mrr + report.expansion_mrr - report.contraction_mrr - report.churn_mrr
+    report["month"] = report.month.to_numpy(dtype=np.int64).astype("datetime64[M]").astype("datetime64[s]")
+    report = report.sort_values(["month", "product_id", "plan_id"]).reset_index(drop=True)
+    return report[REPORT_COLUMNS].round({column: 2 for column in MOVEMENTS + ["net_new_mrr", "cmrr"]})
+
+def rollup(report, by = ("month",)) -> pd.DataFrame:
+    """
+    Sum an MRR report over coarser dimensions, e.g. by=("month", "product_id").
+    """
+    by = list(by)
+    return report.groupby(by)[MOVEMENTS + ["net_new_mrr", "cmrr"]].sum().reset_index()
+
+def main():
+    from load.staging import staged_files
+    import pyarrow.parquet as pq
+    from extract.data_generation import generate_plans, generate_discounts
+
+    parser = argparse.ArgumentParser(description="Compute Committed MRR from a staged run")
+    parser.add_argument("run_id", help="Staged run to read (see load/staging.py)")
+    args = parser.parse_args()
+
+    def read(table_name, columns = None):
+        return pd.concat([pq.read_table(path, columns=columns).to_pandas() for path in staged_files(table_name, args.run_id)], ignore_index=True)
+
+    invoices = (pq.read_table(path, columns=["subscription_id", "invoice_date"]).to_pandas() for path in staged_files("invoices", args.run_id))
+    report = compute_mrr(read("subscriptions"), generate_plans(), read("subscription_discounts"), generate_discounts(), invoices)
+    print(rollup(report).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Materialized monthly MRR snapshots, updated batch by batch.
+
+The store keeps the output of transform/mrr.py per month, product_id and
+plan_id, so dashboards read precomputed numbers instead of recomputing MRR
+over the whole history. Every pipeline run folds its new rows in as a delta:
+
+- MRR movements are classified per customer, so only the customers the batch
+  touches are recomputed; their old contribution is subtracted from the
+  snapshot and the new one added, which only changes the months they affect,
+- when a new month has ended since the last fold, that month is computed for
+  every customer and appended.
+
+To do this the store also keeps a compact ledger of subscriptions (with the
+date each started billing) and subscription discounts, never the invoices.
+
+Usage:
+    python -m transform.mrr_store
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+from extract.config import STATE_DIR
+from extract.data_generation import build_discount_index, to_day_array
+from transform.mrr import MOVEMENTS, first_invoice_dates, movement_totals, report_month, finalize, rollup
+
+MRR_STATE_DIR = os.path.join(STATE_DIR, "mrr")
+
+KEYS = ["month", "product_id", "plan_id"]
+VALUES = MOVEMENTS + ["cmrr"]
+
+def empty_store() -> dict:
+    """
+    Store that has not folded any batch yet.
+    """
+    return {
+        "through": None,
+        "snapshot": pd.DataFrame({column: pd.Series(dtype="int64" if column in KEYS else "float64") for column in KEYS + VALUES}),
+        "subscriptions": pd.DataFrame({
+            "subscription_id": pd.Series(dtype="int64"),
+            "customer_id": pd.Series(dtype="int64"),
+            "plan_id": pd.Series(dtype="int64"),
+            "end_date": pd.Series(dtype="datetime64[s]"),
+            "billing_start": pd.Series(dtype="datetime64[s]"),
+        }),
+        "subscription_discounts": pd.DataFrame({
+            "sub_discount_id": pd.Series(dtype="int64"),
+            "subscription_id": pd.Series(dtype="int64"),
+            "discount_id": pd.Series(dtype="int64"),
+            "applied_date": pd.Series(dtype="datetime64[s]"),
+            "expiry_date": pd.Series(dtype="datetime64[s]"),
+        }),
+    }
+
+def load_store(state_dir = MRR_STATE_DIR) -> dict:
+    """
+    Load the persisted MRR store, or an empty store before the first fold.
+    """
+    meta_path = os.path.join(state_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return empty_store()
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    store = {"through": meta["through"]}
+    for name in ["snapshot", "subscriptions", "subscription_discounts"]:
+        store[name] = pd.read_parquet(os.path.join(state_dir, f"{name}.parquet"))
+    return store
+
+def save_store(store: dict, state_dir = MRR_STATE_DIR):
+    """
+    Persist the MRR store. meta.json is written last, so an interrupted save
+    leaves the previous snapshot in effect.
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    for name in ["snapshot", "subscriptions", "subscription_discounts"]:
+        store[name].to_parquet(os.path.join(state_dir, f"{name}.parquet"), index=False)
+
+    tmp_path = os.path.join(state_dir, "meta.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"through": store["through"]}, f)
+    os.replace(tmp_path, os.path.join(state_dir, "meta.json"))
+
+def _upsert(ledger, rows, key) -> pd.DataFrame:
+    """
+    Ledger with rows added, a row replacing any earlier row with the same key.
+    """
+    if not len(rows):
+        return ledger
+    if not len(ledger):
+        return rows.drop_duplicates(key, keep="last").reset_index(drop=True)
+    return pd.concat([ledger, rows], ignore_index=True).drop_duplicates(key, keep="last").reset_index(drop=True)
+
+def _ledger_rows(subscriptions, ledger) -> pd.DataFrame:
+    """
+    Ledger rows for a batch of subscriptions, keeping the billing start already
+    recorded for subscriptions published again (e.g. when they end).
+    """
+    known = pd.Series(ledger.billing_start.to_numpy(dtype="datetime64[D]"), index=ledger.subscription_id.to_numpy())
+    return pd.DataFrame({
+        "subscription_id": subscriptions.subscription_id.to_numpy(dtype=np.int64),
+        "customer_id": subscriptions.customer_id.to_numpy(dtype=np.int64),
+        "plan_id": subscriptions.plan_id.to_numpy(dtype=np.int64),
+        "end_date": to_day_array(subscriptions.end_date).astype("datetime64[s]"),
+        "billing_start": known.reindex(subscriptions.subscription_id.to_numpy()).to_numpy(dtype="datetime64[s]"),
+    })
+
+def _discount_rows(subscription_discounts) -> pd.DataFrame:
+    return pd.DataFrame({
+        "sub_discount_id": subscription_discounts.sub_discount_id.to_numpy(dtype=np.int64),
+        "subscription_id": subscription_discounts.subscription_id.to_numpy(dtype=np.int64),
+        "discount_id": subscription_discounts.discount_id.to_numpy(dtype=np.int64),
+        "applied_date": to_day_array(subscription_discounts.applied_date).astype("datetime64[s]"),
+        "expiry_date": to_day_array(subscription_discounts.expiry_date).astype("datetime64[s]"),
+    })
+
+def _totals(ledger, ledger_discounts, plans, discounts, through, since = None, customers = None) -> pd.DataFrame:
+    """
+    movement_totals over the ledger, optionally only for the given customers.
+    """
+    if customers is not None:
+        ledger = ledger[ledger.customer_id.isin(customers)]
+        ledger_discounts = ledger_discounts[ledger_discounts.subscription_id.isin(ledger.subscription_id)]
+    billing_start = pd.Series(ledger.billing_start.to_numpy(dtype="datetime64[D]"), index=ledger.subscription_id.to_numpy())
+    discount_index = build_discount_index(ledger_discounts, discounts)
+    return movement_totals(ledger, plans, discount_index, billing_start, through, since)
+
+def fold_batch(store, plans, discounts, subscriptions = None, subscription_discounts = None, invoices = None, through = None) -> list:
+    """
+    Fold a batch of new rows into the store, in place.
+
+    subscriptions rows replace earlier rows of the same subscription_id (daily
+    runs publish a subscription again when it ends); invoices only matter for
+    the first invoice of each subscription, when it starts billing.
+
+    Args:
+        store (dict): Store from load_store / empty_store
+        plans (pd.DataFrame): Plans dataset
+        discounts (pd.DataFrame): Discounts dataset
+        subscriptions, subscription_discounts, invoices (pd.DataFrame, optional): New rows of the batch
+        through (date, optional): Last month to materialize (see transform.mrr.report_month)
+
+    Returns:
+        list: The months (as month-start dates) whose snapshot rows changed.
+    """
+    old_through = store["through"]
+    through = max(report_month(through), old_through if old_through is not None else -1)
+    ledger = store["subscriptions"]
+    ledger_discounts = store["subscription_discounts"]
+
+    # 1. New ledger: upserted subscriptions and discounts, billing start from the batch's invoices
+    changed = []
+    new_ledger = ledger
+    if subscriptions is not None and len(subscriptions):
+        new_ledger = _upsert(ledger, _ledger_rows(subscriptions, ledger), "subscription_id")
+        changed.append(subscriptions.subscription_id.to_numpy(dtype=np.int64))
+    if invoices is not None and len(invoices):
+        first = first_invoice_dates(invoices).reindex(new_ledger.subscription_id.to_numpy()).to_numpy(dtype="datetime64[D]")
+        current = new_ledger.billing_start.to_numpy(dtype="datetime64[D]")
+        billing_start = np.where(np.isnat(current) | (first < current), first, current)
+        started = billing_start != current
+        started &= ~(np.isnat(billing_start) & np.isnat(current))
+        if started.any():
+            new_ledger = new_ledger.assign(billing_start = billing_start.astype("datetime64[s]"))
+            changed.append(new_ledger.subscription_id.to_numpy()[started])
+    new_discounts = ledger_discounts
+    if subscription_discounts is not None and len(subscription_discounts):
+        new_discounts = _upsert(ledger_discounts, _discount_rows(subscription_discounts), "sub_discount_id")
+        changed.append(subscription_discounts.subscription_id.to_numpy(dtype=np.int64))
+
+    # 2. Delta of the customers the batch touches, over the months already materialized
+    deltas = []
+    if changed and old_through is not None:
+        changed_ids = np.unique(np.concatenate(changed))
+        customers = np.unique(new_ledger.customer_id.to_numpy()[np.isin(new_ledger.subscription_id.to_numpy(), changed_ids)])
+        deltas.append(_totals(new_ledger, new_discounts, plans, discounts, old_through, customers = customers))
+        old = _totals(ledger, ledger_discounts, plans, discounts, old_through, customers = customers)
+        deltas.append(old.assign(**{column: -old[column] for column in VALUES}))
+
+    # 3. Months that have ended since the last fold, for every customer
+    if old_through is None or through > old_through:
+        deltas.append(_totals(new_ledger, new_discounts, plans, discounts, through, since = old_through))
+
+    deltas = [df for df in deltas if len(df)]
+    touched = sorted(set(np.concatenate([df.month.to_numpy(dtype=np.int64) for df in deltas]))) if deltas else []
+    if deltas:
+        snapshot = pd.concat([store["snapshot"]] + deltas, ignore_index=True).astype({column: "int64" for column in KEYS})
+        snapshot = snapshot.groupby(KEYS, sort=True).sum().reset_index()
+        # Rows whose movements all cancelled out, e.g. a customer moved to another plan
+        snapshot = snapshot[(snapshot[VALUES].abs() > 1e-6).any(axis=1)].reset_index(drop=True)
+        store["snapshot"] = snapshot
+
+    store["subscriptions"] = new_ledger
+    store["subscription_discounts"] = new_discounts
+    store["through"] = int(through)
+    return list(np.array(touched, dtype=np.int64).astype("datetime64[M]").astype("datetime64[D]").tolist())
+
+def read_snapshot(state_dir = MRR_STATE_DIR) -> pd.DataFrame:
+    """
+    The materialized MRR report, in the format of transform.mrr.compute_mrr.
+    """
+    return finalize(load_store(state_dir)["snapshot"])
+
+def main():
+    print(rollup(read_snapshot()).to_string(index=False))
+
+if __name__ == "__main__":
+    main()